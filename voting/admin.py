@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.http import HttpResponseRedirect
-from .models import Person, Category, VotingCode, Vote, VoteStatistics
+from . import code_lookup
+from .models import Person, Category, VotingCode, Vote, VoteStatistics, OutboxEmail
 
 
 @admin.register(Person)
@@ -41,10 +42,7 @@ class VotingCodeAdmin(admin.ModelAdmin):
     def generate_codes(self, request, queryset):
         """Generate new voting codes"""
         count = 10  # Generate 10 codes at once
-        codes = []
-        for _ in range(count):
-            code = VotingCode.generate_code(request.user)
-            codes.append(code.code)
+        codes = [code.code for code in VotingCode.generate_codes_bulk(count, request.user)]
         
         codes_list = ', '.join(codes)
         self.message_user(request, f'{count} neue Voting-Codes wurden generiert: {codes_list}')
@@ -53,6 +51,7 @@ class VotingCodeAdmin(admin.ModelAdmin):
     def deactivate_codes(self, request, queryset):
         """Deactivate selected codes"""
         count = queryset.update(is_active=False)
+        code_lookup.invalidate()
         self.message_user(request, f'{count} Codes wurden deaktiviert.')
     deactivate_codes.short_description = "Ausgewählte Codes deaktivieren"
 
@@ -91,6 +90,26 @@ class VoteStatisticsAdmin(admin.ModelAdmin):
         return request.user.is_superuser
 
 
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ['email', 'voting_code', 'status', 'attempts', 'sent_at', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['email', 'voting_code__code', 'job_id']
+    readonly_fields = ['job_id', 'voting_code', 'email', 'subject', 'template_name', 'template_variables',
+                       'attempts', 'last_error', 'claim_token', 'claimed_at', 'sent_at', 'created_at']
+    actions = ['retry_emails']
+
+    def has_add_permission(self, request):
+        return False
+
+    def retry_emails(self, request, queryset):
+        count = queryset.filter(status=OutboxEmail.FAILED).update(
+            status=OutboxEmail.PENDING, attempts=0, last_error=''
+        )
+        self.message_user(request, f'{count} E-Mails werden erneut versendet.')
+    retry_emails.short_description = "Fehlgeschlagene E-Mails erneut senden"
+
+
 # Custom admin site configuration
 admin.site.site_header = "Klassenabstimmung Admin"
 admin.site.site_title = "Klassenabstimmung"
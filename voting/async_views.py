@@ -0,0 +1,84 @@
+"""
+Async-native versions of the hot endpoints, for ASGI servers.
+
+With VOTING_ASYNC_VIEWS = True the vote wizard (including the code check),
+the single-page ballot submit and the live total are served from here instead
+of views.py. Lookups go through Django's async ORM, so an idle or waiting
+voter holds a coroutine instead of a thread from the sync_to_async pool.
+Only the ballot commit still runs in a thread: the async ORM has no
+transactions (see VotingSession.acomplete_voting).
+
+The wizard and the ballot endpoint run the same flows as views.py
+(vote_flow, submit_ballot_flow); only the I/O they ask for is done here.
+"""
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_POST
+
+from .catalog import aget_catalog
+from .code_lookup import Throttled, aget_active_code
+from .drafts import get_storage as get_draft_storage, keep_draft_cookie
+from .live import shared_total as live_shared_total
+from .models import VotingCode, VotingSession
+from .views import BALLOT_OPERATIONS, get_client_ip, submit_ballot_flow, vote_flow
+
+
+def vote_operations(request):
+    """views.vote_operations() with the async ORM; every operation returns an awaitable."""
+    ip_address = get_client_ip(request)
+    operations = {
+        'lookup_code': lambda code: aget_active_code(code, ip_address),
+        'catalog': aget_catalog,
+        'has_voted': lambda voting_code: (
+            VotingSession.objects.filter(voting_code=voting_code, is_completed=True).aexists()
+        ),
+        'load_draft': lambda voting_code: get_draft_storage().aload(request, voting_code, ip_address),
+        'submit_ballot': lambda voting_code, votes: VotingSession.asubmit_ballot(
+            voting_code, votes, ip_address=ip_address, user_agent=request.META.get('HTTP_USER_AGENT', '')
+        ),
+    }
+    for name in BALLOT_OPERATIONS:
+        operations[name] = lambda ballot, *args, name=name: getattr(ballot, 'a' + name)(*args)
+    return operations
+
+
+async def arun_flow(flow, operations):
+    """views.run_flow(), awaiting each operation."""
+    send, value = flow.send, None
+    while True:
+        try:
+            operation, *args = send(value)
+        except StopIteration as done:
+            return done.value
+        try:
+            send, value = flow.send, await operations[operation](*args)
+        except (VotingCode.DoesNotExist, Throttled) as e:
+            send, value = flow.throw, e
+
+
+@keep_draft_cookie
+async def vote(request, code=None):
+    return await arun_flow(vote_flow(request, code), vote_operations(request))
+
+
+@require_POST
+async def submit_ballot(request):
+    return await arun_flow(submit_ballot_flow(request), vote_operations(request))
+
+
+async def live_results_data(request):
+    # Same conditional handling as @condition in views.py, which cannot await the total.
+    completed_voters, modified = await live_shared_total.aget()
+    etag = f'"{completed_voters}"'
+    last_modified = int(modified)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = JsonResponse({'total_votes': completed_voters})
+        # Let every poll revalidate, which mostly ends in a 304 without a body.
+        patch_cache_control(response, no_cache=True)
+    if request.method in ('GET', 'HEAD'):
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+        response.headers.setdefault('ETag', etag)
+    return response
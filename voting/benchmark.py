@@ -0,0 +1,79 @@
+"""
+Helpers shared by the benchmark management commands: a scratch SQLite database,
+a voting to run against it and latency statistics.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from django.urls import include, path
+
+from .models import Category, Person, VotingCode
+from .profiling import percentile
+from .urls import build_urlpatterns
+
+
+@contextmanager
+def scratch_database(**settings):
+    """
+    Point the default connection at a fresh, migrated SQLite file for the
+    duration of the block, with ``settings`` overridden.
+    """
+    connection = connections['default']
+    if connection.vendor != 'sqlite':
+        raise CommandError('The benchmarks only support the sqlite3 backend.')
+    if connection.is_in_memory_db():
+        raise CommandError('The default database is in memory, the benchmarks need a file database.')
+
+    original_name = connection.settings_dict['NAME']
+    connections.close_all()
+    with tempfile.TemporaryDirectory() as directory:
+        connection.settings_dict['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        try:
+            # The benchmarks drive the views through the test client.
+            settings.setdefault('ALLOWED_HOSTS', ['testserver'])
+            with override_settings(**settings):
+                call_command('migrate', verbosity=0)
+                yield
+        finally:
+            connections.close_all()
+            connection.settings_dict['NAME'] = original_name
+
+
+def create_voting(codes, categories, persons=10):
+    """Create nominees, categories and ``codes`` single-use codes; return the codes and a full ballot."""
+    user = User.objects.create_user('benchmark')
+    nominees = [Person.objects.create(name=f'Person {i}') for i in range(persons)]
+    ballot_categories = [
+        Category.objects.create(title=f'Category {i}', description='Benchmark')
+        for i in range(categories)
+    ]
+    voting_codes = VotingCode.generate_codes_bulk(codes, user, max_uses=1)
+    votes = {category.id: nominees[i % persons].id for i, category in enumerate(ballot_categories)}
+    return voting_codes, votes
+
+
+def latency_summary(seconds):
+    """p50/p95/p99 and mean of ``seconds`` in milliseconds (nearest-rank percentiles)."""
+    durations = sorted(duration * 1000 for duration in seconds)
+    if not durations:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'mean_ms': None}
+
+    return {
+        'p50_ms': round(percentile(durations, 0.50), 2),
+        'p95_ms': round(percentile(durations, 0.95), 2),
+        'p99_ms': round(percentile(durations, 0.99), 2),
+        'mean_ms': round(sum(durations) / len(durations), 2),
+    }
+
+
+class URLConf:
+    """A ROOT_URLCONF serving the voting app with the hot endpoints from ``ballot_views``."""
+
+    def __init__(self, ballot_views):
+        self.urlpatterns = [path('', include((build_urlpatterns(ballot_views), 'voting')))]
@@ -0,0 +1,136 @@
+"""
+In-memory snapshot of the voting catalog: the active categories and the persons
+that can be voted for.
+
+Categories and nominees practically never change while a voting is running, so
+the wizard serves them from an immutable per-process snapshot instead of
+querying them on every step. Every save or delete of a Category or Person bumps
+the version of its part of the catalog (see signals.py and snapshots.py).
+
+Rendered parts of the wizard are cached under a digest of the data they show:
+the nominee <option> list per person_key, and the stepper and category header
+of each step per category_key ({% cache %} in vote_sequential.html). A changed
+category or person therefore retires them without any explicit deletes, as soon
+as the process has rebuilt its snapshot.
+"""
+import hashlib
+from dataclasses import dataclass
+from functools import cached_property
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.html import json_script
+from django.utils.safestring import mark_safe
+
+from .snapshots import VersionedSnapshot
+
+CATEGORY_VERSION_KEY = 'voting:catalog:version:category'
+PERSON_VERSION_KEY = 'voting:catalog:version:person'
+PERSON_OPTIONS_KEY = 'voting:catalog:person-options:{key}'
+# Rendered fragments are keyed on a digest of their data, entries of old data just expire.
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+
+@dataclass(frozen=True)
+class Catalog:
+    category_version: str
+    person_version: str
+    category_key: str
+    person_key: str
+    categories: tuple
+    persons: tuple
+    persons_by_id: dict
+
+    @property
+    def version(self):
+        return f'{self.category_version}.{self.person_version}'
+
+    def get_person(self, person_id):
+        from .models import Person
+
+        try:
+            return self.persons_by_id[int(person_id)]
+        except (KeyError, TypeError, ValueError):
+            raise Person.DoesNotExist(f'Person {person_id!r} is not part of the catalog.')
+
+    @cached_property
+    def person_options_html(self):
+        # Rendered once per list of nominees and shared through the cache, so the
+        # cost of a wizard step does not grow with the number of nominees.
+        key = PERSON_OPTIONS_KEY.format(key=self.person_key)
+        html = cache.get(key)
+        if html is None:
+            html = render_to_string('voting/person_options.html', {'persons': self.persons})
+            cache.set(key, html, FRAGMENT_TIMEOUT)
+        return html
+
+    @cached_property
+    def json_script(self):
+        """The whole catalog as a <script type="application/json"> tag for the single-page ballot."""
+        return json_script({
+            'version': self.version,
+            'categories': [
+                {
+                    'id': category.id,
+                    'title': category.title,
+                    'description': category.description,
+                    'image': category.responsive_image.src if category.image else None,
+                    'image_srcset': {
+                        'webp': category.responsive_image.webp_srcset,
+                        'jpeg': category.responsive_image.jpeg_srcset,
+                    } if category.image else None,
+                }
+                for category in self.categories
+            ],
+            'persons': [{'id': person.id, 'name': person.name} for person in self.persons],
+        }, 'ballot-catalog')
+
+    def render_person_options(self, selected_person_id=None):
+        """Return the nominee <option> list with ``selected_person_id`` preselected."""
+        html = self.person_options_html
+        try:
+            option = f'<option value="{int(selected_person_id)}">'
+        except (TypeError, ValueError):
+            return mark_safe(html)
+        return mark_safe(html.replace(option, option[:-1] + ' selected>', 1))
+
+
+def get_catalog():
+    """Return the current catalog snapshot, rebuilding it if another process or a signal invalidated it."""
+    return _snapshot.get()
+
+
+async def aget_catalog():
+    """get_catalog() for async views: only a rebuild of the snapshot leaves the event loop."""
+    return await _snapshot.aget()
+
+
+def invalidate(model_name):
+    """Bump the version of the catalog part backed by ``model_name`` ('category' or 'person')."""
+    _snapshot.invalidate(CATEGORY_VERSION_KEY if model_name == 'category' else PERSON_VERSION_KEY)
+
+
+def _digest(rows):
+    return hashlib.blake2b(repr(rows).encode(), digest_size=12).hexdigest()
+
+
+def _build(versions):
+    from .models import Category, Person
+
+    category_version, person_version = versions
+    categories = tuple(Category.objects.filter(is_active=True).order_by('title'))
+    persons = tuple(Person.objects.all().order_by('first_name', 'last_name'))
+    return Catalog(
+        category_version=category_version,
+        person_version=person_version,
+        # Everything the cached fragments show, including the resized image copies.
+        category_key=_digest([(category.id, category.title, category.description, category.responsive_image)
+                              for category in categories]),
+        person_key=_digest([(person.id, person.name) for person in persons]),
+        categories=categories,
+        persons=persons,
+        persons_by_id={person.id: person for person in persons},
+    )
+
+
+_snapshot = VersionedSnapshot([CATEGORY_VERSION_KEY, PERSON_VERSION_KEY], _build)
@@ -0,0 +1,174 @@
+"""
+Voting code lookups that do not let a guessing client reach the database.
+
+During the invite window bots and typos send a steady stream of codes that do
+not exist. Every unknown code takes a token from a bucket kept per client IP in
+the cache. An IP whose bucket is empty gets 429 for unknown codes until the
+bucket has refilled; see VOTING_CODE_THROTTLE_BURST and VOTING_CODE_THROTTLE_RATE.
+A valid code is always accepted, so a few typos behind a shared venue IP do not
+lock everyone else out.
+
+To tell a valid code from a guess without a query, every process keeps a Bloom
+filter of all active codes, rebuilt like the catalog snapshot (see
+snapshots.py). A code the filter has never seen is refused right away once its
+IP is out of attempts; a guessing bot's stream of codes therefore costs no
+queries. Until then such a code is still looked up in the database: the filter
+of this process may be older than the code (a version bump that did not reach
+this worker, e.g. with LocMemCache), and a voter must not be turned away or
+charged an attempt for that. A code found that way makes the process rebuild
+its filter. Only an IP that is already out of attempts may have to wait up to
+MAX_AGE seconds for a brand-new code to reach the filter of this process. A
+false positive of the filter (about one in 1 / FALSE_POSITIVE_RATE) costs a
+query, never a wrong answer.
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .snapshots import VersionedSnapshot
+
+VERSION_KEY = 'voting:code-filter:version'
+THROTTLE_KEY = 'voting:code-throttle:{client}'
+# Share of unknown codes the filter lets through to the database.
+FALSE_POSITIVE_RATE = 0.001
+
+
+class Throttled(Exception):
+    """The client has used up its attempts at guessing voting codes."""
+
+
+class BloomFilter:
+    """Set of strings in a bit array: no false negatives, about ``error_rate`` false positives."""
+
+    def __init__(self, items, error_rate=FALSE_POSITIVE_RATE):
+        items = list(items)
+        count = max(len(items), 1)
+        self.size = max(64, math.ceil(-count * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / count * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        for item in items:
+            for index in self._indexes(item):
+                self.bits[index >> 3] |= 1 << (index & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(item))
+
+    def _indexes(self, item):
+        # Double hashing: k indexes from the two halves of one digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+
+def get_active_code(code, client_ip):
+    """
+    ``VotingCode.objects.get(code=code, is_active=True)`` behind the throttle.
+    Raises VotingCode.DoesNotExist for unknown codes, or Throttled instead while
+    ``client_ip`` has no attempts left.
+    """
+    from .models import VotingCode
+
+    filtered_out = _enabled() and code not in get_filter()
+    if filtered_out and is_throttled(client_ip):
+        raise Throttled
+    try:
+        voting_code = VotingCode.objects.get(code=code, is_active=True)
+    except VotingCode.DoesNotExist:
+        _reject(code, client_ip)
+    if filtered_out:
+        _filter.expire()
+    return voting_code
+
+
+async def aget_active_code(code, client_ip):
+    """get_active_code() for async views: only a rebuild of the filter leaves the event loop."""
+    from .models import VotingCode
+
+    filtered_out = _enabled() and code not in await aget_filter()
+    if filtered_out and is_throttled(client_ip):
+        raise Throttled
+    try:
+        voting_code = await VotingCode.objects.aget(code=code, is_active=True)
+    except VotingCode.DoesNotExist:
+        _reject(code, client_ip)
+    if filtered_out:
+        _filter.expire()
+    return voting_code
+
+
+def get_filter():
+    """Return this process's filter of active codes, rebuilding it if it is outdated."""
+    return _filter.get()
+
+
+async def aget_filter():
+    return await _filter.aget()
+
+
+def invalidate():
+    """Make every process rebuild its filter, after codes were created, changed or deactivated."""
+    _filter.invalidate()
+
+
+def _reject(code, client_ip):
+    """Refuse the unknown ``code``: Throttled if the client is out of attempts, else take one."""
+    from .models import VotingCode
+
+    if is_throttled(client_ip):
+        raise Throttled
+    _take_token(client_ip)
+    raise VotingCode.DoesNotExist(f'Voting code {code!r} does not exist or is not active.')
+
+
+def is_throttled(client_ip):
+    return _throttle() is not None and _tokens(client_ip, time.time()) < 1
+
+
+def _take_token(client_ip):
+    throttle = _throttle()
+    if throttle is None:
+        return
+    burst, rate = throttle
+    now = time.time()
+    # Not atomic across requests: a burst of parallel guesses may pay a token less.
+    cache.set(_throttle_key(client_ip), (_tokens(client_ip, now) - 1, now), math.ceil(burst / rate))
+
+
+def _tokens(client_ip, now):
+    burst, rate = _throttle()
+    state = cache.get(_throttle_key(client_ip))
+    if state is None:
+        return burst
+    tokens, updated = state
+    return min(burst, tokens + (now - updated) * rate)
+
+
+def _throttle():
+    """(burst, tokens per second) or None if throttling is disabled."""
+    burst = getattr(settings, 'VOTING_CODE_THROTTLE_BURST', 20)
+    rate = getattr(settings, 'VOTING_CODE_THROTTLE_RATE', 10)
+    if not burst or not rate:
+        return None
+    return burst, rate / 60
+
+
+def _throttle_key(client_ip):
+    # Hash the address into a key every cache backend accepts.
+    return THROTTLE_KEY.format(client=hashlib.sha256(str(client_ip).encode()).hexdigest())
+
+
+def _enabled():
+    return getattr(settings, 'VOTING_CODE_FILTER', True)
+
+
+def _build(versions):
+    from .models import VotingCode
+
+    return BloomFilter(VotingCode.objects.filter(is_active=True).values_list('code', flat=True).iterator())
+
+
+_filter = VersionedSnapshot([VERSION_KEY], _build)
@@ -0,0 +1,90 @@
+"""
+Striped counter of completed ballots, read by the live total (see live.py).
+
+A single counter row would be a write hotspot: every completing ballot would
+queue up behind the lock on that one row. Instead the counter is spread over
+VOTING_COUNTER_SHARDS CounterShard rows, an increment picks one of them at
+random and a read sums them (one indexed range of the (name, shard) key).
+The per-category totals come from VoteStatistics, which a ballot updates anyway.
+
+The shard rows are created up front for the whole counter, the first time this
+process increments it.
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import CounterShard
+
+BALLOTS = 'ballots'
+
+_known = set()
+_lock = threading.Lock()
+
+
+def increment(name):
+    """Add one to the counter ``name``."""
+    shards = getattr(settings, 'VOTING_COUNTER_SHARDS', 8)
+    with _lock:
+        known = name in _known
+    if not known:
+        _create_shards(name, shards)
+
+    shard = CounterShard.objects.filter(name=name, shard=random.randrange(shards))
+    if not shard.update(count=F('count') + 1):
+        # Shard rows were deleted behind this process's back, create them again.
+        _create_shards(name, shards)
+        shard.update(count=F('count') + 1)
+
+
+def count(name):
+    """Current value of one counter, read from the database."""
+    return CounterShard.objects.filter(name=name).aggregate(total=Sum('count'))['total'] or 0
+
+
+async def acount(name):
+    result = await CounterShard.objects.filter(name=name).aaggregate(total=Sum('count'))
+    return result['total'] or 0
+
+
+def expected_values():
+    """What every counter should read, counted from the VotingSession table."""
+    from .models import VotingSession
+
+    return {BALLOTS: VotingSession.objects.filter(is_completed=True).count()}
+
+
+def stored_values():
+    return dict(CounterShard.objects.values_list('name').annotate(total=Sum('count')).order_by())
+
+
+def rebuild():
+    """Recompute all counters from the VotingSession table."""
+    values = expected_values()
+    with transaction.atomic():
+        CounterShard.objects.all().delete()
+        CounterShard.objects.bulk_create([
+            CounterShard(name=name, shard=shard, count=value if shard == 0 else 0)
+            for name, value in values.items()
+            for shard in range(getattr(settings, 'VOTING_COUNTER_SHARDS', 8))
+        ])
+    forget_shards()
+    return values
+
+
+def forget_shards():
+    """Make this process check the shard rows again before the next increment."""
+    with _lock:
+        _known.clear()
+
+
+def _create_shards(name, shards):
+    CounterShard.objects.bulk_create(
+        [CounterShard(name=name, shard=shard) for shard in range(shards)],
+        ignore_conflicts=True
+    )
+    with _lock:
+        _known.add(name)
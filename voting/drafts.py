@@ -0,0 +1,210 @@
+"""
+Where the vote wizard keeps a ballot until it is committed.
+
+'db' (the default) keeps it in the VotingSession of the code, which costs an
+UPDATE per click, each one a write transaction competing with ballot commits
+on SQLite. 'cookie' keeps it in a signed cookie of the browser and 'cache' in
+the Django cache under the code, both for VOTING_DRAFT_TIMEOUT seconds. With
+those two, only the final commit writes: VotingSession.submit_ballot() creates
+the session and commits the ballot in one transaction. The unique session per
+code and the conditional use of the code still keep a code from being counted
+more often than allowed.
+"""
+import functools
+import inspect
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+from .models import BallotProgress, VotingSession
+
+CACHE_KEY = 'voting:draft:{code}'
+COOKIE_NAME = 'voting_draft'
+COOKIE_SALT = 'voting.drafts'
+
+
+class Draft(BallotProgress):
+    """A ballot in progress outside the database, handed back to its storage after every change."""
+
+    def __init__(self, storage, request, voting_code, ip_address, pending_votes=None, current_category_index=0):
+        self.storage = storage
+        self.request = request
+        self.voting_code = voting_code
+        self.ip_address = ip_address
+        self.user_agent = request.META.get('HTTP_USER_AGENT', '')
+        self.pending_votes = pending_votes or {}
+        self.current_category_index = current_category_index
+        self.is_completed = False
+
+    def add_vote(self, category_id, person_id):
+        self.pending_votes[str(category_id)] = person_id
+        self.storage.save(self)
+
+    def advance_category(self):
+        self.current_category_index += 1
+        self.storage.save(self)
+
+    def regress_category(self):
+        if self.current_category_index > 0:
+            self.current_category_index -= 1
+            self.storage.save(self)
+
+    def complete_voting(self):
+        if not VotingSession.submit_ballot(self.voting_code, self.pending_votes,
+                                           ip_address=self.ip_address, user_agent=self.user_agent):
+            return False
+        self.is_completed = True
+        self.storage.discard(self)
+        return True
+
+    # The async views use the same interface as for a VotingSession. Only the commit touches the database.
+
+    async def aadd_vote(self, category_id, person_id):
+        self.add_vote(category_id, person_id)
+
+    async def aadvance_category(self):
+        self.advance_category()
+
+    async def aregress_category(self):
+        self.regress_category()
+
+    async def acomplete_voting(self):
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(self.complete_voting)()
+
+
+class DatabaseStorage:
+    """The draft is the VotingSession of the code; every change is saved right away."""
+
+    def load(self, request, voting_code, ip_address):
+        session, created = VotingSession.objects.get_or_create(
+            voting_code=voting_code,
+            defaults={'ip_address': ip_address, 'user_agent': request.META.get('HTTP_USER_AGENT', '')[:500]}
+        )
+        return session
+
+    async def aload(self, request, voting_code, ip_address):
+        session, created = await VotingSession.objects.aget_or_create(
+            voting_code=voting_code,
+            defaults={'ip_address': ip_address, 'user_agent': request.META.get('HTTP_USER_AGENT', '')[:500]}
+        )
+        # Everything the template and the commit need is at hand, no lazy loads later.
+        session.voting_code = voting_code
+        return session
+
+
+class DraftStorage(ABC):
+    """Base for storages that keep the draft out of the database until it is committed."""
+
+    def load(self, request, voting_code, ip_address):
+        draft = self._draft(request, voting_code, ip_address)
+        draft.is_completed = VotingSession.objects.filter(voting_code=voting_code, is_completed=True).exists()
+        return draft
+
+    async def aload(self, request, voting_code, ip_address):
+        draft = self._draft(request, voting_code, ip_address)
+        completed = VotingSession.objects.filter(voting_code=voting_code, is_completed=True)
+        draft.is_completed = await completed.aexists()
+        return draft
+
+    def _draft(self, request, voting_code, ip_address):
+        state = self.read(request, voting_code) or {}
+        return Draft(self, request, voting_code, ip_address,
+                     pending_votes=state.get('votes'), current_category_index=state.get('index', 0))
+
+    @abstractmethod
+    def read(self, request, voting_code):
+        """The stored state of the draft of ``voting_code``, or None."""
+
+    @abstractmethod
+    def save(self, draft):
+        """Store ``draft`` after a change."""
+
+    @abstractmethod
+    def discard(self, draft):
+        """Drop ``draft`` once it was committed."""
+
+    @staticmethod
+    def state(draft):
+        return {'votes': draft.pending_votes, 'index': draft.current_category_index}
+
+
+class CacheStorage(DraftStorage):
+    """Draft in the Django cache, shared by every browser that uses the code, like a VotingSession."""
+
+    def read(self, request, voting_code):
+        return cache.get(CACHE_KEY.format(code=voting_code.code))
+
+    def save(self, draft):
+        cache.set(CACHE_KEY.format(code=draft.voting_code.code), self.state(draft), _timeout())
+
+    def discard(self, draft):
+        cache.delete(CACHE_KEY.format(code=draft.voting_code.code))
+
+
+class CookieStorage(DraftStorage):
+    """
+    Draft in a signed cookie, so it survives without any server-side state. The
+    cookie is written onto the response by @keep_draft_cookie.
+    """
+
+    def read(self, request, voting_code):
+        try:
+            state = signing.loads(request.COOKIES.get(COOKIE_NAME, ''), salt=COOKIE_SALT, max_age=_timeout())
+        except signing.BadSignature:
+            return None
+        # One cookie per browser: a draft of another code is started over.
+        return state if state.get('code') == voting_code.code else None
+
+    def save(self, draft):
+        draft.request.voting_draft_cookie = signing.dumps(
+            {'code': draft.voting_code.code, **self.state(draft)}, salt=COOKIE_SALT, compress=True
+        )
+
+    def discard(self, draft):
+        draft.request.voting_draft_cookie = None
+
+
+STORAGES = {
+    'db': DatabaseStorage,
+    'cache': CacheStorage,
+    'cookie': CookieStorage,
+}
+
+
+def get_storage():
+    """The storage selected by VOTING_DRAFT_STORAGE ('db', 'cache' or 'cookie')."""
+    return STORAGES[getattr(settings, 'VOTING_DRAFT_STORAGE', 'db')]()
+
+
+def keep_draft_cookie(view):
+    """Write the draft cookie changed during ``view`` (sync or async) onto its response."""
+    if inspect.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            response = await view(request, *args, **kwargs)
+            _update_cookie(request, response)
+            return response
+    else:
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            _update_cookie(request, response)
+            return response
+    return wrapper
+
+
+def _update_cookie(request, response):
+    if not hasattr(request, 'voting_draft_cookie'):
+        return
+    if request.voting_draft_cookie is None:
+        response.delete_cookie(COOKIE_NAME, samesite='Lax')
+    else:
+        response.set_cookie(COOKIE_NAME, request.voting_draft_cookie, max_age=_timeout(),
+                            secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax')
+
+
+def _timeout():
+    return getattr(settings, 'VOTING_DRAFT_TIMEOUT', 60 * 60 * 24)
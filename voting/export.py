@@ -0,0 +1,81 @@
+"""
+CSV export of the raw votes and the per-category results, for large events.
+
+Rows are read with values_list() and .iterator(chunk_size=...), written out in
+chunks of CHUNK_SIZE rows and, if asked for, compressed on the fly. Memory use
+does not grow with the number of votes. Used by manage.py export_votes and the
+staff download at /export/<table>.csv(.gz).
+"""
+import csv
+import io
+import zlib
+
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+
+from .models import Vote, VoteStatistics
+
+# Rows fetched from the database and written out per chunk.
+CHUNK_SIZE = 2000
+
+
+def _votes():
+    return (Vote.objects
+            .order_by('id')
+            .values_list('voting_code__code', 'category__title', 'person__name', 'created_at'))
+
+
+def _results():
+    return (VoteStatistics.objects
+            .annotate(
+                rank=Window(RowNumber(), partition_by=F('category_id'),
+                            order_by=[F('vote_count').desc(), F('person__first_name').asc()]),
+                category_total=Window(Sum('vote_count'), partition_by=F('category_id')),
+            )
+            .order_by('category__title', 'category_id', 'rank')
+            .values_list('category__title', 'rank', 'person__name', 'vote_count', 'category_total'))
+
+
+def _result_row(row):
+    title, rank, person, vote_count, total = row
+    return title, rank, person, vote_count, round(vote_count / total * 100, 2) if total else 0
+
+
+# table name: (header, queryset factory, row formatter)
+TABLES = {
+    'votes': (['code', 'category', 'person', 'created_at'], _votes, None),
+    'results': (['category', 'rank', 'person', 'votes', 'percentage'], _results, _result_row),
+}
+
+
+def csv_chunks(table, chunk_size=CHUNK_SIZE):
+    """Yield the CSV of ``table`` ('votes' or 'results') as strings of up to ``chunk_size`` rows."""
+    header, queryset, format_row = TABLES[table]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+
+    rows = 0
+    for row in queryset().iterator(chunk_size=chunk_size):
+        writer.writerow(format_row(row) if format_row else row)
+        rows += 1
+        if rows % chunk_size == 0:
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+def gzip_chunks(chunks, encoding='utf-8'):
+    """Compress the string ``chunks`` into a gzip stream as they come in."""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode(encoding))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _drain(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
@@ -0,0 +1,126 @@
+"""
+Resized JPEG and WebP copies of the category images, for srcset.
+
+Category images are often photos straight from a phone. When a category gets a
+new image, signals.py writes the image at each of VOTING_IMAGE_WIDTHS (never
+wider than the original) in both formats to
+``derivatives/<image name>/<width>.<format>``. The copies are deleted again
+when the image is replaced or the category is deleted. Images uploaded before
+the copies existed are caught up with manage.py build_image_derivatives.
+
+The templates render the image through voting/category_image.html. The browser
+then picks the smallest WebP (or JPEG) copy that fits the screen. As long as
+there are no copies, the original is served.
+"""
+import io
+import logging
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_DIR = 'derivatives'
+# File extension: Pillow format and save options.
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+@dataclass(frozen=True)
+class ResponsiveImage:
+    src: str
+    webp_srcset: str = ''
+    jpeg_srcset: str = ''
+
+
+def derivative_dir(name):
+    return f'{DERIVATIVE_DIR}/{name}'
+
+
+def generate(name, storage=default_storage):
+    """Write the copies of the image ``name``, replacing existing ones; return their names."""
+    delete(name, storage)
+    with storage.open(name) as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+    image = _flatten(image)
+
+    widths = sorted({min(width, image.width) for width in getattr(settings, 'VOTING_IMAGE_WIDTHS', [320, 640, 1280])})
+    created = []
+    for width in widths:
+        resized = image if width == image.width else image.resize(
+            (width, max(round(image.height * width / image.width), 1)), Image.Resampling.LANCZOS
+        )
+        for extension, (image_format, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, **options)
+            created.append(storage.save(f'{derivative_dir(name)}/{width}.{extension}', ContentFile(buffer.getvalue())))
+    return created
+
+
+def generate_quietly(name, storage=default_storage):
+    """generate(), but an unreadable or oversized image only costs a warning: the original is served instead."""
+    try:
+        return generate(name, storage)
+    except (OSError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not create the resized copies of {name}: {e}")
+        return []
+
+
+def delete(name, storage=default_storage):
+    for file_name in _listdir(name, storage):
+        storage.delete(f'{derivative_dir(name)}/{file_name}')
+
+
+def variants(name, storage=default_storage):
+    """``{extension: [(width, url), ...]}`` of the copies of ``name`` that exist, narrowest first."""
+    found = {}
+    for file_name in _listdir(name, storage):
+        width, _, extension = file_name.partition('.')
+        if extension in FORMATS and width.isdigit():
+            found.setdefault(extension, []).append(
+                (int(width), storage.url(f'{derivative_dir(name)}/{file_name}'))
+            )
+    return {extension: sorted(widths) for extension, widths in found.items()}
+
+
+def responsive_image(image_field):
+    """The src and srcsets to render ``image_field`` with, or None if there is no image."""
+    if not image_field:
+        return None
+    found = variants(image_field.name, image_field.storage)
+    if not found:
+        return ResponsiveImage(src=image_field.url)
+
+    def srcset(extension):
+        return ', '.join(f'{url} {width}w' for width, url in found.get(extension, []))
+
+    jpeg = found.get('jpeg')
+    return ResponsiveImage(
+        src=jpeg[-1][1] if jpeg else image_field.url,
+        webp_srcset=srcset('webp'),
+        jpeg_srcset=srcset('jpeg'),
+    )
+
+
+def _flatten(image):
+    # JPEG has no alpha channel: transparent parts become white.
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _listdir(name, storage):
+    try:
+        directories, files = storage.listdir(derivative_dir(name))
+    except FileNotFoundError:
+        return []
+    return files
@@ -0,0 +1,104 @@
+"""
+Top-N results per category, computed with one window-function query over the
+VoteStatistics counters. Used by the staff results page and the live
+leaderboard API.
+"""
+from django.core.cache import cache
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .catalog import get_catalog
+from .models import VoteStatistics
+
+PUBLISHED_KEY = 'voting:leaderboard:public:published:{limit}'
+PENDING_KEY = 'voting:leaderboard:public:pending:{limit}'
+
+
+def top_results_by_category(limit=5):
+    """
+    Return ``{category: {'top_results': [...], 'total_votes': n}}`` for all active
+    categories, in catalog order. Each result is a VoteStatistics row with its
+    person loaded, a ``rank`` and the ``category_total`` its percentage is based on.
+    """
+    rows = (VoteStatistics.objects
+            .filter(category__is_active=True)
+            .select_related('person')
+            .annotate(
+                rank=Window(RowNumber(), partition_by=F('category_id'),
+                            order_by=[F('vote_count').desc(), F('person__first_name').asc()]),
+                category_total=Window(Sum('vote_count'), partition_by=F('category_id')),
+            )
+            .filter(rank__lte=limit)
+            .order_by('category_id', 'rank'))
+
+    results = {category: {'top_results': [], 'total_votes': 0} for category in get_catalog().categories}
+    by_id = {category.id: data for category, data in results.items()}
+    for row in rows:
+        data = by_id.get(row.category_id)
+        if data is not None:
+            data['top_results'].append(row)
+            data['total_votes'] = row.category_total
+    return results
+
+
+def leaderboard_data(limit=5):
+    """Full leaderboard with vote counts, for staff."""
+    return {
+        'generated_at': timezone.now().isoformat(),
+        'categories': [
+            {
+                'id': category.id,
+                'title': category.title,
+                'total_votes': data['total_votes'],
+                'results': [
+                    {
+                        'rank': result.rank,
+                        'person': result.person.name,
+                        'vote_count': result.vote_count,
+                        'percentage': result.percentage,
+                    }
+                    for result in data['top_results']
+                ],
+            }
+            for category, data in top_results_by_category(limit).items()
+        ],
+    }
+
+
+def public_leaderboard_data(limit, delay):
+    """
+    Leaderboard for the public screen: no vote counts, percentages rounded to 5 %,
+    and always at least ``delay`` seconds old, so late voters cannot be steered
+    by the current standings.
+    """
+    published_key = PUBLISHED_KEY.format(limit=limit)
+    pending_key = PENDING_KEY.format(limit=limit)
+    published = cache.get(published_key)
+    if published is None:
+        # The snapshot taken one interval ago becomes public, a fresh one starts waiting.
+        published = cache.get(pending_key) or {'generated_at': None, 'categories': []}
+        cache.set(pending_key, _obfuscate(leaderboard_data(limit)), None)
+        cache.set(published_key, published, delay)
+    return published
+
+
+def _obfuscate(data):
+    return {
+        'generated_at': data['generated_at'],
+        'categories': [
+            {
+                'id': category['id'],
+                'title': category['title'],
+                'results': [
+                    {
+                        'rank': result['rank'],
+                        'person': result['person'],
+                        'percentage': 5 * round(result['percentage'] / 5),
+                    }
+                    for result in category['results']
+                ],
+            }
+            for category in data['categories']
+        ],
+    }
@@ -0,0 +1,193 @@
+"""
+Live vote counter: a cached total for the polling endpoint and a push channel.
+
+The polling endpoint reads the completed-ballot total from the Django cache,
+where it is incremented whenever a ballot is committed. On a cache miss it is
+summed from the striped ballot counter (see counters.py). Requests of one
+process arriving within COALESCE_WINDOW share a single lookup.
+
+Under ASGI the big-screen page subscribes to a Server-Sent Events stream instead
+of polling. Each process keeps one counter of completed ballots: it is loaded
+from the striped counter once, incremented whenever a ballot of this process is
+committed (see signals.py) and fanned out to all subscribed streams. Ballots completed by other
+worker processes are picked up by a periodic resync, so the database sees one
+counter read per process and interval instead of one per viewer and poll.
+"""
+import asyncio
+import threading
+import time
+
+from django.core.cache import cache
+
+# Seconds between keep-alive comments on an idle stream.
+KEEPALIVE_INTERVAL = 15
+# Seconds after which the counter is reloaded to pick up other processes' ballots.
+RESYNC_INTERVAL = 30
+
+TOTAL_KEY = 'voting:live:total'
+MODIFIED_KEY = 'voting:live:modified'
+# The cached total is recounted after this many seconds, which heals lost increments.
+TOTAL_TIMEOUT = 300
+# Seconds during which requests of one process reuse the last lookup.
+COALESCE_WINDOW = 1.0
+
+
+class Broadcaster:
+    """Delivers the latest value to every subscribed asyncio queue, from any thread."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscription = (asyncio.get_running_loop(), asyncio.Queue(maxsize=1))
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, value):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_put_latest, queue, value)
+            except RuntimeError:
+                # The event loop of this subscriber is gone.
+                self.unsubscribe((loop, queue))
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+def _put_latest(queue, value):
+    # A slow viewer only needs the newest total, never a backlog.
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(value)
+
+
+class LiveCounter:
+    """In-process count of completed ballots."""
+
+    def __init__(self):
+        self.broadcaster = Broadcaster()
+        self._value = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def increment(self):
+        with self._lock:
+            if self._value is None:
+                # Nobody has asked for the total yet, it will be loaded on first use.
+                return
+            self._value += 1
+            value = self._value
+        self.broadcaster.publish(value)
+
+    def reset(self):
+        with self._lock:
+            self._value = None
+            self._loaded_at = 0.0
+
+    async def aget(self):
+        if self._value is None:
+            await self.aresync(force=True)
+        return self._value
+
+    async def aresync(self, force=False):
+        """Reload the total from the database if it is older than RESYNC_INTERVAL."""
+        from . import counters
+
+        now = time.monotonic()
+        if not force and now - self._loaded_at < RESYNC_INTERVAL:
+            return
+        # Claim the reload before awaiting, so concurrent streams do not all query.
+        self._loaded_at = now
+        value = await counters.acount(counters.BALLOTS)
+        with self._lock:
+            changed = value != self._value
+            self._value = value
+        if changed and not force:
+            self.broadcaster.publish(value)
+
+
+class SharedTotal:
+    """Completed-ballot total kept in the Django cache, shared by all processes."""
+
+    def __init__(self):
+        self._state = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return ``(total, last_modified)`` with last_modified as a Unix timestamp."""
+        state = self._state
+        if state is not None and time.monotonic() - self._loaded_at < COALESCE_WINDOW:
+            return state
+        with self._lock:
+            # Whoever waited for the lock reuses the lookup that was just made.
+            if self._state is not None and time.monotonic() - self._loaded_at < COALESCE_WINDOW:
+                return self._state
+            self._state = self._load()
+            self._loaded_at = time.monotonic()
+            return self._state
+
+    async def aget(self):
+        """get() for async views, reading a missing total with the async ORM."""
+        state = self._state
+        if state is not None and time.monotonic() - self._loaded_at < COALESCE_WINDOW:
+            return state
+        state = await self._aload()
+        with self._lock:
+            self._state = state
+            self._loaded_at = time.monotonic()
+        return state
+
+    def increment(self):
+        try:
+            cache.incr(TOTAL_KEY)
+        except ValueError:
+            # Not cached right now, the next read counts from the database.
+            pass
+        cache.set(MODIFIED_KEY, time.time(), None)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._state = None
+            self._loaded_at = 0.0
+
+    def _load(self):
+        from . import counters
+
+        values = cache.get_many([TOTAL_KEY, MODIFIED_KEY])
+        total = values.get(TOTAL_KEY)
+        if total is None:
+            total = counters.count(counters.BALLOTS)
+            cache.add(TOTAL_KEY, total, TOTAL_TIMEOUT)
+        return total, self._modified(values)
+
+    async def _aload(self):
+        from . import counters
+
+        values = cache.get_many([TOTAL_KEY, MODIFIED_KEY])
+        total = values.get(TOTAL_KEY)
+        if total is None:
+            total = await counters.acount(counters.BALLOTS)
+            cache.add(TOTAL_KEY, total, TOTAL_TIMEOUT)
+        return total, self._modified(values)
+
+    def _modified(self, values):
+        modified = values.get(MODIFIED_KEY)
+        if modified is None:
+            modified = time.time()
+            cache.add(MODIFIED_KEY, modified, None)
+        return modified
+
+
+counter = LiveCounter()
+shared_total = SharedTotal()
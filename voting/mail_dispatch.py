@@ -0,0 +1,317 @@
+"""
+Outbox for invitation emails.
+
+send_codes_to_list only writes one OutboxEmail row per invitation via
+enqueue_invitations() and returns. The emails are sent by
+``manage.py run_mail_worker``, which repeatedly claims a round of pending rows,
+sends them from a bounded thread pool over the pooled Mailgun session and
+writes the outcome of every request back to its rows as soon as it is known.
+Because every state change is stored, the progress view reads straight from
+the table and a crashed worker loses at most the requests still in flight:
+its claims expire after MAILGUN_OUTBOX_CLAIM_TIMEOUT seconds and are picked up
+again by the next worker. A round stops starting requests in time to finish
+within half of that timeout, the rows it did not get to go back to pending, so
+no other worker takes over rows that are still being sent. Several workers can
+run side by side, a claim is a conditional UPDATE that only one of them can
+win per row.
+
+Sends are throttled by a token bucket per provider host (per worker process)
+and retried with exponential backoff on timeouts, connection errors, 429 and
+5xx responses. A row whose retries are exhausted goes back to pending until it
+has been tried MAILGUN_OUTBOX_MAX_ATTEMPTS times.
+
+With MAILGUN_BATCH_SIZE above 1 the invitations are grouped into batches that
+go out as one API call each, with the per-address variables as
+recipient-variables. Mailgun accepts or rejects a batch as a whole. A batch
+rejected for an invalid address (400) is split in halves and sent again until
+the rejected addresses are isolated, so every row still ends up with its own
+status. A batch that is too large (413) is halved once. Other errors, such as
+a bad API key (401), fail the whole batch right away.
+"""
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .mailgun_utils import post_mailgun_batch_template_email, post_mailgun_template_email
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+_rate_limiters = {}
+_lock = threading.Lock()
+
+
+class RoundOver(Exception):
+    """Raised instead of starting a request once the round has used up its time."""
+
+
+class RateLimiter:
+    """Token bucket: allows ``rate`` acquisitions per second with bursts up to ``burst``."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def enqueue_invitations(invitations, subject, template_name):
+    """
+    Store ``invitations`` (pairs of VotingCode and template variables) in the
+    outbox and return the job id that groups them. Nothing is sent here.
+    """
+    job_id = uuid.uuid4().hex
+    OutboxEmail.objects.bulk_create([
+        OutboxEmail(
+            job_id=job_id,
+            voting_code=voting_code,
+            email=voting_code.email,
+            subject=subject,
+            template_name=template_name,
+            template_variables=template_variables
+        )
+        for voting_code, template_variables in invitations
+    ])
+    return job_id
+
+
+def job_progress(job_id):
+    """Per-address progress of one job, or None if the job is unknown."""
+    rows = list(OutboxEmail.objects.filter(job_id=job_id).values_list('email', 'status', 'last_error'))
+    if not rows:
+        return None
+    counts = {'pending': 0, 'sent': 0, 'failed': 0}
+    for _, status, _ in rows:
+        # Claimed rows are still on their way.
+        counts['pending' if status == OutboxEmail.SENDING else status] += 1
+    return {
+        'id': job_id,
+        'total': len(rows),
+        'finished': counts['pending'] == 0,
+        **counts,
+        'recipients': [
+            {'email': email, 'status': status, 'error': last_error or None}
+            for email, status, last_error in rows
+        ],
+    }
+
+
+def claim(limit):
+    """
+    Claim up to ``limit`` pending (or abandoned) rows for this worker and return
+    ``(token, rows)``. Safe against concurrent workers without row locks.
+    """
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    expired = now - timedelta(seconds=getattr(settings, 'MAILGUN_OUTBOX_CLAIM_TIMEOUT', 600))
+    claimable = Q(status=OutboxEmail.PENDING) | Q(status=OutboxEmail.SENDING, claimed_at__lt=expired)
+
+    ids = list(OutboxEmail.objects.filter(claimable).values_list('pk', flat=True)[:limit])
+    if not ids:
+        return token, []
+    # The UPDATE checks the condition again, so a row another worker got first is skipped.
+    OutboxEmail.objects.filter(claimable, pk__in=ids).update(
+        status=OutboxEmail.SENDING, claim_token=token, claimed_at=now
+    )
+    return token, list(OutboxEmail.objects.filter(claim_token=token))
+
+
+def process_outbox(concurrency=None):
+    """Claim one round of emails, send them and record each outcome as it arrives. Returns the number claimed."""
+    batch_size = max(1, getattr(settings, 'MAILGUN_BATCH_SIZE', 1000))
+    concurrency = concurrency or getattr(settings, 'MAILGUN_MAX_WORKERS', 8)
+    window = _send_window()
+    # One request per thread, fewer if the rate limit would not let them all start within the window.
+    requests_per_round = max(1, min(concurrency, int(getattr(settings, 'MAILGUN_RATE_LIMIT', 10) * window)))
+    token, messages = claim(batch_size * requests_per_round)
+    if not messages:
+        return 0
+
+    by_template = defaultdict(list)
+    for message in messages:
+        by_template[message.subject, message.template_name].append(message)
+    units = []
+    for (subject, template_name), group in by_template.items():
+        if batch_size > 1:
+            units.extend((_send_batch, batch, subject, template_name) for batch in _batches(group, batch_size))
+        else:
+            units.extend((_send_one, message, subject, template_name) for message in group)
+
+    # The threads only talk to Mailgun, all database writes stay in this thread.
+    deadline = time.monotonic() + window
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='mail-worker') as executor:
+        futures = [executor.submit(send, *args, deadline=deadline) for send, *args in units]
+        for future in as_completed(futures):
+            # Stored right away: if the worker dies later in the round, these emails are not sent twice.
+            _record(token, future.result())
+    return len(messages)
+
+
+def _send_window():
+    """
+    Seconds a round may keep starting requests: a request started at the end,
+    whose attempts all time out, still ends within half the claim timeout.
+    """
+    max_retries = getattr(settings, 'MAILGUN_MAX_RETRIES', 3)
+    backoff = getattr(settings, 'MAILGUN_RETRY_BACKOFF', 1.0)
+    slowest = ((max_retries + 1) * getattr(settings, 'MAILGUN_TIMEOUT', 10)
+               + sum(backoff * 2 ** attempt * 1.5 for attempt in range(max_retries)))
+    return max(1, getattr(settings, 'MAILGUN_OUTBOX_CLAIM_TIMEOUT', 600) / 2 - slowest)
+
+
+def _send_one(message, subject, template_name, deadline=None):
+    try:
+        _post_with_retry(post_mailgun_template_email, message.email, subject, template_name,
+                         message.template_variables, deadline=deadline)
+    except RoundOver as e:
+        return [([message], e)]
+    except Exception as e:
+        logger.error(f"Failed to send Mailgun email to {message.email}: {e}")
+        return [([message], e)]
+    return [([message], None)]
+
+
+def _send_batch(batch, subject, template_name, may_shrink=True, deadline=None):
+    try:
+        _post_with_retry(post_mailgun_batch_template_email,
+                         [(message.email, message.template_variables) for message in batch],
+                         subject, template_name, deadline=deadline)
+    except RoundOver as e:
+        return [(batch, e)]
+    except Exception as e:
+        middle = len(batch) // 2
+        if middle and _is_recipient_error(e):
+            # The batch was refused for an address in it, find the addresses responsible.
+            return (_send_batch(batch[:middle], subject, template_name, may_shrink, deadline=deadline)
+                    + _send_batch(batch[middle:], subject, template_name, may_shrink, deadline=deadline))
+        if middle and may_shrink and _status(e) == 413:
+            # Too large: halve it once. Anything else (401, 403, 404...) fails every part the same way.
+            return (_send_batch(batch[:middle], subject, template_name, may_shrink=False, deadline=deadline)
+                    + _send_batch(batch[middle:], subject, template_name, may_shrink=False, deadline=deadline))
+        logger.error(f"Failed to send Mailgun batch of {len(batch)} emails: {e}")
+        return [(batch, e)]
+    return [(batch, None)]
+
+
+def _post_with_retry(post, *args, deadline=None):
+    """
+    Call ``post`` under the rate limit, retrying timeouts, 429 and 5xx with backoff.
+    Raises RoundOver instead of sending once ``deadline`` (time.monotonic()) has passed.
+    """
+    max_retries = getattr(settings, 'MAILGUN_MAX_RETRIES', 3)
+    backoff = getattr(settings, 'MAILGUN_RETRY_BACKOFF', 1.0)
+    limiter = _rate_limiter_for(settings.MAILGUN_API_URL)
+
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        if deadline is not None and time.monotonic() >= deadline:
+            raise RoundOver
+        try:
+            return post(*args)
+        except requests.exceptions.RequestException as e:
+            if _is_permanent(e) or attempt == max_retries:
+                raise
+            delay = backoff * 2 ** attempt * (1 + random.random() / 2)
+            response = e.response
+            if response is not None and response.headers.get('Retry-After', '').isdigit():
+                delay = max(delay, int(response.headers['Retry-After']))
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                # No time left to wait for the next attempt in this round.
+                raise
+            time.sleep(delay)
+
+
+def _is_permanent(error):
+    """Whether sending again cannot help: anything but timeouts, connection errors, 429 and 5xx."""
+    if not isinstance(error, requests.exceptions.RequestException):
+        return True
+    response = error.response
+    return response is not None and response.status_code != 429 and response.status_code < 500
+
+
+def _status(error):
+    response = getattr(error, 'response', None)
+    return response.status_code if response is not None else None
+
+
+def _is_recipient_error(error):
+    """Whether Mailgun refused a request because of an address in it (400 naming the recipient)."""
+    if _status(error) != 400:
+        return False
+    return re.search(r"address|recipient|'to'", error.response.text, re.IGNORECASE) is not None
+
+
+def _describe(error):
+    # Keep Mailgun's own explanation, e.g. which address it refused.
+    response = getattr(error, 'response', None)
+    if response is not None and response.text:
+        return f"{error}: {response.text}"
+    return str(error)
+
+
+def _record(token, outcomes):
+    """Store the outcomes of one unit: pairs of outbox rows and the error they failed with (None if sent)."""
+    max_attempts = getattr(settings, 'MAILGUN_OUTBOX_MAX_ATTEMPTS', 5)
+    now = timezone.now()
+    for messages, error in outcomes:
+        claimed = OutboxEmail.objects.filter(pk__in=[message.pk for message in messages], claim_token=token)
+        if isinstance(error, RoundOver):
+            # Never sent, so this does not count as an attempt.
+            claimed.update(status=OutboxEmail.PENDING, claim_token='')
+            continue
+        released = {'claim_token': '', 'attempts': F('attempts') + 1}
+        if error is None:
+            claimed.update(status=OutboxEmail.SENT, sent_at=now, last_error='', **released)
+            continue
+        description = _describe(error)
+        if not _is_permanent(error):
+            # Worth another round, unless these rows have had enough of them.
+            claimed.filter(attempts__lt=max_attempts - 1).update(
+                status=OutboxEmail.PENDING, last_error=description, **released
+            )
+        claimed.update(status=OutboxEmail.FAILED, last_error=description, **released)
+
+
+def _batches(messages, size):
+    """Split outbox rows into batches of at most ``size`` distinct addresses."""
+    batch = {}
+    for message in messages:
+        if len(batch) == size or message.email in batch:
+            yield list(batch.values())
+            batch = {}
+        batch[message.email] = message
+    if batch:
+        yield list(batch.values())
+
+
+def _rate_limiter_for(url):
+    host = urlsplit(url).netloc
+    with _lock:
+        if host not in _rate_limiters:
+            _rate_limiters[host] = RateLimiter(getattr(settings, 'MAILGUN_RATE_LIMIT', 10))
+        return _rate_limiters[host]
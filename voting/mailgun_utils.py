@@ -1,35 +1,69 @@
 import requests
 import json
+import threading
 from django.conf import settings
-import logging
-
-logger = logging.getLogger(__name__)
-
-def send_mailgun_template_email(to_email, subject, template_name, template_variables):
-    if not settings.MAILGUN_API_KEY or not settings.MAILGUN_DOMAIN or not settings.MAILGUN_API_URL:
-        logger.error("Mailgun API key, domain, or URL not configured in settings.")
-        return False
-
-    try:
-        response = requests.post(
-            settings.MAILGUN_API_URL,
-            auth=("api", settings.MAILGUN_API_KEY),
-            data={
-                "from": settings.MAILGUN_SENDER_EMAIL,
-                "to": to_email,
-                "subject": subject,
-                "template": template_name,
-                "h:X-Mailgun-Variables": json.dumps(template_variables)
-            }
-        )
-        response.raise_for_status()
-        logger.info(f"Mailgun email sent successfully to {to_email}. Response: {response.json()}")
-        return True
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to send Mailgun email to {to_email}: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            logger.error(f"Mailgun API Error Response: {e.response.text}")
-        return False
-    except Exception as e:
-        logger.error(f"An unexpected error occurred while sending Mailgun email to {to_email}: {e}")
-        return False
+from requests.adapters import HTTPAdapter
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Shared requests.Session, so consecutive sends reuse their HTTPS connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = getattr(settings, 'MAILGUN_MAX_WORKERS', 8)
+            _session = requests.Session()
+            _session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+            _session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        return _session
+
+
+def mailgun_is_configured():
+    return bool(settings.MAILGUN_API_KEY and settings.MAILGUN_DOMAIN and settings.MAILGUN_API_URL)
+
+
+def post_mailgun_template_email(to_email, subject, template_name, template_variables):
+    """Send one templated email and return the response. Raises requests exceptions on failure."""
+    response = get_session().post(
+        settings.MAILGUN_API_URL,
+        auth=("api", settings.MAILGUN_API_KEY),
+        data={
+            "from": settings.MAILGUN_SENDER_EMAIL,
+            "to": to_email,
+            "subject": subject,
+            "template": template_name,
+            "h:X-Mailgun-Variables": json.dumps(template_variables)
+        },
+        timeout=getattr(settings, 'MAILGUN_TIMEOUT', 10)
+    )
+    response.raise_for_status()
+    return response
+
+
+def post_mailgun_batch_template_email(recipients, subject, template_name):
+    """
+    Send one templated email to several recipients in a single API call and return
+    the response. ``recipients`` are pairs of email and template variables; the
+    variables travel as recipient-variables, so every recipient gets an individual
+    message and never sees the other addresses. Raises requests exceptions on failure.
+    """
+    recipient_variables = {email: variables for email, variables in recipients}
+    variable_names = {name for variables in recipient_variables.values() for name in variables}
+    response = get_session().post(
+        settings.MAILGUN_API_URL,
+        auth=("api", settings.MAILGUN_API_KEY),
+        data={
+            "from": settings.MAILGUN_SENDER_EMAIL,
+            "to": list(recipient_variables),
+            "subject": subject,
+            "template": template_name,
+            "recipient-variables": json.dumps(recipient_variables),
+            "h:X-Mailgun-Variables": json.dumps({name: f"%recipient.{name}%" for name in sorted(variable_names)})
+        },
+        timeout=getattr(settings, 'MAILGUN_TIMEOUT', 10)
+    )
+    response.raise_for_status()
+    return response
+
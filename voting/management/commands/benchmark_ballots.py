@@ -0,0 +1,101 @@
+import json
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from voting.benchmark import create_voting, scratch_database
+from voting.models import VotingCode, VotingSession
+from voting.sqlite import PROFILES
+
+
+def cast_ballots(code_ids, votes):
+    """Runs in a forked worker process: submit one ballot per code, count what went through."""
+    completed = failed = 0
+    for voting_code in VotingCode.objects.filter(pk__in=code_ids):
+        try:
+            ok = VotingSession.submit_ballot(voting_code, votes)
+        except OperationalError:
+            ok = False
+        if ok:
+            completed += 1
+        else:
+            failed += 1
+    connections.close_all()
+    return completed, failed
+
+
+class Command(BaseCommand):
+    help = 'Measure ballot throughput of several processes writing to a scratch SQLite database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=4,
+            help='Worker processes submitting ballots at the same time (default: 4)',
+        )
+        parser.add_argument(
+            '--ballots',
+            type=int,
+            default=200,
+            help='Ballots per process (default: 200)',
+        )
+        parser.add_argument(
+            '--categories',
+            type=int,
+            default=8,
+            help='Categories per ballot (default: 8)',
+        )
+        parser.add_argument(
+            '--profile',
+            action='append',
+            dest='profiles',
+            choices=['default', *PROFILES],
+            help='SQLite profile to measure, "default" for no tuning (can be repeated, default: all)',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the results as JSON',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            context = multiprocessing.get_context('fork')
+        except ValueError:
+            raise CommandError('The benchmark needs the fork start method, which this platform does not offer.')
+
+        results = [self.run(context, profile, options) for profile in options['profiles'] or ['default', *PROFILES]]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'profile':<12} {'ballots/s':>10} {'completed':>10} {'failed':>8} {'seconds':>8}")
+        for result in results:
+            self.stdout.write(
+                f"{result['profile']:<12} {result['ballots_per_second']:>10.1f} {result['completed']:>10} "
+                f"{result['failed']:>8} {result['seconds']:>8.2f}"
+            )
+
+    def run(self, context, profile, options):
+        with scratch_database(VOTING_SQLITE_PROFILE=None if profile == 'default' else profile):
+            codes, votes = create_voting(options['processes'] * options['ballots'], options['categories'])
+            ids = [code.id for code in codes]
+            chunks = [ids[i::options['processes']] for i in range(options['processes'])]
+            # Every worker has to open its own connection.
+            connections.close_all()
+            with context.Pool(options['processes']) as pool:
+                started = time.perf_counter()
+                outcomes = pool.starmap(cast_ballots, [(chunk, votes) for chunk in chunks])
+                seconds = time.perf_counter() - started
+
+        completed = sum(outcome[0] for outcome in outcomes)
+        return {
+            'profile': profile,
+            'processes': options['processes'],
+            'completed': completed,
+            'failed': sum(outcome[1] for outcome in outcomes),
+            'seconds': round(seconds, 3),
+            'ballots_per_second': round(completed / seconds, 1),
+        }
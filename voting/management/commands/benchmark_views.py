@@ -0,0 +1,120 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from voting import async_views, views
+from voting.benchmark import URLConf, create_voting, latency_summary, scratch_database
+
+ENDPOINTS = ['live', 'code', 'step']
+
+
+class Command(BaseCommand):
+    help = ('Compare latency and throughput of the sync views under the WSGI handler with the '
+            'async views under the ASGI handler, on a scratch SQLite database')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=500,
+            help='Requests per endpoint and handler (default: 500)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=50,
+            help='Requests in flight at the same time (default: 50)',
+        )
+        parser.add_argument(
+            '--endpoint',
+            action='append',
+            dest='endpoints',
+            choices=ENDPOINTS,
+            help='live: live total poll, code: code check, step: wizard step (can be repeated, default: all)',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the results as JSON',
+        )
+
+    def handle(self, *args, **options):
+        results = []
+        with scratch_database():
+            codes, _ = create_voting(2 * options['requests'], categories=8)
+            code_values = [code.code for code in codes]
+            for endpoint in options['endpoints'] or ENDPOINTS:
+                # Each handler gets codes of its own, so both create the same sessions.
+                for handler, ballot_codes in (('wsgi', code_values[::2]), ('asgi', code_values[1::2])):
+                    requests = self.build_requests(endpoint, ballot_codes[:options['requests']])
+                    if handler == 'wsgi':
+                        with override_settings(ROOT_URLCONF=URLConf(views)):
+                            seconds, latencies = self.run_wsgi(requests, options['concurrency'])
+                    else:
+                        with override_settings(ROOT_URLCONF=URLConf(async_views)):
+                            seconds, latencies = asyncio.run(self.run_asgi(requests, options['concurrency']))
+                    results.append(self.summarize(handler, endpoint, seconds, latencies))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'handler':<8} {'endpoint':<8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+        for result in results:
+            self.stdout.write(
+                f"{result['handler']:<8} {result['endpoint']:<8} {result['requests_per_second']:>8.1f} "
+                f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['errors']:>7}"
+            )
+
+    def build_requests(self, endpoint, codes):
+        if endpoint == 'live':
+            return [('get', '/api/live-results-data/', None)] * len(codes)
+        if endpoint == 'code':
+            return [('post', '/vote/', {'voting_code': code}) for code in codes]
+        return [('get', f'/vote/{code}/', None) for code in codes]
+
+    def run_wsgi(self, requests, concurrency):
+        local = threading.local()
+
+        def send(request):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            method, path, data = request
+            started = time.perf_counter()
+            response = getattr(local.client, method)(path, data)
+            return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(send, requests))
+        return time.perf_counter() - started, latencies
+
+    async def run_asgi(self, requests, concurrency):
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def send(request):
+            method, path, data = request
+            async with slots:
+                started = time.perf_counter()
+                response = await getattr(client, method)(path, data)
+                return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(send(request) for request in requests))
+        return time.perf_counter() - started, latencies
+
+    def summarize(self, handler, endpoint, seconds, latencies):
+        return {
+            'handler': handler,
+            'endpoint': endpoint,
+            'requests': len(latencies),
+            'errors': sum(1 for _, status in latencies if status >= 400),
+            'seconds': round(seconds, 3),
+            'requests_per_second': round(len(latencies) / seconds, 1),
+            **latency_summary(duration for duration, _ in latencies),
+        }
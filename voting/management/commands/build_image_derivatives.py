@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from voting import catalog, images
+from voting.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Create the resized JPEG/WebP copies of category images that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recreate the copies of every image, e.g. after changing VOTING_IMAGE_WIDTHS',
+        )
+
+    def handle(self, *args, **options):
+        built = 0
+        for category in Category.objects.exclude(image='').exclude(image__isnull=True):
+            name = category.image.name
+            if not options['force'] and images.variants(name):
+                continue
+            if images.generate_quietly(name):
+                built += 1
+                self.stdout.write(f'  • {category.title}')
+
+        # Snapshots built before may still point at the originals.
+        catalog.invalidate('category')
+        self.stdout.write(self.style.SUCCESS(f'✓ Created resized copies for {built} category images'))
@@ -0,0 +1,26 @@
+from django.contrib.staticfiles.management.commands.collectstatic import Command as CollectStaticCommand
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+
+class Command(CollectStaticCommand):
+    help = (CollectStaticCommand.help + '. Downloads missing Bootstrap and Font Awesome files first '
+            '(see fetch_vendor_assets), so the pages do not load them from a CDN.')
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--no-fetch-vendor',
+            action='store_false',
+            dest='fetch_vendor',
+            help='Do not download missing vendor files; the pages then link them from the CDN',
+        )
+
+    def handle(self, **options):
+        if options['fetch_vendor'] and not options['dry_run']:
+            try:
+                call_command('fetch_vendor_assets', missing=True, verbosity=options['verbosity'],
+                             stdout=self.stdout, stderr=self.stderr)
+            except CommandError as e:
+                raise CommandError(f'{e}. Run collectstatic with --no-fetch-vendor to link the CDN copies instead.')
+        return super().handle(**options)
@@ -1,8 +1,12 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from django.db import models
+from voting import catalog
 from voting.models import Person, Category, VotingCode
 
+# Above this many codes only their number is printed.
+MAX_LISTED_CODES = 50
+
 
 class Command(BaseCommand):
     help = 'Create sample data for testing the voting system'
@@ -14,6 +18,16 @@ class Command(BaseCommand):
             default=5,
             help='Number of voting codes to generate (default: 5)',
         )
+        parser.add_argument(
+            '--persons',
+            type=int,
+            help='Number of persons; beyond the sample names they are numbered (default: the sample names)',
+        )
+        parser.add_argument(
+            '--categories',
+            type=int,
+            help='Number of categories; beyond the sample ones they are numbered (default: the sample categories)',
+        )
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Creating sample data...'))
@@ -26,11 +40,14 @@ class Command(BaseCommand):
             'Laura Zimmermann', 'Niklas Wolf', 'Sophia Krüger'
         ]
 
-        persons_created = 0
-        for name in sample_names:
-            person, created = Person.objects.get_or_create(name=name)
-            if created:
-                persons_created += 1
+        person_count = options['persons'] if options['persons'] is not None else len(sample_names)
+        names = sample_names[:person_count] + [
+            f'Person {i}' for i in range(len(sample_names) + 1, person_count + 1)
+        ]
+        persons_created = self.bulk_create_missing(
+            Person, 'name', names,
+            lambda name: Person(name=name, first_name=name.split()[0], last_name=' '.join(name.split()[1:]))
+        )
 
         self.stdout.write(
             self.style.SUCCESS(f'✓ Created {persons_created} new persons (Total: {Person.objects.count()})')
@@ -47,14 +64,15 @@ class Command(BaseCommand):
             ('Beste/r Freund/in', 'Wer ist der/die beste Freund/in?'),
         ]
 
-        categories_created = 0
-        for title, description in sample_categories:
-            category, created = Category.objects.get_or_create(
-                title=title,
-                defaults={'description': description}
-            )
-            if created:
-                categories_created += 1
+        category_count = options['categories'] if options['categories'] is not None else len(sample_categories)
+        descriptions = dict(sample_categories[:category_count] + [
+            (f'Kategorie {i}', f'Wer gewinnt Kategorie {i}?')
+            for i in range(len(sample_categories) + 1, category_count + 1)
+        ])
+        categories_created = self.bulk_create_missing(
+            Category, 'title', list(descriptions),
+            lambda title: Category(title=title, description=descriptions[title])
+        )
 
         self.stdout.write(
             self.style.SUCCESS(f'✓ Created {categories_created} new categories (Total: {Category.objects.count()})')
@@ -84,21 +102,19 @@ class Command(BaseCommand):
                     self.style.WARNING(f'Already have {existing_codes} active codes. Skipping code generation.')
                 )
             else:
-                codes_created = 0
-                generated_codes = []
-                
-                for _ in range(codes_to_create):
-                    code = VotingCode.generate_code(admin_user)
-                    generated_codes.append(code.code)
-                    codes_created += 1
+                generated_codes = [
+                    code.code for code in VotingCode.generate_codes_bulk(codes_to_create, admin_user)
+                ]
+                codes_created = len(generated_codes)
 
                 self.stdout.write(
                     self.style.SUCCESS(f'✓ Generated {codes_created} new voting codes')
                 )
                 
-                self.stdout.write('\nGenerated codes:')
-                for code in generated_codes:
-                    self.stdout.write(f'  • {code}')
+                if codes_created <= MAX_LISTED_CODES:
+                    self.stdout.write('\nGenerated codes:')
+                    for code in generated_codes:
+                        self.stdout.write(f'  • {code}')
 
         except Exception as e:
             self.stdout.write(
@@ -125,3 +141,11 @@ class Command(BaseCommand):
             self.stdout.write('  Username: admin')
             self.stdout.write('  Password: admin123')
 
+    def bulk_create_missing(self, model, field, values, build):
+        """Create the ``model`` rows whose ``field`` is not taken yet, in bulk; return how many."""
+        existing = set(model.objects.values_list(field, flat=True))
+        missing = [build(value) for value in values if value not in existing]
+        model.objects.bulk_create(missing, batch_size=500)
+        # bulk_create sends no post_save, so the catalog has to be told directly.
+        catalog.invalidate(model._meta.model_name)
+        return len(missing)
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from voting.export import CHUNK_SIZE, TABLES, csv_chunks, gzip_chunks
+
+
+class Command(BaseCommand):
+    help = 'Export the votes or the per-category results as CSV, streamed in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--table',
+            choices=list(TABLES),
+            default='votes',
+            help='votes: code, category, person, created_at per vote; '
+                 'results: ranked totals per category (default: votes)',
+        )
+        parser.add_argument(
+            '--output',
+            default='-',
+            help='File to write the CSV to (default: stdout)',
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Compress the output with gzip (implied by an --output ending in .gz)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help=f'Rows fetched from the database at a time (default: {CHUNK_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        chunks = csv_chunks(options['table'], chunk_size=options['chunk_size'])
+        compress = options['gzip'] or options['output'].endswith('.gz')
+
+        if options['output'] == '-':
+            if compress:
+                raise CommandError('gzip output needs --output, or pipe the CSV through gzip.')
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        if compress:
+            with open(options['output'], 'wb') as f:
+                for chunk in gzip_chunks(chunks):
+                    f.write(chunk)
+        else:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f'✓ Wrote the {options["table"]} table to {options["output"]}'))
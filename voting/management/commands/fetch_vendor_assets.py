@@ -0,0 +1,90 @@
+import posixpath
+import re
+from pathlib import Path
+
+import requests
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from voting.staticfiles import VENDOR_PACKAGES, vendor_cdn_url, vendor_path
+from voting.templatetags.voting_static import is_vendored
+
+CSS_URL = re.compile(r'url\(\s*[\'"]?([^\'")]+)[\'"]?\s*\)')
+# Source maps are not fetched; collectstatic would fail on the dangling reference.
+SOURCE_MAP = re.compile(rb'\n?(/\*# sourceMappingURL=[^*]*\*/|//# sourceMappingURL=\S*)\s*$')
+
+
+class Command(BaseCommand):
+    help = ('Download Bootstrap and Font Awesome (with their fonts) into voting/static/voting/vendor/ '
+            'so the pages no longer load them from a CDN; run collectstatic afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=30,
+            help='Seconds to wait for each download (default: 30)',
+        )
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help='Only download files that are not there yet (what collectstatic runs)',
+        )
+
+    def handle(self, *args, **options):
+        static_root = self.static_root()
+        fetched = 0
+        for package, (base_url, file_names) in VENDOR_PACKAGES.items():
+            queue = list(file_names)
+            seen = set()
+            while queue:
+                file_name = queue.pop(0)
+                if file_name in seen:
+                    continue
+                seen.add(file_name)
+
+                target = static_root / vendor_path(package, file_name)
+                if options['missing'] and target.exists():
+                    content = target.read_bytes()
+                else:
+                    content = self.download(vendor_cdn_url(package, file_name), options['timeout'])
+                    if file_name.endswith(('.css', '.js')):
+                        content = SOURCE_MAP.sub(b'\n', content)
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    target.write_bytes(content)
+                    fetched += 1
+                    self.stdout.write(f'  • {vendor_path(package, file_name)}')
+                if file_name.endswith('.css'):
+                    queue.extend(self.referenced_files(file_name, content.decode('utf-8')))
+
+        is_vendored.cache_clear()
+        if fetched and options['missing']:
+            self.stdout.write(self.style.SUCCESS(f'✓ Downloaded {fetched} missing files'))
+        elif fetched:
+            self.stdout.write(self.style.SUCCESS(f'✓ Downloaded {fetched} files, run collectstatic to publish them'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✓ Vendor files are complete'))
+
+    @staticmethod
+    def static_root():
+        return Path(apps.get_app_config('voting').path) / 'static'
+
+    def download(self, url, timeout):
+        try:
+            response = requests.get(url, timeout=timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise CommandError(f'Could not download {url}: {e}')
+        return response.content
+
+    @staticmethod
+    def referenced_files(file_name, css):
+        """Files a stylesheet loads itself (fonts, images), relative to the package."""
+        for reference in CSS_URL.findall(css):
+            reference = reference.split('?')[0].split('#')[0]
+            if not reference or reference.startswith(('data:', 'http:', 'https:', '//', '/')):
+                continue
+            path = posixpath.normpath(posixpath.join(posixpath.dirname(file_name), reference))
+            # It would be written outside the package's vendor directory.
+            if path == '..' or path.startswith('../') or posixpath.isabs(path):
+                raise CommandError(f'{file_name} refers to {reference!r}, outside its package')
+            yield path
@@ -0,0 +1,87 @@
+import csv
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from voting.models import VotingCode
+
+
+class Command(BaseCommand):
+    help = 'Generate voting codes in bulk and write them out as CSV or plain text'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=10,
+            help='Number of codes to generate (default: 10, ignored with --emails)',
+        )
+        parser.add_argument(
+            '--emails',
+            help='File with one email address per line; one code is generated per address',
+        )
+        parser.add_argument(
+            '--max-uses',
+            type=int,
+            default=1,
+            help='How often each code can be used (default: 1)',
+        )
+        parser.add_argument(
+            '--length',
+            type=int,
+            default=8,
+            help='Number of characters per code (default: 8)',
+        )
+        parser.add_argument(
+            '--user',
+            help='Username recorded as creator (default: the first superuser)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'text'],
+            default='csv',
+            help='csv: code,max_uses,email with a header row; text: one code per line (default: csv)',
+        )
+        parser.add_argument(
+            '--output',
+            default='-',
+            help='File to write the codes to (default: stdout)',
+        )
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            user = User.objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('No matching user found. Create one with createsuperuser or pass --user.')
+
+        emails = None
+        if options['emails']:
+            with open(options['emails'], encoding='utf-8') as f:
+                emails = [line.strip() for line in f if line.strip()]
+
+        codes = VotingCode.generate_codes_bulk(
+            options['count'],
+            user,
+            length=options['length'],
+            max_uses=options['max_uses'],
+            emails=emails
+        )
+
+        if options['output'] == '-':
+            self.write_codes(codes, self.stdout, options['format'])
+        else:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                self.write_codes(codes, f, options['format'])
+            self.stderr.write(self.style.SUCCESS(f'✓ Wrote {len(codes)} codes to {options["output"]}'))
+
+    def write_codes(self, codes, stream, output_format):
+        if output_format == 'text':
+            for voting_code in codes:
+                stream.write(voting_code.code + '\n')
+            return
+
+        writer = csv.writer(stream)
+        writer.writerow(['code', 'max_uses', 'email'])
+        for voting_code in codes:
+            writer.writerow([voting_code.code, voting_code.max_uses, voting_code.email or ''])
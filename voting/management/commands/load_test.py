@@ -0,0 +1,228 @@
+import json
+import multiprocessing
+import platform
+import random
+import sqlite3
+import time
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from voting.benchmark import latency_summary, scratch_database
+from voting.models import Category, Person, VotingCode
+
+MODES = ['sequential', 'single_page']
+
+
+def walk_ballots(codes, person_ids, category_ids, mode, polls, seed):
+    """
+    Runs in a forked worker process: vote once with every code the way a browser
+    would, then poll the live counter ``polls`` times. Returns one (kind, seconds,
+    queries, status) sample per request and the number of completed ballots.
+    """
+    rng = random.Random(seed)
+    client = Client()
+    samples = []
+    completed = 0
+    success_url = reverse('voting:success')
+    live_url = reverse('voting:live_results_data')
+
+    def send(kind, method, path, data=None, **extra):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, method)(path, data, **extra)
+            seconds = time.perf_counter() - started
+        samples.append((kind, seconds, len(queries), response.status_code))
+        return response
+
+    for code in codes:
+        url = reverse('voting:vote_with_code', args=[code])
+        send('wizard_step', 'get', url)
+
+        if mode == 'single_page':
+            votes = {str(category_id): rng.choice(person_ids) for category_id in category_ids}
+            response = send('ballot_submit', 'post', reverse('voting:submit_ballot'),
+                            json.dumps({'code': code, 'votes': votes}), content_type='application/json')
+            completed += response.status_code == 200
+        else:
+            for _ in category_ids:
+                response = send('wizard_submit', 'post', url, {'action': 'next', 'person_id': rng.choice(person_ids)})
+                if response.status_code != 302 or response.url != url:
+                    break
+                # Post/redirect/get: the browser loads the next step.
+                send('wizard_step', 'get', url)
+            completed += response.status_code == 302 and response.url == success_url
+
+        for _ in range(polls):
+            send('live_poll', 'get', live_url)
+
+    connections.close_all()
+    return samples, completed
+
+
+class Command(BaseCommand):
+    help = ('Load test the full voting flow: seed a scratch SQLite database, walk the vote wizard and poll '
+            'the live counter from several processes, and report latency, queries per request and ballots/s')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--voters',
+            type=int,
+            default=200,
+            help='Codes to generate, each votes once (default: 200)',
+        )
+        parser.add_argument(
+            '--persons',
+            type=int,
+            default=15,
+            help='Nominees to seed (default: 15)',
+        )
+        parser.add_argument(
+            '--categories',
+            type=int,
+            default=7,
+            help='Categories to seed (default: 7)',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=4,
+            help='Worker processes voting at the same time (default: 4)',
+        )
+        parser.add_argument(
+            '--polls',
+            type=int,
+            default=3,
+            help='Live counter polls per voter (default: 3)',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=MODES,
+            default='sequential',
+            help='Ballot mode to drive, see VOTING_BALLOT_MODE (default: sequential)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed for the nominee choices (default: 0)',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the report as JSON',
+        )
+        parser.add_argument(
+            '--output',
+            help='Also write the JSON report to this file',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON report of an earlier run to compare with; fails if queries per request went up',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            context = multiprocessing.get_context('fork')
+        except ValueError:
+            raise CommandError('The load test needs the fork start method, which this platform does not offer.')
+
+        report = self.run(context, options)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.write_table(report)
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                self.compare(report, json.load(f))
+
+    def run(self, context, options):
+        processes = options['processes']
+        with scratch_database(VOTING_BALLOT_MODE=options['mode']):
+            call_command('create_sample_data', codes=options['voters'], persons=options['persons'],
+                         categories=options['categories'], stdout=StringIO())
+            codes = list(VotingCode.objects.filter(is_active=True).values_list('code', flat=True))
+            person_ids = list(Person.objects.values_list('id', flat=True))
+            category_ids = list(Category.objects.filter(is_active=True).values_list('id', flat=True))
+
+            # Every worker has to open its own connection.
+            connections.close_all()
+            with context.Pool(processes) as pool:
+                started = time.perf_counter()
+                outcomes = pool.starmap(walk_ballots, [
+                    (codes[i::processes], person_ids, category_ids, options['mode'], options['polls'],
+                     options['seed'] + i)
+                    for i in range(processes)
+                ])
+                seconds = time.perf_counter() - started
+
+        samples = [sample for outcome in outcomes for sample in outcome[0]]
+        completed = sum(outcome[1] for outcome in outcomes)
+        endpoints = {}
+        for kind in sorted({sample[0] for sample in samples}):
+            matching = [sample for sample in samples if sample[0] == kind]
+            queries = [sample[2] for sample in matching]
+            endpoints[kind] = {
+                'requests': len(matching),
+                'errors': sum(1 for sample in matching if sample[3] >= 400),
+                **latency_summary(sample[1] for sample in matching),
+                'queries_per_request': round(sum(queries) / len(queries), 2),
+                'max_queries': max(queries),
+            }
+
+        return {
+            'meta': {
+                'started_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'sqlite_profile': getattr(settings, 'VOTING_SQLITE_PROFILE', None),
+            },
+            'config': {key: options[key] for key in
+                       ('voters', 'persons', 'categories', 'processes', 'polls', 'mode', 'seed')},
+            'seconds': round(seconds, 3),
+            'requests': len(samples),
+            'ballots': completed,
+            'failed_ballots': len(codes) - completed,
+            'ballots_per_second': round(completed / seconds, 1),
+            'endpoints': endpoints,
+        }
+
+    def write_table(self, report):
+        self.stdout.write(f"{report['ballots']} ballots ({report['failed_ballots']} failed) in "
+                          f"{report['seconds']:.2f}s: {report['ballots_per_second']:.1f} ballots/s")
+        self.stdout.write(f"{'endpoint':<14} {'requests':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                          f"{'queries':>8} {'errors':>7}")
+        for kind, result in report['endpoints'].items():
+            self.stdout.write(
+                f"{kind:<14} {result['requests']:>8} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                f"{result['p99_ms']:>8.1f} {result['queries_per_request']:>8.2f} {result['errors']:>7}"
+            )
+
+    def compare(self, report, baseline):
+        """Print the change against ``baseline``; latency is only reported, more queries fail the run."""
+        regressions = []
+        self.stdout.write(f"\n{'endpoint':<14} {'p95 ms':>16} {'queries':>16}")
+        for kind, result in report['endpoints'].items():
+            before = baseline.get('endpoints', {}).get(kind)
+            if before is None:
+                continue
+            self.stdout.write(
+                f"{kind:<14} {before['p95_ms']:>7.1f} → {result['p95_ms']:>6.1f} "
+                f"{before['queries_per_request']:>7.2f} → {result['queries_per_request']:>6.2f}"
+            )
+            if result['queries_per_request'] > before['queries_per_request']:
+                regressions.append(kind)
+        if regressions:
+            raise CommandError(f"More queries per request than the baseline: {', '.join(regressions)}")
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from voting import counters
+from voting.models import Category, Vote, VoteStatistics, update_vote_statistics
+
+
+class Command(BaseCommand):
+    help = 'Recompute the vote statistics and ballot counters from the Vote table or check them for drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only compare the stored counters with the Vote table, do not write anything',
+        )
+        parser.add_argument(
+            '--category',
+            type=int,
+            action='append',
+            dest='categories',
+            help='Limit to the category with this id (can be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        categories = Category.objects.all()
+        if options['categories']:
+            categories = categories.filter(id__in=options['categories'])
+
+        if options['check']:
+            mismatches = self.find_mismatches(categories)
+            for category_id, person_id, stored, expected in mismatches:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'Category {category_id}, person {person_id}: stored {stored}, expected {expected}'
+                    )
+                )
+            stored = counters.stored_values()
+            counter_mismatches = [
+                (name, stored.get(name, 0), expected)
+                for name, expected in counters.expected_values().items()
+                if stored.get(name, 0) != expected
+            ]
+            for name, stored_count, expected in counter_mismatches:
+                self.stdout.write(self.style.WARNING(f'Counter {name}: stored {stored_count}, expected {expected}'))
+            if mismatches or counter_mismatches:
+                raise CommandError(f'{len(mismatches) + len(counter_mismatches)} vote statistics are out of sync. '
+                                   f'Run this command without --check to rebuild them.')
+            self.stdout.write(self.style.SUCCESS('✓ Vote statistics are consistent'))
+            return
+
+        rebuilt = 0
+        for category in categories:
+            update_vote_statistics(category)
+            rebuilt += 1
+
+        counters.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt vote statistics for {rebuilt} categories and the ballot counters'))
+
+    def find_mismatches(self, categories):
+        expected = {
+            (row['category'], row['person']): row['count']
+            for row in Vote.objects.filter(category__in=categories)
+            .values('category', 'person').annotate(count=Count('id')).order_by()
+        }
+        stored = {
+            (category_id, person_id): vote_count
+            for category_id, person_id, vote_count in VoteStatistics.objects.filter(category__in=categories)
+            .values_list('category', 'person', 'vote_count')
+        }
+
+        mismatches = []
+        for key in sorted(expected.keys() | stored.keys()):
+            if expected.get(key, 0) != stored.get(key, 0):
+                mismatches.append((*key, stored.get(key, 0), expected.get(key, 0)))
+        return mismatches
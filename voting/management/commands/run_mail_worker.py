@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from voting.mail_dispatch import process_outbox
+from voting.mailgun_utils import mailgun_is_configured
+
+
+class Command(BaseCommand):
+    help = 'Send the invitation emails waiting in the outbox (run as many workers as you like)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit as soon as the outbox is empty instead of waiting for new emails',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait before looking again when the outbox is empty (default: 5)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Requests sent in parallel (default: MAILGUN_MAX_WORKERS)',
+        )
+
+    def handle(self, *args, **options):
+        if not mailgun_is_configured():
+            raise CommandError('Mailgun API key, domain, or URL not configured in settings.')
+
+        try:
+            while True:
+                claimed = process_outbox(options['concurrency'])
+                if claimed:
+                    self.stdout.write(f'Processed {claimed} emails')
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            # Emails claimed by an interrupted round are picked up again once their claim expires.
+            self.stdout.write('Stopped.')
+            return
+
+        self.stdout.write(self.style.SUCCESS('✓ Outbox is empty'))
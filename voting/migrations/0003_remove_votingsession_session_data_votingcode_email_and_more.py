@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0002_alter_person_options_person_first_name_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='votingsession',
+            name='session_data',
+        ),
+        migrations.AddField(
+            model_name='votingcode',
+            name='email',
+            field=models.EmailField(blank=True, help_text='Email this code was sent to, if any.', max_length=254, null=True),
+        ),
+        migrations.AddField(
+            model_name='votingsession',
+            name='pending_votes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='votingsession',
+            name='user_agent',
+            field=models.TextField(blank=True, max_length=500),
+        ),
+    ]
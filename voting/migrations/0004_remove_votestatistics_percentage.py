@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0003_remove_votingsession_session_data_votingcode_email_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='votestatistics',
+            name='percentage',
+        ),
+    ]
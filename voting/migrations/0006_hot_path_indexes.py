@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0005_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['category', 'person'], name='vote_category_person_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='votestatistics',
+            index=models.Index(fields=['category', '-vote_count'], name='votestats_category_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='votingsession',
+            index=models.Index(condition=models.Q(('is_completed', True)), fields=['is_completed'], name='votingsession_completed_idx'),
+        ),
+    ]
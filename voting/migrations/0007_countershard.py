@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+
+def seed_counters(apps, schema_editor):
+    # Existing ballots go into shard 0, new ones spread over all shards.
+    CounterShard = apps.get_model('voting', 'CounterShard')
+    VotingSession = apps.get_model('voting', 'VotingSession')
+
+    CounterShard.objects.create(name='ballots', shard=0, count=VotingSession.objects.filter(is_completed=True).count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0006_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('shard', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('name', 'shard')},
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
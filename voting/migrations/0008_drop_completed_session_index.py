@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0007_countershard'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='votingsession',
+            name='votingsession_completed_idx',
+        ),
+    ]
@@ -1,8 +1,14 @@
 from django.db import models
 from django.contrib.auth.models import User
 import uuid
+import secrets
 import string
-import random
+from functools import cached_property
+
+from . import code_lookup, images
+from .catalog import get_catalog
+
+CODE_ALPHABET = string.ascii_uppercase + string.digits
 
 
 class Person(models.Model):
@@ -42,6 +48,11 @@ class Category(models.Model):
     def __str__(self):
         return self.title
 
+    @cached_property
+    def responsive_image(self):
+        # Resized copies for srcset, see images.py. Computed once per catalog snapshot.
+        return images.responsive_image(self.image)
+
     class Meta:
         verbose_name_plural = "Categories"
         ordering = ['title']
@@ -65,16 +76,23 @@ class VotingCode(models.Model):
         return self.is_active and self.current_uses < self.max_uses
 
     def use_code(self):
-        if self.can_vote():
+        # Conditional UPDATE, so two ballots racing for the last use cannot both win.
+        from django.db.models import F
+        used = VotingCode.objects.filter(
+            pk=self.pk, is_active=True, current_uses__lt=F('max_uses')
+        ).update(current_uses=F('current_uses') + 1)
+        if used:
             self.current_uses += 1
-            self.save()
-            return True
-        return False
+        return bool(used)
+
+    @staticmethod
+    def random_code(length=8):
+        return ''.join(secrets.choice(CODE_ALPHABET) for _ in range(length))
 
     @classmethod
     def generate_code(cls, user, length=8, max_uses=2, email=None):
         while True:
-            code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
+            code = cls.random_code(length)
             if not cls.objects.filter(code=code).exists():
                 return cls.objects.create(
                     code=code,
@@ -83,8 +101,85 @@ class VotingCode(models.Model):
                     email=email
                 )
 
+    @classmethod
+    def generate_codes_bulk(cls, n, user, length=8, max_uses=2, emails=None, batch_size=500):
+        """
+        Create ``n`` new codes (or one per address in ``emails``) and return them.
+
+        Candidates are drawn in memory and checked against one fetch of all existing
+        codes, then inserted with INSERT ... ON CONFLICT IGNORE. Only candidates that
+        lost a race against a concurrent insert are drawn again.
+        """
+        from django.db import transaction
+        from django.utils import timezone
+
+        pending = list(emails) if emails is not None else [None] * n
+        taken = set(cls.objects.values_list('code', flat=True))
+        created = []
+
+        while pending:
+            candidates = {}
+            while len(candidates) < len(pending):
+                code = cls.random_code(length)
+                if code not in taken and code not in candidates:
+                    candidates[code] = pending[len(candidates)]
+            taken.update(candidates)
 
-class VotingSession(models.Model):
+            started = timezone.now()
+            with transaction.atomic():
+                cls.objects.bulk_create(
+                    [cls(code=code, created_by=user, max_uses=max_uses, email=email)
+                     for code, email in candidates.items()],
+                    batch_size=batch_size,
+                    ignore_conflicts=True
+                )
+
+            codes = list(candidates)
+            for start in range(0, len(codes), batch_size):
+                for voting_code in cls.objects.filter(code__in=codes[start:start + batch_size],
+                                                      created_by=user, created_at__gte=started):
+                    if candidates.get(voting_code.code, False) == voting_code.email:
+                        created.append(voting_code)
+                        del candidates[voting_code.code]
+
+            # Whatever is left collided with a code inserted in the meantime.
+            pending = list(candidates.values())
+
+        # bulk_create sends no post_save, so no receiver picks up the new codes.
+        code_lookup.invalidate()
+
+        if emails is not None:
+            order = {email: index for index, email in reversed(list(enumerate(emails)))}
+            created.sort(key=lambda voting_code: order[voting_code.email])
+        return created
+
+
+class BallotProgress:
+    """
+    Walking through the categories of a ballot. Shared by VotingSession and the
+    drafts kept outside the database (see drafts.py), which provide
+    ``current_category_index`` and ``pending_votes``.
+    """
+
+    @cached_property
+    def catalog(self):
+        # One snapshot per session object, so a request sees a consistent catalog.
+        return get_catalog()
+
+    def get_categories(self):
+        return list(self.catalog.categories)
+
+    def get_current_category(self):
+        categories = self.get_categories()
+        if 0 <= self.current_category_index < len(categories):
+            return categories[self.current_category_index]
+        return None
+
+    def is_final_category(self):
+        return self.current_category_index >= len(self.get_categories()) - 1
+
+
+class VotingSession(BallotProgress, models.Model):
 
     voting_code = models.ForeignKey(VotingCode, on_delete=models.CASCADE)
 
@@ -105,15 +200,6 @@ class VotingSession(models.Model):
         status = "Completed" if self.is_completed else f"Step {self.current_category_index + 1}"
         return f"Session for {self.voting_code.code} ({status})"
 
-    def get_categories(self):
-        return list(Category.objects.filter(is_active=True).order_by('title'))
-
-    def get_current_category(self):
-        categories = self.get_categories()
-        if 0 <= self.current_category_index < len(categories):
-            return categories[self.current_category_index]
-        return None
-
     def add_vote(self, category_id, person_id):
         self.pending_votes[str(category_id)] = person_id
         self.save(update_fields=['pending_votes', 'updated_at'])
@@ -127,35 +213,91 @@ class VotingSession(models.Model):
             self.current_category_index -= 1
             self.save(update_fields=['current_category_index', 'updated_at'])
 
-    def is_final_category(self):
-        return self.current_category_index >= len(self.get_categories()) - 1
+    async def aadd_vote(self, category_id, person_id):
+        self.pending_votes[str(category_id)] = person_id
+        await self.asave(update_fields=['pending_votes', 'updated_at'])
+
+    async def aadvance_category(self):
+        self.current_category_index += 1
+        await self.asave(update_fields=['current_category_index', 'updated_at'])
+
+    async def aregress_category(self):
+        if self.current_category_index > 0:
+            self.current_category_index -= 1
+            await self.asave(update_fields=['current_category_index', 'updated_at'])
+
+    @classmethod
+    def submit_ballot(cls, voting_code, votes, ip_address=None, user_agent=''):
+        """
+        Commit a ballot that was filled in on the client in one go. An existing
+        draft session of the code is reused, so the one-session-per-code rule holds.
+        """
+        session, created = cls.objects.get_or_create(
+            voting_code=voting_code,
+            defaults={'ip_address': ip_address, 'user_agent': user_agent[:500]}
+        )
+        if session.is_completed:
+            return False
+        session.pending_votes = {str(category_id): person_id for category_id, person_id in votes.items()}
+        return session.complete_voting()
+
+    @classmethod
+    async def asubmit_ballot(cls, voting_code, votes, ip_address=None, user_agent=''):
+        session, created = await cls.objects.aget_or_create(
+            voting_code=voting_code,
+            defaults={'ip_address': ip_address, 'user_agent': user_agent[:500]}
+        )
+        if session.is_completed:
+            return False
+        session.voting_code = voting_code
+        session.pending_votes = {str(category_id): person_id for category_id, person_id in votes.items()}
+        return await session.acomplete_voting()
+
+    async def acomplete_voting(self):
+        # The async ORM has no transactions, so the commit itself runs in a worker thread.
+        from asgiref.sync import sync_to_async
+        return await sync_to_async(self.complete_voting)()
 
     def complete_voting(self):
 
         from django.db import transaction
+        from . import counters
+        from .signals import ballot_completed
+        from .sqlite import write_transaction
 
-        all_categories = self.get_categories()
-        if self.is_completed or len(self.pending_votes) != len(all_categories):
+        category_ids = {str(category.id) for category in self.get_categories()}
+        if self.is_completed or set(self.pending_votes) != category_ids:
             return False
 
         try:
-            with transaction.atomic():
-                for category_id, person_id in self.pending_votes.items():
-                    Vote.objects.create(
-                        voting_code=self.voting_code,
+            # A fixed number of statements per ballot, however many categories there are.
+            # The write lock is taken up front, see sqlite.py.
+            with write_transaction():
+                if not self.voting_code.use_code():
+                    return False
+
+                Vote.objects.bulk_create([
+                    Vote(
+                        voting_code_id=self.voting_code_id,
                         category_id=category_id,
                         person_id=person_id,
                         ip_address=self.ip_address,
                         user_agent=self.user_agent
                     )
-
-                self.voting_code.use_code()
+                    for category_id, person_id in self.pending_votes.items()
+                ])
 
                 self.is_completed = True
-                self.save(update_fields=['is_completed', 'updated_at'])
+                self.save(update_fields=['is_completed', 'pending_votes', 'updated_at'])
+
+                # Counters are bumped in the same transaction as the votes, so
+                # a rolled back ballot never shows up in the statistics.
+                record_vote_statistics(self.pending_votes.items())
+                counters.increment(counters.BALLOTS)
 
-            for category in all_categories:
-                update_vote_statistics(category)
+                transaction.on_commit(
+                    lambda: ballot_completed.send(sender=VotingSession, session=self)
+                )
 
             return True
         except Exception:
@@ -179,36 +321,141 @@ class Vote(models.Model):
     class Meta:
         unique_together = ['voting_code', 'category']
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['category', 'person'], name='vote_category_person_idx')]
+
+
+def record_vote_statistics(votes):
+    """
+    Apply a +1 delta to the VoteStatistics counter of every (category_id, person_id)
+    pair of a finished ballot. A ballot holds at most one vote per category, so
+    every pair is distinct and two statements suffice regardless of its size:
+    one INSERT that creates missing counters and one UPDATE that increments them.
+    """
+    from django.db.models import F, Q
+    from django.utils import timezone
+
+    pairs = {(int(category_id), int(person_id)) for category_id, person_id in votes}
+    if not pairs:
+        return
+
+    VoteStatistics.objects.bulk_create(
+        [VoteStatistics(category_id=category_id, person_id=person_id, vote_count=0)
+         for category_id, person_id in pairs],
+        ignore_conflicts=True
+    )
+
+    matching = Q()
+    for category_id, person_id in pairs:
+        matching |= Q(category_id=category_id, person_id=person_id)
+    VoteStatistics.objects.filter(matching).update(
+        vote_count=F('vote_count') + 1,
+        last_updated=timezone.now()
+    )
 
 
 def update_vote_statistics(category):
+    """Recompute the VoteStatistics of a category from scratch out of the Vote table."""
+    from django.db import transaction
     from django.db.models import Count
-    votes = Vote.objects.filter(category=category).values('person').annotate(count=Count('person'))
-    total_votes = Vote.objects.filter(category=category).count()
-    VoteStatistics.objects.filter(category=category).delete()
-    for vote_data in votes:
-        person_id = vote_data['person']
-        vote_count = vote_data['count']
-        percentage = (vote_count / total_votes * 100) if total_votes > 0 else 0
-
-        VoteStatistics.objects.create(
-            category=category,
-            person_id=person_id,
-            vote_count=vote_count,
-            percentage=round(percentage, 2)
-        )
+
+    votes = Vote.objects.filter(category=category).values('person').annotate(count=Count('id')).order_by()
+    with transaction.atomic():
+        VoteStatistics.objects.filter(category=category).delete()
+        VoteStatistics.objects.bulk_create([
+            VoteStatistics(category=category, person_id=vote_data['person'], vote_count=vote_data['count'])
+            for vote_data in votes
+        ])
+
+
+class VoteStatisticsQuerySet(models.QuerySet):
+
+    def with_category_totals(self):
+        """Annotate each row with the number of votes cast in its category."""
+        from django.db.models import OuterRef, Subquery, Sum
+
+        totals = (VoteStatisticsQuerySet(self.model)
+                  .filter(category=OuterRef('category'))
+                  .order_by()
+                  .values('category')
+                  .annotate(total=Sum('vote_count'))
+                  .values('total'))
+        return self.annotate(category_total=Subquery(totals))
+
+
+class VoteStatisticsManager(models.Manager.from_queryset(VoteStatisticsQuerySet)):
+    """Every row comes with its ``category_total``, so ``percentage`` never needs a query of its own."""
+
+    def get_queryset(self):
+        return super().get_queryset().with_category_totals()
 
 
 class VoteStatistics(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     person = models.ForeignKey(Person, on_delete=models.CASCADE)
     vote_count = models.IntegerField(default=0)
-    percentage = models.FloatField(default=0.0)
     last_updated = models.DateTimeField(auto_now=True)
 
+    objects = VoteStatisticsManager()
+
     def __str__(self):
         return f"{self.person.name} in {self.category.title}: {self.vote_count} votes ({self.percentage}%)"
 
+    @property
+    def percentage(self):
+        # Derived on read, so a new ballot only has to touch its own counters. Rows
+        # not loaded through the manager (e.g. just created) have no total yet.
+        total = getattr(self, 'category_total', None)
+        return round(self.vote_count / total * 100, 2) if total else 0
+
     class Meta:
         unique_together = ['category', 'person']
-        ordering = ['-vote_count']
\ No newline at end of file
+        ordering = ['-vote_count']
+        indexes = [models.Index(fields=['category', '-vote_count'], name='votestats_category_count_idx')]
+
+
+class CounterShard(models.Model):
+    """One stripe of a striped counter (see counters.py)"""
+    name = models.CharField(max_length=50)
+    shard = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}[{self.shard}]: {self.count}"
+
+    class Meta:
+        unique_together = ['name', 'shard']
+
+
+class OutboxEmail(models.Model):
+    """An invitation email waiting to be sent by the mail worker (see mail_dispatch.py)"""
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    job_id = models.CharField(max_length=32, db_index=True)
+    voting_code = models.ForeignKey(VotingCode, on_delete=models.CASCADE, related_name='outbox_emails')
+    email = models.EmailField(max_length=254)
+    subject = models.CharField(max_length=255)
+    template_name = models.CharField(max_length=100)
+    template_variables = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    claim_token = models.CharField(max_length=32, blank=True, db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.email} ({self.status})"
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['status', 'claimed_at'])]
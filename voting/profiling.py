@@ -0,0 +1,238 @@
+"""
+Opt-in request profiling: where the time of a request goes, per view.
+
+ProfilingMiddleware samples VOTING_PROFILING_SAMPLE_RATE of all requests. For
+each sampled request it records:
+- wall time;
+- number and time of the database queries, counted by an execute wrapper on
+  every connection;
+- template render time, taken by the ProfilingDjangoTemplates backend;
+- response size.
+
+The samples go into an in-process ring buffer of the last
+VOTING_PROFILING_BUFFER_SIZE requests. /api/profiling/ returns p50/p95
+aggregates of the buffer as JSON and /api/profiling/metrics/ in the Prometheus
+text format. Each process has its own buffer.
+
+The current profile lives in a context variable, which asgiref copies into the
+threads that run sync code for async views. Queries and renders are therefore
+attributed to the right request under WSGI and ASGI alike. Unsampled requests
+only pay for one ContextVar lookup per query and render.
+"""
+import contextvars
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+# Aggregated per view: name in the reports, attribute of a sample.
+METRICS = [
+    ('request_seconds', 'seconds'),
+    ('db_queries', 'queries'),
+    ('db_seconds', 'query_seconds'),
+    ('template_seconds', 'template_seconds'),
+    ('response_bytes', 'response_bytes'),
+]
+QUANTILES = [0.5, 0.95]
+
+_current = contextvars.ContextVar('voting_profile', default=None)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    return sorted_values[max(math.ceil(fraction * len(sorted_values)) - 1, 0)]
+
+
+class Profile:
+    """Measurements of one sampled request."""
+
+    __slots__ = ('view', 'status', 'seconds', 'queries', 'query_seconds', 'template_seconds',
+                 'response_bytes', 'rendering')
+
+    def __init__(self):
+        self.view = None
+        self.status = None
+        self.seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+        self.response_bytes = 0
+        self.rendering = False
+
+
+class Recorder:
+    """Ring buffer of the latest profiles plus running totals per view."""
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            self.samples.append(profile)
+            count, seconds = self.totals.get(profile.view, (0, 0.0))
+            self.totals[profile.view] = (count + 1, seconds + profile.seconds)
+
+    def clear(self):
+        with self._lock:
+            self.samples.clear()
+            self.totals.clear()
+
+    def summary(self):
+        """Per view: sampled requests in the buffer and p50/p95 of every metric."""
+        with self._lock:
+            samples = list(self.samples)
+            totals = dict(self.totals)
+
+        by_view = {}
+        for profile in samples:
+            by_view.setdefault(profile.view, []).append(profile)
+
+        views = {}
+        for view, profiles in sorted(by_view.items()):
+            count, seconds = totals.get(view, (len(profiles), 0.0))
+            views[view] = {
+                'samples': len(profiles),
+                'errors': sum(1 for profile in profiles if profile.status >= 500),
+                'total_count': count,
+                'total_seconds': round(seconds, 6),
+            }
+            for name, attribute in METRICS:
+                values = sorted(getattr(profile, attribute) for profile in profiles)
+                for quantile in QUANTILES:
+                    views[view][f'{name}_p{int(quantile * 100)}'] = round(percentile(values, quantile), 6)
+        return views
+
+
+recorder = Recorder(getattr(settings, 'VOTING_PROFILING_BUFFER_SIZE', 1000))
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, 'VOTING_PROFILING_SAMPLE_RATE', 0)
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+        self.slow_request = getattr(settings, 'VOTING_PROFILING_SLOW_REQUEST', None)
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profile, token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+
+        profile, token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile)
+
+    def start(self):
+        profile = Profile()
+        profile.seconds = time.perf_counter()
+        return profile, _current.set(profile)
+
+    def finish(self, request, response, profile):
+        profile.seconds = time.perf_counter() - profile.seconds
+        match = getattr(request, 'resolver_match', None)
+        profile.view = match.view_name if match else 'unresolved'
+        profile.status = response.status_code
+        if not response.streaming:
+            profile.response_bytes = len(response.content)
+        recorder.add(profile)
+
+        if self.slow_request is not None and profile.seconds >= self.slow_request:
+            logger.warning(f"Slow request to {profile.view}: {profile.seconds * 1000:.0f} ms, "
+                           f"{profile.queries} queries in {profile.query_seconds * 1000:.0f} ms, "
+                           f"templates {profile.template_seconds * 1000:.0f} ms")
+        return response
+
+
+def record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries += 1
+        profile.query_seconds += time.perf_counter() - started
+
+
+def install_query_wrapper(connection):
+    """Count the queries of ``connection`` for profiled requests; done for every new connection in signals.py."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ProfilingTemplate(Template):
+
+    def render(self, context=None, request=None):
+        profile = _current.get()
+        if profile is None or profile.rendering:
+            return super().render(context, request)
+        # Only the outermost render counts, templates rendered inside it are part of it.
+        profile.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_seconds += time.perf_counter() - started
+            profile.rendering = False
+
+
+class ProfilingDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render times recorded for ProfilingMiddleware."""
+
+    def from_string(self, template_code):
+        return ProfilingTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return ProfilingTemplate(template.template, self)
+
+
+def prometheus_text():
+    """The summary in the Prometheus text exposition format."""
+    views = recorder.summary()
+    lines = []
+    for name, attribute in METRICS:
+        metric = f'voting_{name}'
+        lines.append(f'# HELP {metric} {name.replace("_", " ").capitalize()} of the sampled requests per view.')
+        lines.append(f'# TYPE {metric} summary')
+        for view, data in views.items():
+            for quantile in QUANTILES:
+                value = data[f'{name}_p{int(quantile * 100)}']
+                lines.append(f'{metric}{{view="{view}",quantile="{quantile}"}} {value}')
+            if name == 'request_seconds':
+                lines.append(f'{metric}_count{{view="{view}"}} {data["total_count"]}')
+                lines.append(f'{metric}_sum{{view="{view}"}} {data["total_seconds"]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,65 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from . import catalog, code_lookup, images, live, profiling, sqlite
+from .models import Category, Person, VotingCode
+
+# Sent after the transaction of a completed ballot has been committed.
+# Arguments: session (the completed VotingSession).
+ballot_completed = Signal()
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_catalog(sender, **kwargs):
+    catalog.invalidate('category')
+
+
+@receiver(pre_save, sender=Category)
+def remember_category_image(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._previous_image = Category.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Category)
+def update_category_image_derivatives(sender, instance, raw=False, **kwargs):
+    previous, current = getattr(instance, '_previous_image', None) or '', instance.image.name or ''
+    if raw or previous == current:
+        return
+    if previous:
+        images.delete(previous)
+    if current:
+        images.generate_quietly(current)
+
+
+@receiver(post_delete, sender=Category)
+def delete_category_image_derivatives(sender, instance, **kwargs):
+    if instance.image:
+        images.delete(instance.image.name)
+
+
+@receiver([post_save, post_delete], sender=Person)
+def invalidate_person_catalog(sender, **kwargs):
+    catalog.invalidate('person')
+
+
+@receiver([post_save, post_delete], sender=VotingCode)
+def invalidate_code_filter(sender, **kwargs):
+    code_lookup.invalidate()
+
+
+@receiver(ballot_completed)
+def push_live_counter(sender, **kwargs):
+    live.shared_total.increment()
+    live.counter.increment()
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    sqlite.configure_connection(connection)
+
+
+@receiver(connection_created)
+def profile_connection_queries(sender, connection, **kwargs):
+    # On every connection, so switching profiling on needs no new connections.
+    profiling.install_query_wrapper(connection)
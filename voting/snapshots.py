@@ -0,0 +1,90 @@
+"""
+Per-process snapshots of data that is read on every request but rarely changes,
+such as the voting catalog (catalog.py) and the filter of active codes
+(code_lookup.py).
+
+A snapshot is built once per process and shared by its threads. It is tagged
+with the version keys it was built for, which live in the Django cache.
+Whoever changes the underlying data calls invalidate(), which bumps them; each
+process compares its snapshot's versions with the cache on use and rebuilds
+once they differ, so all workers sharing the cache invalidate together. A
+process that never sees the bump, because every worker has its own cache (the
+default LocMemCache), still rebuilds after MAX_AGE seconds.
+"""
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Seconds after which a process rebuilds a snapshot even without a new version.
+MAX_AGE = 60
+
+
+class VersionedSnapshot:
+    """
+    The value returned by ``build(versions)``, rebuilt when one of the cached
+    ``version_keys`` changed or the value is older than ``max_age`` seconds.
+    """
+
+    def __init__(self, version_keys, build, max_age=MAX_AGE):
+        self.version_keys = tuple(version_keys)
+        self.build = build
+        self.max_age = max_age
+        # (versions, built_at, value), replaced as a whole so readers need no lock.
+        self._state = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        versions = self.current_versions()
+        state = self._state
+        if self._is_stale(state, versions):
+            with self._lock:
+                state = self._state
+                if self._is_stale(state, versions):
+                    built_at = time.monotonic()
+                    state = self._state = (versions, built_at, self.build(versions))
+        return state[2]
+
+    async def aget(self):
+        """get() for async views: only a rebuild leaves the event loop."""
+        from asgiref.sync import sync_to_async
+
+        state = self._state
+        if not self._is_stale(state, self.current_versions()):
+            return state[2]
+        return await sync_to_async(self.get)()
+
+    def invalidate(self, *keys):
+        """
+        Make every process rebuild, after the data behind ``keys`` (default: all
+        version keys) changed.
+
+        The versions are bumped right away for this process and once more after
+        the surrounding transaction commits, so no other process can pair the
+        new version with data it read before the change was visible.
+        """
+        keys = keys or self.version_keys
+
+        def bump():
+            cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+        bump()
+        transaction.on_commit(bump)
+
+    def expire(self):
+        """Rebuild this process's snapshot on next use, e.g. once it turned out to be outdated."""
+        self._state = None
+
+    def current_versions(self):
+        versions = cache.get_many(self.version_keys)
+        for key in self.version_keys:
+            if key not in versions:
+                # First use or evicted: agree on one fresh version across processes.
+                cache.add(key, uuid.uuid4().hex, None)
+                versions[key] = cache.get(key)
+        return tuple(versions[key] for key in self.version_keys)
+
+    def _is_stale(self, state, versions):
+        return state is None or state[0] != versions or time.monotonic() - state[1] > self.max_age
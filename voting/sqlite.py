@@ -0,0 +1,71 @@
+"""
+SQLite tuning for concurrent ballots.
+
+Every new SQLite connection gets the PRAGMAs of the profile named by the
+VOTING_SQLITE_PROFILE setting (or the PRAGMAs given there as a dict):
+
+- journal_mode=WAL lets readers continue while a ballot is being written,
+- busy_timeout makes a writer wait for the lock instead of failing with
+  "database is locked",
+- synchronous=NORMAL syncs the WAL at checkpoints instead of every commit,
+- cache_size, mmap_size and temp_store keep hot pages and temp tables in memory.
+
+Ballots are committed in write_transaction(), which starts the transaction
+with BEGIN IMMEDIATE. A deferred transaction that reads first and writes later
+cannot wait for the write lock once another connection has committed in
+between; SQLite fails it right away, whatever the busy_timeout.
+"""
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+PROFILES = {
+    'production': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,  # 64 MB
+        'mmap_size': 268435456,  # 256 MB
+        'temp_store': 'MEMORY',
+    },
+}
+
+
+def get_pragmas():
+    profile = getattr(settings, 'VOTING_SQLITE_PROFILE', None)
+    if isinstance(profile, dict):
+        return profile
+    return PROFILES.get(profile, {})
+
+
+def configure_connection(connection):
+    """Apply the PRAGMAs of the configured profile to a new connection (see signals.py)."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = get_pragmas()
+    if pragmas:
+        with connection.cursor() as cursor:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@contextmanager
+def write_transaction(using=None):
+    """transaction.atomic() that takes SQLite's write lock up front (BEGIN IMMEDIATE)."""
+    connection = transaction.get_connection(using)
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    # Connecting resets transaction_mode from the settings, so connect first.
+    connection.ensure_connection()
+    previous = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            connection.transaction_mode = previous
+            yield
+    finally:
+        connection.transaction_mode = previous
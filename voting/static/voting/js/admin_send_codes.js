@@ -0,0 +1,33 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const panel = document.getElementById('dispatch-progress');
+
+    async function updateProgress() {
+        const response = await fetch(panel.dataset.url);
+        if (!response.ok) {
+            return;
+        }
+        const data = await response.json();
+        const total = data.total || 1;
+        document.getElementById('dispatch-sent').textContent = data.sent;
+        document.getElementById('dispatch-failed').textContent = data.failed;
+        document.getElementById('dispatch-pending').textContent = data.pending;
+        document.getElementById('dispatch-sent-bar').style.width = (100 * data.sent / total) + '%';
+        document.getElementById('dispatch-failed-bar').style.width = (100 * data.failed / total) + '%';
+
+        const errors = document.getElementById('dispatch-errors');
+        errors.innerHTML = '';
+        data.recipients.filter(r => r.status === 'failed').forEach(function(recipient) {
+            const item = document.createElement('li');
+            item.textContent = recipient.email + ': ' + recipient.error;
+            errors.appendChild(item);
+        });
+
+        if (data.finished) {
+            document.getElementById('dispatch-spinner').className = 'fas fa-check-circle me-2 text-success';
+        } else {
+            setTimeout(updateProgress, 1500);
+        }
+    }
+
+    updateProgress();
+});
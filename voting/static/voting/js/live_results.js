@@ -0,0 +1,57 @@
+const counterOptions = document.currentScript.dataset;
+
+document.addEventListener('DOMContentLoaded', function() {
+    const counterElement = document.getElementById('total-votes-counter');
+    const apiUrl = counterOptions.apiUrl;
+    const streamUrl = counterOptions.streamUrl;
+    let pollTimer = null;
+
+    console.log("Live counter script started. Stream URL is:", streamUrl || 'none, polling');
+
+    async function fetchAndUpdateCounter() {
+        try {
+            console.log("Sending API request to", apiUrl);
+            const response = await fetch(apiUrl);
+
+            if (!response.ok) {
+                console.error('API response was not ok. Status:', response.status);
+                counterElement.textContent = "ERR"; // Show an error directly on the page
+                return;
+            }
+
+            const data = await response.json();
+            console.log("Data received successfully:", data);
+
+            // Update the counter directly, without animation
+            counterElement.textContent = data.total_votes;
+
+        } catch (error) {
+            console.error('Error fetching API data:', error);
+            counterElement.textContent = "ERR"; // Show an error directly on the page
+        }
+    }
+
+    function startPolling() {
+        if (pollTimer === null) {
+            fetchAndUpdateCounter();
+            pollTimer = setInterval(fetchAndUpdateCounter, 2000);
+        }
+    }
+
+    // Polling unless the server says it can push updates (ASGI with VOTING_LIVE_STREAM).
+    if (!streamUrl || !window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    // Pushed updates; falls back to polling if the stream breaks.
+    const source = new EventSource(streamUrl);
+    source.onmessage = function(event) {
+        counterElement.textContent = JSON.parse(event.data).total_votes;
+    };
+    source.onerror = function() {
+        console.warn('Live stream unavailable, falling back to polling.');
+        source.close();
+        startPolling();
+    };
+});
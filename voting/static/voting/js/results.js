@@ -0,0 +1,74 @@
+// Animate progress bars on page load
+document.addEventListener('DOMContentLoaded', function() {
+    const progressBars = document.querySelectorAll('.progress-bar');
+    progressBars.forEach(bar => {
+        const width = bar.style.width;
+        bar.style.width = '0%';
+        setTimeout(() => {
+            bar.style.width = width;
+        }, 100);
+    });
+});
+
+// Refresh the tables every 30 seconds from the leaderboard API instead of reloading the page
+const leaderboardUrl = document.currentScript.dataset.leaderboardUrl;
+const rankStyles = [
+    ['bg-warning', 'bg-warning', '<i class="fas fa-crown"></i> 1st'],
+    ['bg-secondary', 'bg-secondary', '<i class="fas fa-medal"></i> 2nd'],
+    ['bg-dark', 'bg-dark', '<i class="fas fa-award"></i> 3rd'],
+];
+
+function escapeHtml(text) {
+    const element = document.createElement('span');
+    element.textContent = text;
+    return element.innerHTML;
+}
+
+function renderResults(category) {
+    if (!category.results.length) {
+        return '<div class="text-center py-4">' +
+            '<i class="fas fa-vote-yea fa-3x text-muted mb-3"></i>' +
+            '<h6 class="text-muted">No votes in this category yet</h6>' +
+            '<p class="text-muted small">As soon as votes are cast, the results will appear here.</p>' +
+            '</div>';
+    }
+    const rows = category.results.map(function(result) {
+        const [badge, bar, label] = rankStyles[result.rank - 1] || ['bg-light text-dark', 'bg-primary', result.rank + 'th'];
+        return '<tr>' +
+            '<td><span class="badge ' + badge + '">' + label + '</span></td>' +
+            '<td><strong>' + escapeHtml(result.person) + '</strong></td>' +
+            '<td><span class="badge bg-primary">' + result.vote_count + '</span></td>' +
+            '<td><span class="fw-bold">' + result.percentage + '%</span></td>' +
+            '<td><div class="progress"><div class="progress-bar ' + bar + '" role="progressbar" ' +
+            'style="width: ' + result.percentage + '%; animation: none" aria-valuenow="' + result.percentage + '" ' +
+            'aria-valuemin="0" aria-valuemax="100"></div></div></td>' +
+            '</tr>';
+    }).join('');
+    return '<div class="results-table"><div class="table-responsive"><table class="table table-hover">' +
+        '<thead class="table-light"><tr><th width="10%">Rank</th><th width="30%">Name</th>' +
+        '<th width="15%">Votes</th><th width="15%">Percentage</th><th></th></tr></thead>' +
+        '<tbody>' + rows + '</tbody></table></div></div>';
+}
+
+async function refreshResults() {
+    try {
+        const response = await fetch(leaderboardUrl);
+        if (!response.ok) {
+            return;
+        }
+        const data = await response.json();
+        data.categories.forEach(function(category) {
+            const card = document.querySelector('[data-category-id="' + category.id + '"]');
+            if (!card) {
+                return;
+            }
+            card.querySelector('[data-total]').textContent =
+                'Total: ' + category.total_votes + ' vote' + (category.total_votes === 1 ? '' : 's');
+            card.querySelector('[data-results]').innerHTML = renderResults(category);
+        });
+    } catch (error) {
+        console.error('Error refreshing results:', error);
+    }
+}
+
+setInterval(refreshResults, 30000);
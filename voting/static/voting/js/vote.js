@@ -0,0 +1,82 @@
+// Code entry redirection
+document.addEventListener('DOMContentLoaded', function() {
+    // Find the form by its ID
+    const codeForm = document.getElementById('code-entry-form');
+
+    // Make sure the form exists on the current page (only if no code is present)
+    if (codeForm) {
+        codeForm.addEventListener('submit', function(event) {
+            event.preventDefault();
+
+            const codeInput = document.getElementById('code-input');
+            const code = codeInput.value.trim(); // .trim() removes whitespace from the beginning/end
+
+            if (code) {
+                // Note the trailing slash, which is often important in Django!
+                window.location.href = `/vote/${code}/`;
+            }
+        });
+    }
+});
+
+// Voting functions
+function selectCategory(categoryId) {
+    document.getElementById('category' + categoryId).checked = true;
+
+    document.getElementById('personSelection').style.display = 'block';
+
+    document.getElementById('personSelection').scrollIntoView({ behavior: 'smooth' });
+
+    checkFormCompletion();
+}
+
+function selectPerson(personId) {
+    document.getElementById('person' + personId).checked = true;
+
+    document.getElementById('submitSection').style.display = 'block';
+
+    document.getElementById('submitSection').scrollIntoView({ behavior: 'smooth' });
+
+    checkFormCompletion();
+}
+
+function checkFormCompletion() {
+    const categorySelected = document.querySelector('input[name="category"]:checked');
+    const personSelected = document.querySelector('input[name="person"]:checked');
+    const submitBtn = document.getElementById('submitBtn');
+
+    if (categorySelected && personSelected) {
+        submitBtn.disabled = false;
+        submitBtn.classList.add('pulse');
+    } else {
+        submitBtn.disabled = true;
+        submitBtn.classList.remove('pulse');
+    }
+}
+
+// Add pulse animation for submit button
+document.addEventListener('DOMContentLoaded', function() {
+    const style = document.createElement('style');
+    style.textContent = `
+        .pulse {
+            animation: pulse 1.5s infinite;
+        }
+        @keyframes pulse {
+            0% { transform: scale(1); }
+            50% { transform: scale(1.05); }
+            100% { transform: scale(1); }
+        }
+    `;
+    document.head.appendChild(style);
+});
+
+// Form validation
+document.getElementById('voteForm')?.addEventListener('submit', function(e) {
+    const categorySelected = document.querySelector('input[name="category"]:checked');
+    const personSelected = document.querySelector('input[name="person"]:checked');
+
+    if (!categorySelected || !personSelected) {
+        e.preventDefault();
+        alert('Please select both a category and a person.');
+    }
+});
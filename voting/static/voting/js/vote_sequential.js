@@ -0,0 +1,42 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const personSelect = document.getElementById('person_select');
+    const submitBtn = document.getElementById('submit-btn');
+    const votingForm = document.querySelector('.voting-form');
+
+    function updateSubmitButtonState() {
+        if (personSelect.value) {
+            submitBtn.disabled = false;
+            if (!submitBtn.classList.contains('btn-success')) {
+                submitBtn.classList.add('pulse-animation');
+            }
+        } else {
+            submitBtn.disabled = true;
+            submitBtn.classList.remove('pulse-animation');
+        }
+    }
+
+    personSelect.addEventListener('change', updateSubmitButtonState);
+
+    updateSubmitButtonState();
+
+    votingForm.addEventListener('submit', function(e) {
+        const submitter = e.submitter;
+
+        if (submitter && submitter.name === 'action' && submitter.value === 'next') {
+            if (!personSelect.value) {
+                e.preventDefault();
+
+                personSelect.classList.add('is-invalid');
+                setTimeout(() => {
+                    personSelect.classList.remove('is-invalid');
+                }, 500);
+
+                personSelect.focus();
+            }
+        }
+    });
+
+    setTimeout(() => {
+        personSelect.focus();
+    }, 300);
+});
@@ -0,0 +1,138 @@
+// The code and the submit URL come from data attributes of the <script> tag.
+const ballotOptions = document.currentScript.dataset;
+
+document.addEventListener('DOMContentLoaded', function() {
+    const catalog = JSON.parse(document.getElementById('ballot-catalog').textContent);
+    const code = ballotOptions.code;
+    const submitUrl = ballotOptions.submitUrl;
+    const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+    // The draft only lives in the browser; a reload of the tab keeps it.
+    const draftKey = 'ballot:' + code + ':' + catalog.version;
+    const draft = JSON.parse(sessionStorage.getItem(draftKey) || '{"index": 0, "votes": {}}');
+
+    const personSelect = document.getElementById('person_select');
+    const submitBtn = document.getElementById('submit-btn');
+    const backBtn = document.getElementById('back-btn');
+    const errorBox = document.getElementById('ballot-error');
+    const stepper = document.getElementById('stepper');
+
+    catalog.persons.forEach(function(person) {
+        personSelect.add(new Option(person.name, person.id));
+    });
+
+    catalog.categories.forEach(function(category, i) {
+        const item = document.createElement('div');
+        item.className = 'stepper-item';
+        item.innerHTML = '<div class="step-counter"></div><div class="step-name"></div>';
+        const name = category.title.length > 15 ? category.title.slice(0, 14) + '…' : category.title;
+        item.querySelector('.step-name').textContent = name;
+        stepper.appendChild(item);
+    });
+
+    function isFinal() {
+        return draft.index >= catalog.categories.length - 1;
+    }
+
+    function render() {
+        const category = catalog.categories[draft.index];
+        document.getElementById('current-step').textContent = draft.index + 1;
+        document.getElementById('category-title').textContent = category.title;
+        document.getElementById('category-description').textContent = category.description;
+
+        const imageWrapper = document.getElementById('category-image-wrapper');
+        const image = document.getElementById('category-image');
+        if (category.image) {
+            // Set the srcsets before src, so the browser fetches only the copy it picks.
+            document.getElementById('category-image-webp').srcset = category.image_srcset.webp;
+            image.srcset = category.image_srcset.jpeg;
+            image.src = category.image;
+            image.alt = category.title;
+            imageWrapper.classList.remove('d-none');
+        } else {
+            imageWrapper.classList.add('d-none');
+        }
+
+        Array.from(stepper.children).forEach(function(item, i) {
+            item.classList.toggle('completed', i < draft.index);
+            item.classList.toggle('active', i === draft.index);
+            item.querySelector('.step-counter').innerHTML = i < draft.index ? '<i class="fas fa-check"></i>' : i + 1;
+        });
+
+        personSelect.value = draft.votes[category.id] || '';
+        backBtn.classList.toggle('invisible', draft.index === 0);
+        document.getElementById('final-hint').classList.toggle('d-none', !isFinal());
+        document.getElementById('submit-label').textContent = isFinal() ? 'Complete Vote' : 'Next';
+        document.getElementById('submit-icon').className = isFinal() ? 'fas fa-check-double ms-2' : 'fas fa-arrow-right ms-2';
+        submitBtn.classList.toggle('btn-success', isFinal());
+        submitBtn.classList.toggle('btn-primary', !isFinal());
+        submitBtn.disabled = !personSelect.value;
+        personSelect.focus();
+    }
+
+    function saveDraft() {
+        sessionStorage.setItem(draftKey, JSON.stringify(draft));
+    }
+
+    function showError(message) {
+        errorBox.querySelector('span').textContent = message;
+        errorBox.classList.remove('d-none');
+    }
+
+    async function submitBallot() {
+        submitBtn.disabled = true;
+        try {
+            const response = await fetch(submitUrl, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json', 'X-CSRFToken': csrfToken},
+                body: JSON.stringify({code: code, votes: draft.votes}),
+            });
+            const data = await response.json();
+            if (data.ok) {
+                sessionStorage.removeItem(draftKey);
+                window.location.href = data.redirect;
+                return;
+            }
+            showError(data.error);
+        } catch (error) {
+            showError('Fehler beim Abschließen der Abstimmung.');
+        }
+        submitBtn.disabled = false;
+    }
+
+    personSelect.addEventListener('change', function() {
+        submitBtn.disabled = !personSelect.value;
+    });
+
+    backBtn.addEventListener('click', function() {
+        if (draft.index > 0) {
+            draft.index -= 1;
+            saveDraft();
+            render();
+        }
+    });
+
+    document.querySelector('.voting-form').addEventListener('submit', function(e) {
+        e.preventDefault();
+        if (!personSelect.value) {
+            personSelect.classList.add('is-invalid');
+            setTimeout(() => personSelect.classList.remove('is-invalid'), 500);
+            return;
+        }
+        draft.votes[catalog.categories[draft.index].id] = parseInt(personSelect.value, 10);
+        if (isFinal()) {
+            saveDraft();
+            submitBallot();
+        } else {
+            draft.index += 1;
+            saveDraft();
+            render();
+        }
+    });
+
+    if (draft.index >= catalog.categories.length) {
+        draft.index = 0;
+    }
+    if (catalog.categories.length) {
+        render();
+    }
+});
@@ -0,0 +1,188 @@
+"""
+Static files: fingerprinted names, precompressed copies and long caching.
+
+The pages used to carry their CSS and JavaScript inline and pulled Bootstrap
+and Font Awesome from CDNs, so every wizard step sent the same styles again.
+They now live in voting/static/voting/ and are built by collectstatic:
+
+- CompressedManifestStaticFilesStorage adds a hash of the content to every
+  name (bootstrap.min.3f2a….css) and writes a .gz copy next to each text file,
+  plus a .br copy if the brotli package is installed.
+- StaticFilesMiddleware serves STATIC_ROOT without a web server in front:
+  the .br or .gz copy if the browser accepts it, and hashed names with a
+  Cache-Control of VOTING_STATIC_MAX_AGE and ``immutable``. A changed file
+  gets a new name, so browsers never have to ask again; repeat wizard steps
+  only transfer the HTML.
+
+Bootstrap and Font Awesome are served from voting/static/voting/vendor/.
+collectstatic downloads the files missing there first (manage.py
+fetch_vendor_assets --missing); they are not part of the repository. Without
+them, e.g. after collectstatic --no-fetch-vendor, the pages link the CDN
+copies instead (see the vendor_static template tag).
+"""
+import gzip
+import mimetypes
+import os
+import re
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils._os import safe_join
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Extensions worth compressing; images and woff2 fonts are compressed already.
+COMPRESSIBLE = ('.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.eot', '.otf')
+MIN_COMPRESS_SIZE = 256
+# Content-Encoding: suffix of the precompressed copy, in order of preference.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# Package: CDN base URL and the files the pages link to. Files they reference
+# themselves (fonts in CSS) are found by fetch_vendor_assets.
+VENDOR_PACKAGES = {
+    'bootstrap': ('https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/',
+                  ['css/bootstrap.min.css', 'js/bootstrap.bundle.min.js']),
+    'fontawesome': ('https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/',
+                    ['css/all.min.css']),
+}
+VENDOR_DIR = 'voting/vendor'
+
+
+def vendor_path(package, file_name):
+    return f'{VENDOR_DIR}/{package}/{file_name}'
+
+
+def vendor_cdn_url(package, file_name):
+    return VENDOR_PACKAGES[package][0] + file_name
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def stored_name(self, name):
+        # Before the first collectstatic there is no manifest: link the plain names instead of failing every page.
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set(paths)
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name:
+                names.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE):
+                self.compress(name)
+
+    def compress(self, name):
+        """Write the .gz (and .br) copy of ``name``; copies that would not be smaller are left out."""
+        with self.open(name) as f:
+            content = f.read()
+        compressors = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            compressors.append(('.br', lambda data: brotli.compress(data, quality=11)))
+
+        for suffix, compressor in compressors:
+            compressed_name = name + suffix
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            if len(content) < MIN_COMPRESS_SIZE:
+                continue
+            compressed = compressor(content)
+            if len(compressed) < len(content) * 0.95:
+                self._save(compressed_name, ContentFile(compressed))
+
+
+def accepted_encodings(header):
+    """The content codings an Accept-Encoding header allows (q=0 excluded)."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, parameters = part.partition(';')
+        quality = re.search(r'q\s*=\s*([0-9.]+)', parameters)
+        try:
+            if quality and float(quality.group(1)) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFilesMiddleware:
+    """
+    Serves files below STATIC_URL from STATIC_ROOT before any other work is done
+    for the request. Unknown files fall through to the URL resolver (404).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        prefix = urlsplit(settings.STATIC_URL or '')
+        if not getattr(settings, 'VOTING_SERVE_STATIC', True) or not settings.STATIC_ROOT or prefix.netloc:
+            raise MiddlewareNotUsed
+        self.prefix = prefix.path
+        self.root = os.fspath(settings.STATIC_ROOT)
+        self.max_age = getattr(settings, 'VOTING_STATIC_MAX_AGE', 60 * 60 * 24 * 365)
+        # Names with a content hash never change; the manifest is read once per process.
+        self.immutable = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.serve(request)
+        return response if response is not None else self.get_response(request)
+
+    async def __acall__(self, request):
+        response = self.serve(request)
+        return response if response is not None else await self.get_response(request)
+
+    def serve(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith(self.prefix):
+            return None
+        name = request.path[len(self.prefix):]
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        served, encoding = path, None
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        for coding, suffix in ENCODINGS:
+            if coding in accepted and os.path.isfile(path + suffix):
+                served, encoding = path + suffix, coding
+                break
+
+        stat = os.stat(served)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            response = FileResponse(open(served, 'rb'), content_type=content_type, filename=os.path.basename(path))
+            response['Last-Modified'] = http_date(stat.st_mtime)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        if name in self.immutable:
+            response['Cache-Control'] = f'public, max-age={self.max_age}, immutable'
+        else:
+            response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
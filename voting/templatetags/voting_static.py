@@ -0,0 +1,22 @@
+import functools
+
+from django import template
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+
+from voting.staticfiles import vendor_cdn_url, vendor_path
+
+register = template.Library()
+
+
+@register.simple_tag
+def vendor_static(package, file_name):
+    """URL of a Bootstrap/Font Awesome file: the self-hosted copy if it was fetched, else the CDN."""
+    if is_vendored(package, file_name):
+        return static(vendor_path(package, file_name))
+    return vendor_cdn_url(package, file_name)
+
+
+@functools.lru_cache
+def is_vendored(package, file_name):
+    return finders.find(vendor_path(package, file_name)) is not None
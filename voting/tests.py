@@ -1,3 +1,1414 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from pathlib import Path
+from urllib.parse import parse_qs
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, load_command_class
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from . import (async_views, catalog, code_lookup, counters, drafts, export, images, live, mail_dispatch, profiling,
+               snapshots, sqlite, staticfiles, views)
+from .benchmark import URLConf, latency_summary
+from .catalog import get_catalog
+from .models import Category, CounterShard, OutboxEmail, Person, Vote, VoteStatistics, VotingCode, VotingSession
+from .templatetags import voting_static
+
+
+class VotingTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+        cls.persons = [Person.objects.create(name=name) for name in ['Anna Schmidt', 'Max Müller', 'Lisa Weber']]
+        cls.categories = [
+            Category.objects.create(title=title, description=title)
+            for title in ['Funniest', 'Kindest', 'Sportiest']
+        ]
+
+    def setUp(self):
+        # Rolled back test data does not fire signals, so start every test with fresh versions.
+        cache.clear()
+        live.counter.reset()
+        live.shared_total.reset()
+        counters.forget_shards()
+
+    def cast_ballot(self, person_for_category):
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+        session = VotingSession.objects.create(voting_code=code)
+        for category in self.categories:
+            session.add_vote(category.id, person_for_category(category).id)
+        return session.complete_voting()
+
+
+class VoteStatisticsTests(VotingTestCase):
+
+    def test_complete_voting_increments_counters(self):
+        anna, max_, lisa = self.persons
+        self.assertTrue(self.cast_ballot(lambda category: anna))
+        self.assertTrue(self.cast_ballot(lambda category: anna))
+        self.assertTrue(self.cast_ballot(lambda category: max_))
+
+        for category in self.categories:
+            counts = dict(VoteStatistics.objects.filter(category=category).values_list('person', 'vote_count'))
+            self.assertEqual(counts, {anna.id: 2, max_.id: 1})
+
+    def test_percentage_is_derived_from_category_total(self):
+        anna, max_, lisa = self.persons
+        self.cast_ballot(lambda category: anna)
+        self.cast_ballot(lambda category: max_)
+        self.cast_ballot(lambda category: max_)
+
+        category = self.categories[0]
+        with self.assertNumQueries(1):
+            stats = {s.person_id: s for s in VoteStatistics.objects.filter(category=category)}
+            self.assertEqual(stats[anna.id].percentage, 33.33)
+            self.assertEqual(stats[max_.id].percentage, 66.67)
+        self.assertEqual(VoteStatistics.objects.get(category=category, person=max_).percentage, 66.67)
+
+    def test_rebuild_command_detects_and_repairs_drift(self):
+        anna, max_, lisa = self.persons
+        self.cast_ballot(lambda category: anna)
+        self.cast_ballot(lambda category: lisa)
+
+        call_command('rebuild_vote_statistics', '--check', stdout=StringIO())
+
+        VoteStatistics.objects.filter(person=anna).update(vote_count=5)
+        VoteStatistics.objects.filter(person=lisa).delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_vote_statistics', '--check', stdout=StringIO())
+
+        call_command('rebuild_vote_statistics', stdout=StringIO())
+        call_command('rebuild_vote_statistics', '--check', stdout=StringIO())
+        self.assertEqual(VoteStatistics.objects.count(), 2 * len(self.categories))
+        self.assertEqual(Vote.objects.count(), 2 * len(self.categories))
+
+
+class BallotCommitTests(VotingTestCase):
+
+    def prepare_session(self):
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+        session = VotingSession.objects.create(voting_code=code)
+        session.pending_votes = {str(category.id): self.persons[0].id for category in self.categories}
+        session.save()
+        get_catalog()
+        return session
+
+    def test_query_count_does_not_grow_with_categories(self):
+        # savepoint, code, votes, session, 2x statistics, 2x ballot counter, release
+        session = self.prepare_session()
+        with self.assertNumQueries(9):
+            self.assertTrue(session.complete_voting())
+
+        # Once the counter rows exist, a single UPDATE bumps them.
+        session = self.prepare_session()
+        with self.assertNumQueries(8):
+            self.assertTrue(session.complete_voting())
+
+        self.categories = self.categories + [
+            Category.objects.create(title=f'Extra {i}', description='') for i in range(10)
+        ]
+        session = self.prepare_session()
+        with self.assertNumQueries(8):
+            self.assertTrue(session.complete_voting())
+
+        self.assertEqual(Vote.objects.filter(voting_code=session.voting_code).count(), 13)
+
+    def test_used_up_code_does_not_commit(self):
+        session = self.prepare_session()
+        VotingCode.objects.filter(pk=session.voting_code_id).update(current_uses=1)
+
+        self.assertFalse(session.complete_voting())
+        self.assertFalse(Vote.objects.exists())
+        self.assertFalse(VotingSession.objects.get(pk=session.pk).is_completed)
+
+    def test_use_code_stops_at_max_uses(self):
+        code = VotingCode.generate_code(self.admin, max_uses=2)
+        self.assertTrue(code.use_code())
+        self.assertTrue(code.use_code())
+        self.assertFalse(code.use_code())
+        code.refresh_from_db()
+        self.assertEqual(code.current_uses, 2)
+
+
+class CounterTests(VotingTestCase):
+
+    def test_ballots_are_counted(self):
+        for person in self.persons[:2]:
+            self.cast_ballot(lambda category: person)
+
+        self.assertEqual(counters.count(counters.BALLOTS), 2)
+        self.assertEqual(CounterShard.objects.filter(name=counters.BALLOTS).count(), 8)
+        # Per-category totals come from VoteStatistics, the ballot writes no counter rows for them.
+        self.assertEqual(set(CounterShard.objects.values_list('name', flat=True)), {counters.BALLOTS})
+
+    def test_increments_are_spread_over_the_shards(self):
+        with mock.patch('voting.counters.random.randrange', side_effect=[0, 5, 5]):
+            for _ in range(3):
+                counters.increment(counters.BALLOTS)
+        self.assertEqual(dict(CounterShard.objects.filter(name=counters.BALLOTS, count__gt=0)
+                              .values_list('shard', 'count')), {0: 1, 5: 2})
+
+    def test_deleted_shards_are_created_again(self):
+        counters.increment(counters.BALLOTS)
+        CounterShard.objects.all().delete()
+        counters.increment(counters.BALLOTS)
+        self.assertEqual(counters.count(counters.BALLOTS), 1)
+
+    def test_rebuild_recounts_from_the_ballots(self):
+        self.cast_ballot(lambda category: self.persons[0])
+        CounterShard.objects.update(count=42)
+
+        values = counters.rebuild()
+        self.assertEqual(values[counters.BALLOTS], 1)
+        self.assertEqual(counters.stored_values(), counters.expected_values())
+
+    def test_rebuild_command_checks_the_counters(self):
+        self.cast_ballot(lambda category: self.persons[0])
+        CounterShard.objects.filter(name=counters.BALLOTS).update(count=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_vote_statistics', '--check', stdout=StringIO())
+
+        call_command('rebuild_vote_statistics', stdout=StringIO())
+        call_command('rebuild_vote_statistics', '--check', stdout=StringIO())
+
+
+class CatalogTests(VotingTestCase):
+
+    def test_wizard_step_does_not_query_the_catalog(self):
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+        url = reverse('voting:vote_with_code', args=[code.code])
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            self.client.post(url, {'action': 'next', 'person_id': self.persons[1].id})
+
+        self.assertContains(response, 'Max Müller')
+        catalog_queries = [q['sql'] for q in queries
+                           if 'voting_category' in q['sql'] or 'voting_person' in q['sql']]
+        self.assertEqual(catalog_queries, [])
+
+    def test_saving_a_category_or_person_rebuilds_the_snapshot(self):
+        snapshot = get_catalog()
+        self.assertIs(get_catalog(), snapshot)
+
+        category = self.categories[0]
+        category.is_active = False
+        category.save()
+        self.assertNotIn(category, get_catalog().categories)
+
+        Person.objects.create(name='Zoe Neu')
+        self.assertIn('Zoe Neu', [person.name for person in get_catalog().persons])
+
+    def test_snapshot_expires_without_a_version_bump(self):
+        # Another worker with its own LocMemCache changed a category: no bump reaches this process.
+        category = self.categories[0]
+        snapshot = get_catalog()
+        Category.objects.filter(pk=category.pk).update(title='Renamed Elsewhere')
+        self.assertIs(get_catalog(), snapshot)
+
+        with mock.patch('voting.snapshots.time.monotonic', return_value=time.monotonic() + snapshots.MAX_AGE + 1):
+            rebuilt = get_catalog()
+        self.assertIn('Renamed Elsewhere', [category.title for category in rebuilt.categories])
+        self.assertEqual(rebuilt.category_version, snapshot.category_version)
+        # The cached wizard fragments follow the data, not the version.
+        self.assertNotEqual(rebuilt.category_key, snapshot.category_key)
+        self.assertEqual(rebuilt.person_key, snapshot.person_key)
+
+    def test_full_wizard_flow(self):
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+        url = reverse('voting:vote_with_code', args=[code.code])
+        for _ in self.categories:
+            response = self.client.post(url, {'action': 'next', 'person_id': self.persons[2].id})
+        self.assertRedirects(response, reverse('voting:success'))
+
+        self.assertEqual(Vote.objects.filter(voting_code=code, person=self.persons[2]).count(), 3)
+
+    def test_unknown_person_is_rejected(self):
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+        url = reverse('voting:vote_with_code', args=[code.code])
+        response = self.client.post(url, {'action': 'next', 'person_id': 'abc'})
+        self.assertContains(response, 'Ungültige Personenauswahl.')
+
+    def test_person_options_are_rendered_once_per_version(self):
+        anna, max_, lisa = self.persons
+        with mock.patch('voting.catalog.render_to_string', wraps=catalog.render_to_string) as render:
+            options = get_catalog().render_person_options(max_.id)
+            get_catalog().render_person_options(str(lisa.id))
+            get_catalog().render_person_options(None)
+        self.assertEqual(render.call_count, 1)
+
+        self.assertIn(f'<option value="{max_.id}" selected>Max Müller</option>', options)
+        self.assertIn(f'<option value="{anna.id}">Anna Schmidt</option>', options)
+        self.assertEqual(options.count('selected'), 1)
+
+        Person.objects.filter(pk=anna.pk).update(name='Anna Neu')
+        anna.refresh_from_db()
+        anna.save()
+        self.assertIn('Anna Neu', get_catalog().render_person_options())
+
+    def test_wizard_step_fragments_are_shared_between_voters(self):
+        first, second = (VotingCode.generate_code(self.admin, max_uses=1) for _ in range(2))
+        self.client.get(reverse('voting:vote_with_code', args=[first.code]))
+
+        key = make_template_fragment_key('vote_category', [get_catalog().category_key, 0])
+        self.assertIn(get_catalog().categories[0].title, cache.get(key))
+        cache.set(key, '<h2>cached header</h2>')
+
+        response = self.client.get(reverse('voting:vote_with_code', args=[second.code]))
+        self.assertContains(response, '<h2>cached header</h2>')
+        self.assertContains(response, f'Code: {second.code}')
+        self.assertNotContains(response, first.code)
+
+    def test_changing_a_category_retires_cached_fragments(self):
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+        url = reverse('voting:vote_with_code', args=[code.code])
+        category = get_catalog().categories[0]
+        self.assertContains(self.client.get(url), category.title)
+
+        category.title = 'Aaa Renamed'
+        category.save()
+        response = self.client.get(url)
+        self.assertContains(response, 'Aaa Renamed', count=2)
+
+
+class DraftStorageTests(VotingTestCase):
+
+    def walk_wizard(self, code, persons):
+        url = reverse('voting:vote_with_code', args=[code.code])
+        writes = []
+        for person in persons:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(url, {'action': 'next', 'person_id': person.id})
+            writes.append([q['sql'] for q in queries if not q['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))])
+        return response, writes
+
+    def assert_only_the_commit_writes(self):
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+        anna, max_, lisa = self.persons
+        response, writes = self.walk_wizard(code, [anna, max_])
+        self.assertEqual(writes, [[], []])
+        self.assertFalse(VotingSession.objects.exists())
+
+        # Back to the second category, the earlier choice is still selected.
+        url = reverse('voting:vote_with_code', args=[code.code])
+        self.client.post(url, {'action': 'previous'})
+        self.assertEqual(self.client.get(url).context['selected_person_id'], max_.id)
+
+        response, writes = self.walk_wizard(code, [lisa, lisa])
+        self.assertRedirects(response, reverse('voting:success'))
+        self.assertEqual(writes[0], [])
+        self.assertTrue(VotingSession.objects.get(voting_code=code).is_completed)
+        self.assertEqual(sorted(Vote.objects.filter(voting_code=code).values_list('person__name', flat=True)),
+                         ['Anna Schmidt', 'Lisa Weber', 'Lisa Weber'])
+
+        response = self.client.get(url)
+        self.assertRedirects(response, reverse('voting:index'))
+        return code
+
+    @override_settings(VOTING_DRAFT_STORAGE='cache')
+    def test_cache_drafts_only_write_the_final_ballot(self):
+        code = self.assert_only_the_commit_writes()
+        self.assertIsNone(cache.get(drafts.CACHE_KEY.format(code=code.code)))
+
+    @override_settings(VOTING_DRAFT_STORAGE='cookie')
+    def test_cookie_drafts_only_write_the_final_ballot(self):
+        self.assert_only_the_commit_writes()
+        self.assertEqual(self.client.cookies[drafts.COOKIE_NAME].value, '')
+
+    @override_settings(VOTING_DRAFT_STORAGE='cookie')
+    def test_tampered_or_foreign_cookie_starts_over(self):
+        first, second = (VotingCode.generate_code(self.admin, max_uses=1) for _ in range(2))
+        self.walk_wizard(first, self.persons[:2])
+        # A draft of another code does not carry over.
+        response = self.client.get(reverse('voting:vote_with_code', args=[second.code]))
+        self.assertEqual(response.context['current_step'], 1)
+
+        self.client.cookies[drafts.COOKIE_NAME] = self.client.cookies[drafts.COOKIE_NAME].value[:-2] + 'xx'
+        response = self.client.get(reverse('voting:vote_with_code', args=[first.code]))
+        self.assertEqual(response.context['current_step'], 1)
+
+    @override_settings(VOTING_DRAFT_STORAGE='cache')
+    def test_completed_code_is_not_voted_again(self):
+        code = VotingCode.generate_code(self.admin, max_uses=2)
+        self.walk_wizard(code, self.persons)
+        response = self.client.get(reverse('voting:vote_with_code', args=[code.code]))
+        self.assertRedirects(response, reverse('voting:success'))
+        self.assertEqual(Vote.objects.filter(voting_code=code).count(), 3)
+
+
+    def test_incomplete_storage_fails_when_created(self):
+        class ReadOnlyStorage(drafts.DraftStorage):
+            def read(self, request, voting_code):
+                return None
+
+        with self.assertRaises(TypeError):
+            ReadOnlyStorage()
+
+class CategoryImageTests(VotingTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, size, mode='RGB', name='photo.png'):
+        buffer = BytesIO()
+        Image.new(mode, size, 'red').save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_upload_creates_webp_and_jpeg_copies(self):
+        category = Category.objects.create(title='Photogenic', description='', image=self.upload((2000, 1500), 'RGBA'))
+
+        found = images.variants(category.image.name)
+        self.assertEqual([width for width, url in found['webp']], [320, 640, 1280])
+        self.assertEqual([width for width, url in found['jpeg']], [320, 640, 1280])
+        with default_storage.open(f'{images.derivative_dir(category.image.name)}/640.jpeg') as f:
+            self.assertEqual(Image.open(f).size, (640, 480))
+
+        small = Category.objects.create(title='Tiny', description='', image=self.upload((200, 100)))
+        self.assertEqual([width for width, url in images.variants(small.image.name)['webp']], [200])
+
+    def test_wizard_renders_srcset(self):
+        category = self.categories[0]
+        category.image = self.upload((800, 600))
+        category.save()
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+
+        response = self.client.get(reverse('voting:vote_with_code', args=[code.code]))
+        name = category.image.name
+        self.assertContains(response, f'srcset="/media/derivatives/{name}/320.webp 320w, '
+                                      f'/media/derivatives/{name}/640.webp 640w, '
+                                      f'/media/derivatives/{name}/800.webp 800w"')
+        self.assertContains(response, f'src="/media/derivatives/{name}/800.jpeg"')
+        # The image of the current step is above the fold.
+        self.assertContains(response, 'loading="eager"')
+        self.assertNotContains(response, 'loading="lazy"')
+
+        # The single-page ballot gets the same copies.
+        self.assertIn(f'/media/derivatives/{name}/640.jpeg 640w', get_catalog().json_script)
+
+    def test_copies_are_removed_with_their_image(self):
+        category = Category.objects.create(title='Changing', description='', image=self.upload((400, 300)))
+        old_name = category.image.name
+        category.image = self.upload((500, 300), name='new.png')
+        category.save()
+
+        self.assertEqual(images.variants(old_name), {})
+        self.assertEqual(len(images.variants(category.image.name)['jpeg']), 2)
+
+        category.delete()
+        self.assertEqual(images.variants(category.image.name), {})
+
+    def test_broken_image_falls_back_to_the_original(self):
+        upload = SimpleUploadedFile('broken.png', b'not an image', content_type='image/png')
+        with self.assertLogs('voting.images', 'WARNING'):
+            category = Category.objects.create(title='Broken', description='', image=upload)
+        self.assertEqual(category.responsive_image, images.ResponsiveImage(src=category.image.url))
+
+    def test_oversized_image_falls_back_to_the_original(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000), self.assertLogs('voting.images', 'WARNING'):
+            category = Category.objects.create(title='Huge', description='', image=self.upload((400, 300)))
+        self.assertEqual(category.responsive_image, images.ResponsiveImage(src=category.image.url))
+
+    def test_command_builds_missing_copies(self):
+        category = Category.objects.create(title='Old', description='', image=self.upload((400, 300)))
+        images.delete(category.image.name)
+
+        call_command('build_image_derivatives', stdout=StringIO())
+        self.assertEqual(len(images.variants(category.image.name)['webp']), 2)
+
+
+class StaticFilesTests(VotingTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = cls.enterClassContext(tempfile.TemporaryDirectory())
+        sources = cls.enterClassContext(tempfile.TemporaryDirectory())
+        # A self-hosted Font Awesome as fetch_vendor_assets leaves it.
+        css = os.path.join(sources, 'voting/vendor/fontawesome/css')
+        os.makedirs(css)
+        os.makedirs(os.path.join(sources, 'voting/vendor/fontawesome/webfonts'))
+        with open(os.path.join(css, 'all.min.css'), 'w') as f:
+            f.write('.fa-solid{font-family:"Font Awesome 6 Free"}' * 20)
+            f.write('@font-face{src:url(../webfonts/fa-solid-900.woff2)}')
+        with open(os.path.join(sources, 'voting/vendor/fontawesome/webfonts/fa-solid-900.woff2'), 'wb') as f:
+            f.write(b'wOF2')
+
+        cls.enterClassContext(override_settings(STATIC_ROOT=cls.static_root, STATICFILES_DIRS=[sources]))
+        voting_static.is_vendored.cache_clear()
+        cls.addClassCleanup(voting_static.is_vendored.cache_clear)
+        call_command('collectstatic', interactive=False, ignore_patterns=['admin'], verbosity=0, fetch_vendor=False)
+
+    def hashed(self, name):
+        return staticfiles_storage.stored_name(name)
+
+    def test_collectstatic_writes_hashed_and_compressed_copies(self):
+        name = self.hashed('voting/css/base.css')
+        self.assertRegex(name, r'^voting/css/base\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.static_root, name), 'rb') as f:
+            original = f.read()
+        with open(os.path.join(self.static_root, name + '.gz'), 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), original)
+
+        # The stylesheet points at the hashed font, which is too small to be worth compressing.
+        with open(os.path.join(self.static_root, self.hashed('voting/vendor/fontawesome/css/all.min.css'))) as f:
+            self.assertIn(self.hashed('voting/vendor/fontawesome/webfonts/fa-solid-900.woff2').split('/')[-1], f.read())
+        font = os.path.join(self.static_root, 'voting/vendor/fontawesome/webfonts/fa-solid-900.woff2')
+        self.assertFalse(os.path.exists(font + '.gz'))
+
+    def test_pages_link_hashed_and_self_hosted_files(self):
+        response = self.client.get(reverse('voting:index'))
+        self.assertContains(response, f'/static/{self.hashed("voting/css/base.css")}')
+        self.assertContains(response, f'/static/{self.hashed("voting/vendor/fontawesome/css/all.min.css")}')
+        # Bootstrap was not fetched and still comes from the CDN.
+        self.assertContains(response, staticfiles.vendor_cdn_url('bootstrap', 'css/bootstrap.min.css'))
+        self.assertNotContains(response, '<style>')
+
+    def test_middleware_serves_compressed_copy_with_long_caching(self):
+        url = f'/static/{self.hashed("voting/js/vote_single_page.js")}'
+        response = self.client.get(url, headers={'Accept-Encoding': 'br;q=0, gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/javascript')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b''.join(plain.streaming_content))
+
+        again = self.client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    def test_middleware_revalidates_unhashed_names(self):
+        response = self.client.get('/static/voting/css/base.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(self.client.get('/static/voting/css/missing.css').status_code, 404)
+        self.assertEqual(self.client.get('/static/../db.sqlite3').status_code, 404)
+
+    def test_collectstatic_fetches_missing_vendor_files(self):
+        fetch = 'voting.management.commands.fetch_vendor_assets.Command'
+        files = {'css/all.min.css': b'@font-face{src:url(../webfonts/fa-solid-900.woff2?v=6)}'}
+        with tempfile.TemporaryDirectory() as vendor_root, tempfile.TemporaryDirectory() as static_root, \
+                override_settings(STATIC_ROOT=static_root), \
+                mock.patch(f'{fetch}.static_root', return_value=Path(vendor_root)), \
+                mock.patch(f'{fetch}.download', side_effect=lambda url, timeout: files.get(url.split('/6.0.0/')[-1],
+                                                                                          b'x')) as download:
+            call_command('collectstatic', interactive=False, ignore_patterns=['admin'], verbosity=0,
+                         stdout=StringIO())
+            self.assertIn('webfonts/fa-solid-900.woff2',
+                          [url.split('/6.0.0/')[-1] for (url, _), _ in download.call_args_list])
+            self.assertTrue(os.path.exists(os.path.join(vendor_root, 'voting/vendor/bootstrap/css/bootstrap.min.css')))
+
+            # Files that are there already are not downloaded again.
+            download.reset_mock()
+            call_command('collectstatic', interactive=False, ignore_patterns=['admin'], verbosity=0,
+                         stdout=StringIO())
+            download.assert_not_called()
+
+    def test_vendor_references_outside_the_package_are_refused(self):
+        fetch = load_command_class('voting', 'fetch_vendor_assets')
+        self.assertEqual(list(fetch.referenced_files('css/all.min.css', 'url(../webfonts/a.woff2)')),
+                         ['webfonts/a.woff2'])
+        with self.assertRaises(CommandError):
+            list(fetch.referenced_files('css/all.min.css', 'src:url(../../../../settings.py)'))
+
+    def test_accepted_encodings(self):
+        self.assertEqual(staticfiles.accepted_encodings('gzip, deflate, br;q=0.5'), {'gzip', 'deflate', 'br'})
+        self.assertEqual(staticfiles.accepted_encodings('br;q=0, gzip;q=1.0'), {'gzip'})
+
+
+class SinglePageBallotTests(VotingTestCase):
+
+    def submit(self, code, votes):
+        return self.client.post(reverse('voting:submit_ballot'),
+                                json.dumps({'code': code, 'votes': votes}),
+                                content_type='application/json')
+
+    @override_settings(VOTING_BALLOT_MODE='single_page')
+    def test_page_embeds_catalog_without_creating_a_session(self):
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+        response = self.client.get(reverse('voting:vote_with_code', args=[code.code]))
+
+        self.assertTemplateUsed(response, 'voting/vote_single_page.html')
+        self.assertContains(response, 'id="ballot-catalog"')
+        self.assertContains(response, 'Lisa Weber')
+        self.assertFalse(VotingSession.objects.exists())
+
+    @override_settings(VOTING_BALLOT_MODE='single_page')
+    def test_page_is_not_shown_once_the_ballot_is_completed(self):
+        # The code has a use left, but its one ballot is already in.
+        code = VotingCode.generate_code(self.admin, max_uses=2)
+        self.submit(code.code, {str(category.id): self.persons[0].id for category in self.categories})
+
+        response = self.client.get(reverse('voting:vote_with_code', args=[code.code]))
+        self.assertRedirects(response, reverse('voting:success'))
+
+    def test_submit_commits_full_ballot(self):
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+        votes = {str(category.id): self.persons[0].id for category in self.categories}
+
+        response = self.submit(code.code.lower(), votes)
+
+        self.assertEqual(response.json(), {'ok': True, 'redirect': reverse('voting:success')})
+        self.assertEqual(Vote.objects.filter(voting_code=code).count(), 3)
+        self.assertTrue(VotingSession.objects.get(voting_code=code).is_completed)
+        self.assertEqual(self.submit(code.code, votes).status_code, 409)
+
+    def test_submit_rejects_incomplete_or_invalid_ballots(self):
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+        votes = {str(category.id): self.persons[0].id for category in self.categories[:2]}
+        self.assertEqual(self.submit(code.code, votes).status_code, 400)
+
+        votes[str(self.categories[2].id)] = 999999
+        self.assertEqual(self.submit(code.code, votes).status_code, 400)
+        self.assertEqual(self.submit('NOPE', votes).status_code, 404)
+        self.assertFalse(Vote.objects.exists())
+
+
+class CodeLookupTests(VotingTestCase):
+
+    @override_settings(VOTING_CODE_THROTTLE_BURST=1)
+    def test_guesses_of_a_throttled_ip_are_rejected_without_a_query(self):
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+        self.assertEqual(code_lookup.get_active_code(code.code, '10.0.0.1'), code)
+        with self.assertRaises(VotingCode.DoesNotExist):
+            code_lookup.get_active_code('NOPE1234', '10.0.0.1')
+
+        with self.assertNumQueries(0):
+            with self.assertRaises(code_lookup.Throttled):
+                code_lookup.get_active_code('NOPE5678', '10.0.0.1')
+        self.assertEqual(code_lookup.get_active_code(code.code, '10.0.0.1'), code)
+
+    def test_code_missing_from_an_outdated_filter_is_found_in_the_database(self):
+        # Generated on another worker whose version bump does not reach this process (own LocMemCache).
+        code_lookup.get_filter()
+        with mock.patch('voting.code_lookup.invalidate'):
+            code = VotingCode.generate_code(self.admin, max_uses=1)
+        self.assertNotIn(code.code, code_lookup.get_filter())
+
+        with override_settings(VOTING_CODE_THROTTLE_BURST=1):
+            self.assertEqual(code_lookup.get_active_code(code.code, '10.0.0.1'), code)
+            self.assertFalse(code_lookup.is_throttled('10.0.0.1'))
+        self.assertIn(code.code, code_lookup.get_filter())
+
+    def test_filter_follows_generated_and_deactivated_codes(self):
+        code_lookup.get_filter()
+        single = VotingCode.generate_code(self.admin)
+        bulk = VotingCode.generate_codes_bulk(20, self.admin)
+        self.assertIn(single.code, code_lookup.get_filter())
+        self.assertTrue(all(code.code in code_lookup.get_filter() for code in bulk))
+
+        self.client.force_login(self.admin)
+        self.client.post(reverse('admin:voting_votingcode_changelist'),
+                         {'action': 'deactivate_codes', '_selected_action': [single.pk]})
+        self.assertNotIn(single.code, code_lookup.get_filter())
+
+    def test_snapshot_is_rebuilt_on_a_version_bump_or_after_max_age(self):
+        builds = []
+        snapshot = snapshots.VersionedSnapshot(['test:version'], lambda versions: builds.append(versions) or versions)
+        first = snapshot.get()
+        self.assertIs(snapshot.get(), first)
+
+        snapshot.invalidate()
+        bumped = snapshot.get()
+        self.assertNotEqual(bumped, first)
+        with mock.patch('voting.snapshots.time.monotonic', return_value=time.monotonic() + snapshots.MAX_AGE + 1):
+            snapshot.get()
+        self.assertEqual(len(builds), 3)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        codes = {VotingCode.random_code() for _ in range(5000)}
+        bloom = code_lookup.BloomFilter(codes)
+        self.assertTrue(all(code in bloom for code in codes))
+
+        others = {VotingCode.random_code() for _ in range(5000)} - codes
+        self.assertLess(sum(code in bloom for code in others), 25)
+
+    @override_settings(VOTING_CODE_THROTTLE_BURST=3)
+    def test_guessing_ip_is_throttled(self):
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+        for guess in ['NOPE0001', 'NOPE0002', 'NOPE0003']:
+            response = self.client.post(reverse('voting:vote'), {'voting_code': guess}, REMOTE_ADDR='10.0.0.1')
+            self.assertContains(response, 'Ungültiger Voting-Code.')
+
+        # Out of attempts: further guesses get 429, but a valid code still works.
+        response = self.client.post(reverse('voting:vote'), {'voting_code': 'NOPE0004'}, REMOTE_ADDR='10.0.0.1')
+        self.assertContains(response, 'Zu viele ungültige Codes.', status_code=429)
+        response = self.client.post(reverse('voting:submit_ballot'), json.dumps({'code': 'NOPE0005', 'votes': {}}),
+                                    content_type='application/json', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+
+        response = self.client.post(reverse('voting:vote'), {'voting_code': code.code}, REMOTE_ADDR='10.0.0.1')
+        self.assertRedirects(response, reverse('voting:vote_with_code', args=[code.code]),
+                             fetch_redirect_response=False)
+        response = self.client.post(reverse('voting:vote'), {'voting_code': 'NOPE0006'}, REMOTE_ADDR='10.0.0.2')
+        self.assertContains(response, 'Ungültiger Voting-Code.')
+
+    @override_settings(VOTING_CODE_THROTTLE_BURST=1)
+    def test_forwarded_for_is_only_trusted_behind_a_proxy(self):
+        # A forged header cannot drain the bucket of another address...
+        self.client.get(reverse('voting:vote_with_code', args=['NOPE0001']),
+                        REMOTE_ADDR='10.0.0.9', HTTP_X_FORWARDED_FOR='10.0.0.1')
+        response = self.client.get(reverse('voting:vote_with_code', args=['NOPE0002']), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 302)
+
+        # ...and behind one proxy only the address that proxy appended counts.
+        with override_settings(VOTING_TRUSTED_PROXIES=1):
+            response = self.client.get(reverse('voting:vote_with_code', args=['NOPE0003']),
+                                       REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='forged, 10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+
+    def test_valid_codes_do_not_use_up_attempts(self):
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+        url = reverse('voting:vote_with_code', args=[code.code])
+        with override_settings(VOTING_CODE_THROTTLE_BURST=1):
+            for _ in range(5):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+@override_settings(ROOT_URLCONF=URLConf(async_views))
+class AsyncViewTests(VotingTestCase):
+
+    async def test_wizard_runs_on_the_async_views(self):
+        code = await VotingCode.objects.acreate(code='ASYNC001', created_by=self.admin, max_uses=1)
+
+        response = await self.async_client.post(reverse('voting:vote'), {'voting_code': 'async001'})
+        self.assertRedirects(response, reverse('voting:vote_with_code', args=['ASYNC001']),
+                             fetch_redirect_response=False)
+
+        url = reverse('voting:vote_with_code', args=[code.code])
+        response = await self.async_client.get(url)
+        self.assertContains(response, 'Lisa Weber')
+        for category in self.categories:
+            response = await self.async_client.post(url, {'action': 'next', 'person_id': self.persons[1].id})
+
+        self.assertRedirects(response, reverse('voting:success'), fetch_redirect_response=False)
+        session = await VotingSession.objects.aget(voting_code=code)
+        self.assertTrue(session.is_completed)
+        self.assertEqual(await Vote.objects.filter(voting_code=code, person=self.persons[1]).acount(), 3)
+
+    @override_settings(VOTING_BALLOT_MODE='single_page')
+    async def test_single_page_ballot_is_not_shown_twice(self):
+        code = await VotingCode.objects.acreate(code='ASYNC004', created_by=self.admin, max_uses=1)
+        url = reverse('voting:vote_with_code', args=[code.code])
+        self.assertContains(await self.async_client.get(url), 'id="ballot-catalog"')
+
+        await VotingSession.objects.acreate(voting_code=code, is_completed=True)
+        response = await self.async_client.get(url)
+        self.assertRedirects(response, reverse('voting:success'), fetch_redirect_response=False)
+
+    @override_settings(VOTING_DRAFT_STORAGE='cookie')
+    async def test_wizard_keeps_cookie_drafts(self):
+        code = await VotingCode.objects.acreate(code='ASYNC003', created_by=self.admin, max_uses=1)
+        url = reverse('voting:vote_with_code', args=[code.code])
+        for category in self.categories:
+            response = await self.async_client.post(url, {'action': 'next', 'person_id': self.persons[2].id})
+            if category != self.categories[-1]:
+                self.assertFalse(await VotingSession.objects.aexists())
+
+        self.assertRedirects(response, reverse('voting:success'), fetch_redirect_response=False)
+        self.assertEqual(await Vote.objects.filter(voting_code=code, person=self.persons[2]).acount(), 3)
+
+    async def test_unknown_code_goes_back_to_the_start(self):
+        response = await self.async_client.get(reverse('voting:vote_with_code', args=['NOPE']))
+        self.assertRedirects(response, reverse('voting:index'), fetch_redirect_response=False)
+
+    async def test_submit_ballot(self):
+        code = await VotingCode.objects.acreate(code='ASYNC002', created_by=self.admin, max_uses=1)
+        votes = {str(category.id): self.persons[0].id for category in self.categories}
+        response = await self.async_client.post(reverse('voting:submit_ballot'),
+                                                json.dumps({'code': code.code, 'votes': votes}),
+                                                content_type='application/json')
+        self.assertEqual(response.json(), {'ok': True, 'redirect': reverse('voting:success')})
+        self.assertEqual(await Vote.objects.filter(voting_code=code).acount(), 3)
+
+    async def test_submit_ballot_rejects_bad_ballots(self):
+        code = await VotingCode.objects.acreate(code='ASYNC006', created_by=self.admin, max_uses=1)
+        incomplete = {str(self.categories[0].id): self.persons[0].id}
+        for body, status, error in [
+            ('not json', 400, 'Ungültige Anfrage.'),
+            (json.dumps({'code': 'NOPE', 'votes': {}}), 404, views.INVALID_CODE_MESSAGE),
+            (json.dumps({'code': code.code, 'votes': incomplete}), 400,
+             'Bitte wähle in jeder Kategorie eine Person aus.'),
+        ]:
+            response = await self.async_client.post(reverse('voting:submit_ballot'), body,
+                                                    content_type='application/json')
+            self.assertEqual((response.status_code, response.json()), (status, {'ok': False, 'error': error}))
+
+    @override_settings(VOTING_CODE_THROTTLE_BURST=1)
+    async def test_guessing_ip_is_throttled(self):
+        response = await self.async_client.get(reverse('voting:vote_with_code', args=['NOPE']))
+        self.assertEqual(response.status_code, 302)
+        response = await self.async_client.get(reverse('voting:vote_with_code', args=['NOPE']))
+        self.assertEqual(response.status_code, 429)
+
+        code = await VotingCode.objects.acreate(code='ASYNC005', created_by=self.admin, max_uses=1)
+        response = await self.async_client.get(reverse('voting:vote_with_code', args=[code.code]))
+        self.assertEqual(response.status_code, 200)
+
+    async def test_live_total_answers_conditional_requests(self):
+        response = await self.async_client.get(reverse('voting:live_results_data'))
+        self.assertEqual(response.json(), {'total_votes': 0})
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        response = await self.async_client.get(reverse('voting:live_results_data'),
+                                               headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+
+class LiveCounterTests(VotingTestCase):
+
+    async def test_broadcaster_delivers_latest_value_across_threads(self):
+        broadcaster = live.Broadcaster()
+        subscription = broadcaster.subscribe()
+
+        def publish():
+            broadcaster.publish(1)
+            broadcaster.publish(2)
+
+        thread = threading.Thread(target=publish)
+        thread.start()
+        thread.join()
+        self.assertEqual(await asyncio.wait_for(subscription[1].get(), 1), 2)
+
+        broadcaster.unsubscribe(subscription)
+        self.assertEqual(len(broadcaster), 0)
+
+    def test_completed_ballot_increments_counter_after_commit(self):
+        self.assertEqual(asyncio.run(live.counter.aget()), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cast_ballot(lambda category: self.persons[0])
+            self.assertEqual(asyncio.run(live.counter.aget()), 0)
+
+        self.assertEqual(asyncio.run(live.counter.aget()), 1)
+
+    @override_settings(VOTING_LIVE_STREAM=True)
+    async def test_stream_sends_current_total_first(self):
+        response = await self.async_client.get(reverse('voting:live_results_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), b'data: {"total_votes": 0}\n\n')
+        await events.aclose()
+
+    @override_settings(VOTING_LIVE_STREAM=True)
+    def test_page_polls_under_wsgi(self):
+        # A WSGI server would hold the stream back forever, so the page is not told about it.
+        response = self.client.get(reverse('voting:live_results'))
+        self.assertContains(response, 'data-api-url')
+        self.assertNotContains(response, 'data-stream-url')
+        self.assertEqual(self.client.get(reverse('voting:live_results_stream')).status_code, 204)
+
+    async def test_stream_is_off_by_default(self):
+        response = await self.async_client.get(reverse('voting:live_results'))
+        self.assertNotContains(response, 'data-stream-url')
+        self.assertEqual((await self.async_client.get(reverse('voting:live_results_stream'))).status_code, 204)
+
+        with self.settings(VOTING_LIVE_STREAM=True):
+            response = await self.async_client.get(reverse('voting:live_results'))
+        self.assertContains(response, 'data-stream-url')
+
+
+class LiveResultsDataTests(VotingTestCase):
+
+    def test_total_is_cached_and_revalidated_with_etag(self):
+        url = reverse('voting:live_results_data')
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.json(), {'total_votes': 0})
+        self.assertEqual(response['ETag'], '"0"')
+        self.assertIn('Last-Modified', response)
+
+        live.shared_total.reset()
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH='"0"')
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cast_ballot(lambda category: self.persons[0])
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH='"0"')
+        self.assertEqual(response.json(), {'total_votes': 1})
+        self.assertEqual(response['ETag'], '"1"')
+
+    def test_requests_within_window_share_one_lookup(self):
+        with mock.patch('voting.live.cache.get_many', wraps=live.cache.get_many) as get_many:
+            for _ in range(5):
+                live.shared_total.get()
+        self.assertEqual(get_many.call_count, 1)
+
+
+class LeaderboardTests(VotingTestCase):
+
+    def setUp(self):
+        super().setUp()
+        anna, max_, lisa = self.persons
+        for person in [anna, anna, max_, lisa, anna]:
+            self.cast_ballot(lambda category: person)
+
+    def test_staff_get_top_n_for_all_categories_in_one_query(self):
+        self.client.force_login(self.admin)
+        get_catalog()
+        with self.assertNumQueries(3):  # session, user, leaderboard
+            data = self.client.get(reverse('voting:leaderboard'), {'limit': 2}).json()
+
+        self.assertEqual([category['title'] for category in data['categories']], ['Funniest', 'Kindest', 'Sportiest'])
+        funniest = data['categories'][0]
+        self.assertEqual(funniest['total_votes'], 5)
+        self.assertEqual(funniest['results'], [
+            {'rank': 1, 'person': 'Anna Schmidt', 'vote_count': 3, 'percentage': 60.0},
+            {'rank': 2, 'person': 'Lisa Weber', 'vote_count': 1, 'percentage': 20.0},
+        ])
+
+    def test_public_board_is_disabled_by_default(self):
+        self.assertEqual(self.client.get(reverse('voting:leaderboard')).status_code, 403)
+
+    @override_settings(VOTING_PUBLIC_LEADERBOARD=True, VOTING_PUBLIC_LEADERBOARD_DELAY=60)
+    def test_public_board_is_delayed_and_hides_counts(self):
+        url = reverse('voting:leaderboard')
+        self.assertEqual(self.client.get(url).json()['categories'], [])
+
+        cache.delete('voting:leaderboard:public:published:5')
+        funniest = self.client.get(url).json()['categories'][0]
+        self.assertNotIn('total_votes', funniest)
+        self.assertEqual(funniest['results'][0], {'rank': 1, 'person': 'Anna Schmidt', 'percentage': 60})
+
+
+class ResultsPageTests(VotingTestCase):
+
+    def results_queries(self):
+        get_catalog()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('voting:results'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_categories(self):
+        self.client.force_login(self.admin)
+        anna, max_, lisa = self.persons
+        self.cast_ballot(lambda category: anna)
+        self.cast_ballot(lambda category: lisa)
+
+        response, baseline = self.results_queries()
+        self.assertContains(response, 'Anna Schmidt', count=3)
+        self.assertContains(response, '<span class="fw-bold">50.0%</span>', count=6)
+
+        self.categories = self.categories + [
+            Category.objects.create(title=f'Extra {i:02}', description='') for i in range(30)
+        ]
+        for person in [anna, max_, lisa, max_]:
+            self.cast_ballot(lambda category: person)
+
+        response, queries = self.results_queries()
+        self.assertEqual(queries, baseline)
+        self.assertEqual(baseline, 3)  # session, user, ranked statistics
+        self.assertContains(response, 'Total: 4 votes', count=30)
+
+
+class ExportTests(VotingTestCase):
+
+    def setUp(self):
+        super().setUp()
+        anna, max_, lisa = self.persons
+        for person in [anna, anna, lisa]:
+            self.cast_ballot(lambda category: person)
+
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_votes_are_written_in_chunks(self):
+        chunks = list(export.csv_chunks('votes', chunk_size=2))
+        self.assertEqual(len(chunks), 5)
+
+        rows = list(csv.reader(''.join(chunks).splitlines()))
+        self.assertEqual(rows[0], ['code', 'category', 'person', 'created_at'])
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(sorted(row[2] for row in rows[1:]), ['Anna Schmidt'] * 6 + ['Lisa Weber'] * 3)
+
+    def test_results_are_ranked_per_category(self):
+        rows = list(csv.reader(''.join(export.csv_chunks('results')).splitlines()))
+        self.assertEqual(rows[0], ['category', 'rank', 'person', 'votes', 'percentage'])
+        self.assertEqual(rows[1:3], [['Funniest', '1', 'Anna Schmidt', '2', '66.67'],
+                                     ['Funniest', '2', 'Lisa Weber', '1', '33.33']])
+        self.assertEqual(len(rows), 7)
+
+    def test_staff_download_streams_plain_and_gzip(self):
+        self.client.force_login(self.admin)
+        plain = self.download(reverse('voting:export', args=['votes']))
+        compressed = self.download(reverse('voting:export_gzip', args=['votes']))
+        self.assertEqual(gzip.decompress(compressed), plain)
+        self.assertEqual(len(plain.decode().splitlines()), 10)
+
+        self.assertEqual(self.client.get(reverse('voting:export', args=['codes'])).status_code, 404)
+
+    def test_download_is_staff_only(self):
+        User.objects.create_user('voter', password='voter')
+        self.client.login(username='voter', password='voter')
+        response = self.client.get(reverse('voting:export', args=['votes']))
+        self.assertRedirects(response, reverse('voting:index'))
+
+    def test_command_writes_csv_or_gzip(self):
+        stdout = StringIO()
+        call_command('export_votes', '--table', 'results', stdout=stdout)
+        self.assertEqual(len(stdout.getvalue().splitlines()), 7)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'votes.csv.gz')
+            call_command('export_votes', '--output', path, stderr=StringIO())
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                self.assertEqual(len(f.read().splitlines()), 10)
+
+        with self.assertRaises(CommandError):
+            call_command('export_votes', '--gzip', stdout=StringIO())
+
+
+class StubMailgunServer:
+    """Local HTTP server standing in for the Mailgun messages API."""
+
+    def __init__(self, fail_once=(), reject=(), status=None, max_recipients=None):
+        self.requests = []
+        self.fail_once = set(fail_once)
+        self.reject = set(reject)
+        self.status = status
+        self.max_recipients = max_recipients
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+                parsed = parse_qs(body)
+                fields = {key: values[0] for key, values in parsed.items()}
+                fields['to'] = parsed['to'] if len(parsed['to']) > 1 else parsed['to'][0]
+                stub.requests.append(fields)
+                recipients = set(parsed['to'])
+                if stub.status:
+                    self.respond(stub.status, b'{"message": "Forbidden"}')
+                elif stub.max_recipients and len(recipients) > stub.max_recipients:
+                    self.respond(413, b'{"message": "request too large"}')
+                elif recipients & stub.reject:
+                    self.respond(400, b'{"message": "invalid address"}')
+                elif recipients & stub.fail_once:
+                    stub.fail_once -= recipients
+                    self.respond(429, b'{"message": "slow down"}')
+                else:
+                    self.respond(200, b'{"id": "<stub>", "message": "Queued. Thank you."}')
+
+            def respond(self, status, body):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/v3/example.com/messages'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MailDispatchTests(VotingTestCase):
+
+    def enqueue(self, emails):
+        codes = VotingCode.generate_codes_bulk(0, self.admin, max_uses=1, emails=emails)
+        return mail_dispatch.enqueue_invitations(
+            [(code, {'voting_code': code.code, 'vote_url': f'https://example.com/{code.code}'}) for code in codes],
+            subject='Invitation', template_name='Example'
+        )
+
+    def statuses(self, job_id):
+        return {r['email']: r['status'] for r in mail_dispatch.job_progress(job_id)['recipients']}
+
+    def test_single_sends_are_retried_and_reported_per_address(self):
+        job_id = self.enqueue(['a@example.com', 'flaky@example.com', 'bad@example.com'])
+        with StubMailgunServer(fail_once=['flaky@example.com'], reject=['bad@example.com']) as stub, \
+                override_settings(MAILGUN_API_URL=stub.url, MAILGUN_RETRY_BACKOFF=0.01, MAILGUN_BATCH_SIZE=1):
+            self.assertEqual(mail_dispatch.process_outbox(), 3)
+
+        progress = mail_dispatch.job_progress(job_id)
+        self.assertEqual((progress['sent'], progress['failed'], progress['pending']), (2, 1, 0))
+        self.assertTrue(progress['finished'])
+        self.assertEqual(self.statuses(job_id)['bad@example.com'], 'failed')
+        self.assertEqual(len(stub.requests), 4)
+        code = VotingCode.objects.get(email='a@example.com').code
+        sent = next(request for request in stub.requests if request['to'] == 'a@example.com')
+        self.assertEqual(json.loads(sent['h:X-Mailgun-Variables'])['voting_code'], code)
+
+    def test_batches_carry_recipient_variables(self):
+        self.enqueue([f'user{i}@example.com' for i in range(5)])
+        with StubMailgunServer() as stub, override_settings(MAILGUN_API_URL=stub.url, MAILGUN_BATCH_SIZE=3):
+            self.assertEqual(mail_dispatch.process_outbox(concurrency=2), 5)
+
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 5)
+        self.assertEqual(sorted(len(request['to']) for request in stub.requests), [2, 3])
+        batch = next(request for request in stub.requests if 'user0@example.com' in request['to'])
+        code = VotingCode.objects.get(email='user0@example.com').code
+        self.assertEqual(json.loads(batch['recipient-variables'])['user0@example.com']['voting_code'], code)
+        self.assertEqual(json.loads(batch['h:X-Mailgun-Variables'])['voting_code'], '%recipient.voting_code%')
+
+    def test_rejected_batch_is_split_to_find_the_bad_address(self):
+        job_id = self.enqueue(['a@example.com', 'b@example.com', 'bad@example.com', 'c@example.com'])
+        with StubMailgunServer(reject=['bad@example.com']) as stub, \
+                override_settings(MAILGUN_API_URL=stub.url, MAILGUN_BATCH_SIZE=1000):
+            mail_dispatch.process_outbox()
+
+        self.assertEqual(self.statuses(job_id), {'a@example.com': 'sent', 'b@example.com': 'sent',
+                                                 'bad@example.com': 'failed', 'c@example.com': 'sent'})
+        # whole batch, both halves, then the two addresses of the refused half
+        self.assertEqual(len(stub.requests), 5)
+        self.assertIn('invalid address', OutboxEmail.objects.get(email='bad@example.com').last_error)
+
+    def test_unauthorized_batch_is_not_split(self):
+        job_id = self.enqueue([f'user{i}@example.com' for i in range(5)])
+        with StubMailgunServer(status=401) as stub, \
+                override_settings(MAILGUN_API_URL=stub.url, MAILGUN_BATCH_SIZE=3):
+            mail_dispatch.process_outbox()
+
+        # one request per batch, the failure is the same for every address
+        self.assertEqual(len(stub.requests), 2)
+        self.assertEqual(set(self.statuses(job_id).values()), {'failed'})
+
+    def test_oversized_batch_is_halved_once(self):
+        job_id = self.enqueue([f'user{i}@example.com' for i in range(8)])
+        with StubMailgunServer(max_recipients=4) as stub, \
+                override_settings(MAILGUN_API_URL=stub.url, MAILGUN_BATCH_SIZE=1000):
+            mail_dispatch.process_outbox()
+        self.assertEqual(len(stub.requests), 3)
+        self.assertEqual(set(self.statuses(job_id).values()), {'sent'})
+
+        OutboxEmail.objects.all().delete()
+        job_id = self.enqueue([f'other{i}@example.com' for i in range(8)])
+        with StubMailgunServer(max_recipients=2) as stub, \
+                override_settings(MAILGUN_API_URL=stub.url, MAILGUN_BATCH_SIZE=1000):
+            mail_dispatch.process_outbox()
+        self.assertEqual(len(stub.requests), 3)
+        self.assertEqual(set(self.statuses(job_id).values()), {'failed'})
+
+    def test_exhausted_retries_go_back_to_the_outbox(self):
+        job_id = self.enqueue(['flaky@example.com'])
+        with StubMailgunServer(fail_once=['flaky@example.com']) as stub, \
+                override_settings(MAILGUN_API_URL=stub.url, MAILGUN_MAX_RETRIES=0):
+            mail_dispatch.process_outbox()
+            email = OutboxEmail.objects.get()
+            self.assertEqual((email.status, email.attempts, email.claim_token), ('pending', 1, ''))
+            self.assertFalse(mail_dispatch.job_progress(job_id)['finished'])
+
+            mail_dispatch.process_outbox()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.last_error), ('sent', 2, ''))
+        self.assertIsNotNone(email.sent_at)
+
+    def test_outcomes_are_stored_while_the_round_is_still_running(self):
+        self.enqueue(['a@example.com', 'b@example.com', 'c@example.com'])
+
+        class WorkerKilled(BaseException):
+            pass
+
+        lock, attempted, recorded = threading.Lock(), [], threading.Semaphore(0)
+        record = mail_dispatch._record
+
+        def record_and_signal(*args):
+            record(*args)
+            recorded.release()
+
+        def post(to_email, *args):
+            with lock:
+                attempted.append(to_email)
+                doomed = len(attempted) == 3
+            if doomed:
+                # The last request dies only after the other two finished.
+                recorded.acquire(timeout=5)
+                recorded.acquire(timeout=5)
+                raise WorkerKilled
+
+        with mock.patch('voting.mail_dispatch.post_mailgun_template_email', side_effect=post), \
+                mock.patch('voting.mail_dispatch._record', side_effect=record_and_signal), \
+                override_settings(MAILGUN_BATCH_SIZE=1), self.assertRaises(WorkerKilled):
+            mail_dispatch.process_outbox(concurrency=3)
+
+        statuses = dict(OutboxEmail.objects.values_list('email', 'status'))
+        self.assertEqual([statuses[email] for email in attempted], ['sent', 'sent', 'sending'])
+
+    def test_round_does_not_start_requests_after_its_window(self):
+        self.enqueue(['a@example.com', 'b@example.com'])
+        with StubMailgunServer() as stub, override_settings(MAILGUN_API_URL=stub.url, MAILGUN_BATCH_SIZE=1), \
+                mock.patch('voting.mail_dispatch._send_window', return_value=0):
+            self.assertEqual(mail_dispatch.process_outbox(), 1)
+
+        self.assertEqual(stub.requests, [])
+        email = OutboxEmail.objects.get(email='a@example.com')
+        self.assertEqual((email.status, email.attempts, email.claim_token), ('pending', 0, ''))
+
+        # Four attempts timing out after 10 s with 1.5 + 3 + 6 s of backoff in between still end by 300 s.
+        with override_settings(MAILGUN_OUTBOX_CLAIM_TIMEOUT=600, MAILGUN_TIMEOUT=10, MAILGUN_MAX_RETRIES=3,
+                               MAILGUN_RETRY_BACKOFF=1.0):
+            self.assertEqual(mail_dispatch._send_window(), 300 - 40 - 10.5)
+
+    def test_claims_do_not_overlap_and_abandoned_claims_expire(self):
+        self.enqueue(['a@example.com', 'b@example.com', 'c@example.com'])
+        _, first = mail_dispatch.claim(2)
+        _, second = mail_dispatch.claim(2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual([email.email for email in second], ['c@example.com'])
+        self.assertEqual(mail_dispatch.claim(2)[1], [])
+
+        with override_settings(MAILGUN_OUTBOX_CLAIM_TIMEOUT=-1):
+            _, reclaimed = mail_dispatch.claim(10)
+        self.assertEqual(len(reclaimed), 3)
+
+    def test_view_only_enqueues_and_progress_reads_the_outbox(self):
+        self.client.force_login(self.admin)
+        with mock.patch('voting.mailgun_utils.get_session') as get_session:
+            response = self.client.post(reverse('voting:send_codes_to_list'),
+                                        {'emails': 'a@example.com, b@example.com'})
+        get_session.assert_not_called()
+        job_id = response['Location'].split('job=')[1]
+        progress_url = reverse('voting:send_codes_progress', args=[job_id])
+        self.assertEqual(self.client.get(progress_url).json()['pending'], 2)
+
+        with StubMailgunServer() as stub, override_settings(MAILGUN_API_URL=stub.url):
+            call_command('run_mail_worker', '--once', stdout=StringIO())
+
+        progress = self.client.get(progress_url).json()
+        self.assertEqual((progress['sent'], progress['finished']), (2, True))
+        self.assertEqual(set(OutboxEmail.objects.values_list('voting_code__email', flat=True)),
+                         {'a@example.com', 'b@example.com'})
+
+    def test_duplicate_addresses_go_to_separate_batches(self):
+        messages = [OutboxEmail(email=email) for email in ['a@example.com', 'b@example.com', 'a@example.com']]
+        batches = list(mail_dispatch._batches(messages, 10))
+        self.assertEqual([[message.email for message in batch] for batch in batches],
+                         [['a@example.com', 'b@example.com'], ['a@example.com']])
+
+    def test_rate_limiter_spaces_out_acquisitions(self):
+        limiter = mail_dispatch.RateLimiter(rate=50, burst=1)
+        with mock.patch('voting.mail_dispatch.time.sleep') as sleep:
+            limiter.acquire()
+            limiter.acquire()
+        self.assertTrue(sleep.called)
+
+
+class CodeGenerationTests(VotingTestCase):
+
+    def test_bulk_generation_uses_a_fixed_number_of_queries(self):
+        # existing codes, savepoint, insert, release, read back
+        with self.assertNumQueries(5):
+            codes = VotingCode.generate_codes_bulk(100, self.admin, max_uses=1)
+        self.assertEqual(len({code.code for code in codes}), 100)
+
+        codes = VotingCode.generate_codes_bulk(1000, self.admin, max_uses=1)
+        self.assertEqual(len({code.code for code in codes}), 1000)
+        self.assertEqual(VotingCode.objects.count(), 1100)
+
+    def test_collisions_are_drawn_again(self):
+        VotingCode.objects.create(code='TAKEN000', created_by=self.admin)
+        draws = iter(['TAKEN000', 'FRESH001', 'FRESH001', 'FRESH002'])
+        with mock.patch.object(VotingCode, 'random_code', side_effect=lambda length: next(draws)):
+            codes = VotingCode.generate_codes_bulk(0, self.admin, emails=['a@example.com', 'b@example.com'])
+
+        self.assertEqual([(code.code, code.email) for code in codes],
+                         [('FRESH001', 'a@example.com'), ('FRESH002', 'b@example.com')])
+
+    def test_concurrently_inserted_code_is_retried(self):
+        real_bulk_create = VotingCode.objects.bulk_create
+
+        def racing_bulk_create(objs, **kwargs):
+            if objs[0].code == 'RACE0000':
+                VotingCode.objects.create(code='RACE0000', created_by=self.admin, email='other@example.com')
+            return real_bulk_create(objs, **kwargs)
+
+        draws = iter(['RACE0000', 'CALM0000'])
+        with mock.patch.object(VotingCode, 'random_code', side_effect=lambda length: next(draws)), \
+                mock.patch.object(VotingCode.objects, 'bulk_create', side_effect=racing_bulk_create):
+            codes = VotingCode.generate_codes_bulk(0, self.admin, emails=['me@example.com'])
+
+        self.assertEqual([(code.code, code.email) for code in codes], [('CALM0000', 'me@example.com')])
+
+    def test_command_writes_csv(self):
+        out = StringIO()
+        call_command('generate_codes', '--count', '3', '--max-uses', '2', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'code,max_uses,email')
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(all(line.endswith(',2,') for line in lines[1:]))
+
+
+@override_settings(VOTING_PROFILING_SAMPLE_RATE=1)
+class ProfilingTests(VotingTestCase):
+
+    def setUp(self):
+        super().setUp()
+        profiling.recorder.clear()
+
+    def test_records_queries_templates_and_size_per_view(self):
+        code = VotingCode.generate_code(self.admin, max_uses=1)
+        url = reverse('voting:vote_with_code', args=[code.code])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        step = profiling.recorder.samples[-1]
+        self.assertEqual(step.view, 'voting:vote_with_code')
+        self.assertEqual(step.queries, len(queries))
+        self.assertGreater(step.template_seconds, 0)
+        self.assertEqual(step.response_bytes, len(response.content))
+        self.assertGreater(step.seconds, step.template_seconds)
+
+        self.client.force_login(self.admin)
+        data = self.client.get(reverse('voting:profiling_summary')).json()
+        self.assertEqual(data['views']['voting:vote_with_code']['samples'], 2)
+        self.assertIn('request_seconds_p95', data['views']['voting:vote_with_code'])
+
+    @override_settings(ROOT_URLCONF=URLConf(async_views))
+    async def test_async_views_are_profiled(self):
+        code = await VotingCode.objects.acreate(code='PROFILE1', created_by=self.admin, max_uses=1)
+        await self.async_client.get(reverse('voting:vote_with_code', args=[code.code]))
+
+        step = profiling.recorder.samples[-1]
+        self.assertEqual(step.view, 'voting:vote_with_code')
+        self.assertGreater(step.queries, 0)
+        self.assertGreater(step.template_seconds, 0)
+
+    @override_settings(VOTING_PROFILING_SAMPLE_RATE=0)
+    def test_nothing_is_recorded_when_disabled(self):
+        self.client.get(reverse('voting:index'))
+        self.assertEqual(len(profiling.recorder.samples), 0)
+
+    @override_settings(VOTING_PROFILING_METRICS_TOKEN='s3cret')
+    def test_endpoints_are_protected(self):
+        self.client.get(reverse('voting:index'))
+        User.objects.create_user('voter', password='voter')
+        self.client.login(username='voter', password='voter')
+        self.assertEqual(self.client.get(reverse('voting:profiling_summary')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('voting:profiling_metrics')).status_code, 403)
+        response = self.client.get(reverse('voting:profiling_metrics'), headers={'Authorization': 'Bearer s3crét'})
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.get(reverse('voting:profiling_metrics'), headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('# TYPE voting_request_seconds summary', text)
+        self.assertIn('voting_request_seconds_count{view="voting:index"} 1', text)
+        self.assertIn('voting_db_queries{view="voting:index",quantile="0.95"}', text)
+
+
+class BenchmarkTests(VotingTestCase):
+
+    def test_sample_data_scales_to_any_size(self):
+        stdout = StringIO()
+        call_command('create_sample_data', persons=20, categories=9, codes=60, stdout=stdout)
+
+        # The fixture's persons are among the sample names, its categories are not.
+        self.assertEqual(Person.objects.count(), 20)
+        self.assertIn('Person 20', [person.name for person in get_catalog().persons])
+        self.assertEqual(len(get_catalog().categories), 3 + 9)
+        self.assertEqual(Person.objects.get(name='Person 20').last_name, '20')
+        self.assertEqual(VotingCode.objects.count(), 60)
+        self.assertNotIn('Generated codes:', stdout.getvalue())
+
+        call_command('create_sample_data', persons=20, categories=9, stdout=StringIO())
+        self.assertEqual(Person.objects.count(), 20)
+
+    def test_latency_summary_uses_nearest_rank(self):
+        summary = latency_summary(i / 1000 for i in range(1, 101))
+        self.assertEqual(summary, {'p50_ms': 50, 'p95_ms': 95, 'p99_ms': 99, 'mean_ms': 50.5})
+        self.assertIsNone(latency_summary([])['p99_ms'])
+
+
+class QueryPlanTests(VotingTestCase):
+    """The hot queries must be answered from an index, not by scanning the table."""
+
+    def query_plan(self, run):
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        sql = queries.captured_queries[-1]['sql']
+        with connection.cursor() as cursor:
+            return ' / '.join(row[-1] for row in cursor.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall())
+
+    def test_live_total_sums_the_counter_shards_from_the_index(self):
+        counters.increment(counters.BALLOTS)
+        plan = self.query_plan(lambda: counters.count(counters.BALLOTS))
+        self.assertIn('SEARCH voting_countershard USING INDEX voting_countershard_name_shard', plan)
+
+    def test_votes_per_person_are_grouped_from_the_index(self):
+        plan = self.query_plan(lambda: list(
+            Vote.objects.filter(category=self.categories[0]).values('person').annotate(count=Count('id')).order_by()
+        ))
+        self.assertIn('vote_category_person_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_statistics_of_a_category_come_sorted_from_the_index(self):
+        plan = self.query_plan(lambda: list(
+            VoteStatistics.objects.filter(category=self.categories[0]).order_by('-vote_count')
+        ))
+        self.assertIn('votestats_category_count_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_code_lookup_uses_the_unique_index(self):
+        VotingCode.objects.create(code='LOOKUP01', created_by=self.admin)
+        plan = self.query_plan(lambda: VotingCode.objects.get(code='LOOKUP01', is_active=True))
+        self.assertIn('USING INDEX sqlite_autoindex_voting_votingcode', plan)
+
+
+class SQLiteTuningTests(TransactionTestCase):
+
+    def test_profile_pragmas_are_applied_to_new_connections(self):
+        # Closing the in-memory test database would be a no-op, so open a second connection to it.
+        new_connection = connections.create_connection(DEFAULT_DB_ALIAS)
+        with override_settings(VOTING_SQLITE_PROFILE={'synchronous': 'NORMAL', 'temp_store': 'MEMORY'}):
+            new_connection.ensure_connection()
+        try:
+            with new_connection.cursor() as cursor:
+                self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)
+                self.assertEqual(cursor.execute('PRAGMA temp_store').fetchone()[0], 2)
+        finally:
+            new_connection.connection.close()
+
+    def test_write_transaction_begins_immediate(self):
+        with CaptureQueriesContext(connection) as queries:
+            with sqlite.write_transaction():
+                VotingCode.objects.count()
+            with transaction.atomic():
+                VotingCode.objects.count()
+        statements = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(statements[0], 'BEGIN IMMEDIATE')
+        self.assertIn('BEGIN', statements)
+        self.assertIsNone(connection.transaction_mode)
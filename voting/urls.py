@@ -1,17 +1,33 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'voting'
 
-urlpatterns = [
-    path('', views.index, name='index'),
-    path('vote/', views.vote, name='vote'),
-    path('vote/<code>/', views.vote, name='vote_with_code'),
-    path('success/', views.success, name='success'),
-    path('results/', views.results, name='results'),
 
-    # NEUER URL-PFAD
-    path('send-codes/', views.send_codes_to_list, name='send_codes_to_list'),
-    path('live-results/', views.live_results, name='live_results'),
-    path('api/live-results-data/', views.live_results_data, name='live_results_data'),
-]
\ No newline at end of file
+def build_urlpatterns(ballot_views):
+    """The app's URL patterns, with the hot endpoints taken from ``ballot_views`` (views or async_views)."""
+    return [
+        path('', views.index, name='index'),
+        path('vote/', ballot_views.vote, name='vote'),
+        path('vote/<code>/', ballot_views.vote, name='vote_with_code'),
+        path('success/', views.success, name='success'),
+        path('api/ballot/', ballot_views.submit_ballot, name='submit_ballot'),
+        path('results/', views.results, name='results'),
+        path('api/leaderboard/', views.leaderboard, name='leaderboard'),
+        path('export/<slug:table>.csv', views.export, name='export'),
+        path('export/<slug:table>.csv.gz', views.export, {'compressed': True}, name='export_gzip'),
+
+        # NEUER URL-PFAD
+        path('send-codes/', views.send_codes_to_list, name='send_codes_to_list'),
+        path('send-codes/progress/<job_id>/', views.send_codes_progress, name='send_codes_progress'),
+        path('live-results/', views.live_results, name='live_results'),
+        path('api/live-results-data/', ballot_views.live_results_data, name='live_results_data'),
+        path('api/live-results-stream/', views.live_results_stream, name='live_results_stream'),
+        path('api/profiling/', views.profiling_summary, name='profiling_summary'),
+        path('api/profiling/metrics/', views.profiling_metrics, name='profiling_metrics'),
+    ]
+
+
+# Under ASGI the hot endpoints can be served by their async-native versions.
+urlpatterns = build_urlpatterns(async_views if getattr(settings, 'VOTING_ASYNC_VIEWS', False) else views)
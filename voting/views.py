@@ -1,11 +1,26 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from .models import Person, Category, VotingCode, Vote, VotingSession, VoteStatistics
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_POST
+from .catalog import FRAGMENT_TIMEOUT, get_catalog
+from .code_lookup import Throttled, get_active_code
+from .drafts import get_storage as get_draft_storage, keep_draft_cookie
+from .export import TABLES as EXPORT_TABLES, csv_chunks, gzip_chunks
+from .leaderboard import leaderboard_data, public_leaderboard_data, top_results_by_category
+from .live import KEEPALIVE_INTERVAL, counter as live_counter, shared_total as live_shared_total
+from .models import Person, VotingCode, VotingSession
+from .profiling import prometheus_text, recorder as profiling_recorder
+import asyncio
+import json
+import secrets
+from datetime import datetime, timezone
 import re
 from django.conf import settings
-from .mailgun_utils import send_mailgun_template_email
+from .mail_dispatch import enqueue_invitations, job_progress
 
 
 
@@ -13,16 +28,67 @@ def index(request):
     return render(request, 'voting/index.html')
 
 
-def vote(request, code=None):
+# Messages of the vote wizard and the ballot endpoint, shared with async_views.py.
+INVALID_CODE_MESSAGE = 'Ungültiger Voting-Code.'
+CODE_USED_UP_MESSAGE = 'Dieser Code wurde bereits vollständig verwendet oder ist nicht mehr gültig.'
+ALREADY_VOTED_MESSAGE = 'Du hast bereits mit diesem Code abgestimmt.'
+COMMIT_FAILED_MESSAGE = 'Fehler beim Abschließen der Abstimmung.'
+THROTTLED_MESSAGE = 'Zu viele ungültige Codes. Bitte versuche es in ein paar Minuten erneut.'
+
+# Operations of a ballot in progress (VotingSession or draft); the async views call their a-prefixed versions.
+BALLOT_OPERATIONS = ('add_vote', 'advance_category', 'regress_category', 'complete_voting')
+
+
+def vote_operations(request):
+    """The I/O that vote_flow() and submit_ballot_flow() ask for, done synchronously."""
+    ip_address = get_client_ip(request)
+    operations = {
+        'lookup_code': lambda code: get_active_code(code, ip_address),
+        'catalog': get_catalog,
+        'has_voted': lambda voting_code: (
+            VotingSession.objects.filter(voting_code=voting_code, is_completed=True).exists()
+        ),
+        'load_draft': lambda voting_code: get_draft_storage().load(request, voting_code, ip_address),
+        'submit_ballot': lambda voting_code, votes: VotingSession.submit_ballot(
+            voting_code, votes, ip_address=ip_address, user_agent=request.META.get('HTTP_USER_AGENT', '')
+        ),
+    }
+    for name in BALLOT_OPERATIONS:
+        operations[name] = lambda ballot, *args, name=name: getattr(ballot, name)(*args)
+    return operations
+
+
+def run_flow(flow, operations):
+    """
+    Drive ``flow``, a generator that yields ``(operation, *args)`` for every
+    lookup or write it needs and returns the response. The result of the
+    operation is sent back; an unknown or throttled code is thrown in instead.
+    """
+    send, value = flow.send, None
+    while True:
+        try:
+            operation, *args = send(value)
+        except StopIteration as done:
+            return done.value
+        try:
+            send, value = flow.send, operations[operation](*args)
+        except (VotingCode.DoesNotExist, Throttled) as e:
+            send, value = flow.throw, e
+
+
+def vote_flow(request, code=None):
+    """The vote wizard, run by vote() here and in async_views.py (see run_flow)."""
     voting_code = None
     if code:
         try:
-            voting_code = VotingCode.objects.get(code=code, is_active=True)
-            if not voting_code.can_vote():
-                messages.error(request, 'Dieser Code wurde bereits vollständig verwendet oder ist nicht mehr gültig.')
-                return redirect('voting:index')
+            voting_code = yield ('lookup_code', code)
         except VotingCode.DoesNotExist:
-            messages.error(request, 'Ungültiger Voting-Code.')
+            messages.error(request, INVALID_CODE_MESSAGE)
+            return redirect('voting:index')
+        except Throttled:
+            return throttled_response(request)
+        if not voting_code.can_vote():
+            messages.error(request, CODE_USED_UP_MESSAGE)
             return redirect('voting:index')
 
     # Handle code submission from form
@@ -30,30 +96,40 @@ def vote(request, code=None):
         submitted_code = request.POST.get('voting_code', '').strip().upper()
         if submitted_code:
             try:
-                voting_code = VotingCode.objects.get(code=submitted_code, is_active=True)
-                if not voting_code.can_vote():
-                    messages.error(request,
-                                   'Dieser Code wurde bereits vollständig verwendet oder ist nicht mehr gültig.')
-                    return render(request, 'voting/vote.html')
-                return redirect('voting:vote_with_code', code=submitted_code)
+                voting_code = yield ('lookup_code', submitted_code)
             except VotingCode.DoesNotExist:
-                messages.error(request, 'Ungültiger Voting-Code.')
+                messages.error(request, INVALID_CODE_MESSAGE)
                 return render(request, 'voting/vote.html')
+            except Throttled:
+                return throttled_response(request)
+            if not voting_code.can_vote():
+                messages.error(request, CODE_USED_UP_MESSAGE)
+                return render(request, 'voting/vote.html')
+            return redirect('voting:vote_with_code', code=submitted_code)
 
     if not voting_code:
         return render(request, 'voting/vote.html')
 
-    session, created = VotingSession.objects.get_or_create(
-        voting_code=voting_code,
-        defaults={
-            'ip_address': get_client_ip(request),
-            'user_agent': request.META.get('HTTP_USER_AGENT', '')[:500]
-        }
-    )
+    catalog = yield ('catalog',)
+
+    if getattr(settings, 'VOTING_BALLOT_MODE', 'sequential') == 'single_page':
+        # Checked before the voter fills in the whole ballot, not only by submit_ballot.
+        if (yield ('has_voted', voting_code)):
+            messages.info(request, ALREADY_VOTED_MESSAGE)
+            return redirect('voting:success')
+        # The browser walks through the categories itself and posts the full ballot to submit_ballot.
+        return render(request, 'voting/vote_single_page.html', {
+            'voting_code': voting_code,
+            'catalog': catalog,
+        })
+
+    # The draft of the ballot, in the database, the cache or a cookie (see drafts.py).
+    session = yield ('load_draft', voting_code)
+    session.catalog = catalog
 
     # Check if session is already completed
     if session.is_completed:
-        messages.info(request, 'Du hast bereits mit diesem Code abgestimmt.')
+        messages.info(request, ALREADY_VOTED_MESSAGE)
         return redirect('voting:success')
 
     # Handle form submission (vote, go back)
@@ -61,7 +137,7 @@ def vote(request, code=None):
         action = request.POST.get('action')
 
         if action == 'previous':
-            session.regress_category()
+            yield ('regress_category', session)
             return redirect('voting:vote_with_code', code=voting_code.code)
 
         elif action == 'next':
@@ -72,31 +148,29 @@ def vote(request, code=None):
                 messages.error(request, 'Bitte wähle eine Person aus, um fortzufahren.')
             else:
                 try:
-                    person = Person.objects.get(id=person_id)
-                    session.add_vote(current_category_for_vote.id, person.id)
+                    person = catalog.get_person(person_id)
+                except Person.DoesNotExist:
+                    messages.error(request, 'Ungültige Personenauswahl.')
+                else:
+                    yield ('add_vote', session, current_category_for_vote.id, person.id)
 
                     if session.is_final_category():
-                        if session.complete_voting():
+                        if (yield ('complete_voting', session)):
                             return redirect('voting:success')
                         else:
-                            messages.error(request, 'Fehler beim Abschließen der Abstimmung.')
+                            messages.error(request, COMMIT_FAILED_MESSAGE)
                     else:
-                        session.advance_category()
+                        yield ('advance_category', session)
                         return redirect('voting:vote_with_code', code=voting_code.code)
 
-                except Person.DoesNotExist:
-                    messages.error(request, 'Ungültige Personenauswahl.')
-
     current_category = session.get_current_category()
     if not current_category:
-        if session.complete_voting():
+        if (yield ('complete_voting', session)):
             return redirect('voting:success')
         else:
-            messages.error(request, 'Fehler beim Abschließen der Abstimmung.')
+            messages.error(request, COMMIT_FAILED_MESSAGE)
             return redirect('voting:index')
 
-    persons = Person.objects.all().order_by('first_name', 'last_name')
-
     all_categories = session.get_categories()
 
     progress_percentage = ((session.current_category_index) / len(all_categories)) * 100 if all_categories else 0
@@ -107,18 +181,68 @@ def vote(request, code=None):
         'voting_code': voting_code,
         'session': session,
         'current_category': current_category,
-        'persons': persons,
+        'person_options': catalog.render_person_options(selected_person_id),
         'all_categories': all_categories,
         'progress_percentage': progress_percentage,
         'current_step': session.current_category_index + 1,
         'total_steps': len(all_categories),
         'is_final_category': session.is_final_category(),
         'selected_person_id': selected_person_id,
+        'catalog': catalog,
+        'fragment_timeout': FRAGMENT_TIMEOUT,
     }
 
     return render(request, 'voting/vote_sequential.html', context)
 
 
+@keep_draft_cookie
+def vote(request, code=None):
+    return run_flow(vote_flow(request, code), vote_operations(request))
+
+
+def ballot_error(message, status):
+    return JsonResponse({'ok': False, 'error': message}, status=status)
+
+
+def submit_ballot_flow(request):
+    """The ballot endpoint, run by submit_ballot() here and in async_views.py (see run_flow)."""
+    try:
+        payload = json.loads(request.body)
+        code = str(payload['code']).strip().upper()
+        votes = {str(category_id): int(person_id) for category_id, person_id in payload['votes'].items()}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return ballot_error('Ungültige Anfrage.', 400)
+
+    try:
+        voting_code = yield ('lookup_code', code)
+    except VotingCode.DoesNotExist:
+        return ballot_error(INVALID_CODE_MESSAGE, 404)
+    except Throttled:
+        return ballot_error(THROTTLED_MESSAGE, 429)
+    if not voting_code.can_vote():
+        return ballot_error(CODE_USED_UP_MESSAGE, 409)
+
+    catalog = yield ('catalog',)
+    if (set(votes) != {str(category.id) for category in catalog.categories}
+            or any(person_id not in catalog.persons_by_id for person_id in votes.values())):
+        return ballot_error('Bitte wähle in jeder Kategorie eine Person aus.', 400)
+
+    if not (yield ('submit_ballot', voting_code, votes)):
+        return ballot_error(COMMIT_FAILED_MESSAGE, 409)
+
+    return JsonResponse({'ok': True, 'redirect': reverse('voting:success')})
+
+
+@require_POST
+def submit_ballot(request):
+    """
+    JSON endpoint of the single-page ballot. Expects
+    {"code": "...", "votes": {"<category_id>": <person_id>, ...}} and commits the
+    whole ballot atomically.
+    """
+    return run_flow(submit_ballot_flow(request), vote_operations(request))
+
+
 def success(request):
     return render(request, 'voting/success.html')
 
@@ -129,18 +253,8 @@ def results(request):
         messages.error(request, 'Zugriff verweigert. Nur für Administratoren.')
         return redirect('voting:index')
 
-    categories = Category.objects.filter(is_active=True).order_by('title')
-    results_data = {}
-
-    for category in categories:
-        # Get top 5 results for this category
-        top_results = VoteStatistics.objects.filter(category=category).order_by('-vote_count', 'person__first_name')[:5]
-        total_votes = Vote.objects.filter(category=category).count()
-
-        results_data[category] = {
-            'top_results': top_results,
-            'total_votes': total_votes
-        }
+    # One query for every category: ranked top 5 with persons and category totals.
+    results_data = top_results_by_category(limit=5)
 
     context = {
         'results': results_data
@@ -149,13 +263,87 @@ def results(request):
     return render(request, 'voting/results.html', context)
 
 
-def get_client_ip(request):
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
+@login_required
+def export(request, table, compressed=False):
+    """Streams the votes or results table as CSV (gzip-compressed for .csv.gz)."""
+    if not request.user.is_staff:
+        messages.error(request, 'Zugriff verweigert. Nur für Administratoren.')
+        return redirect('voting:index')
+    if table not in EXPORT_TABLES:
+        raise Http404('Unbekannte Tabelle.')
+
+    filename = f'{table}.csv'
+    if compressed:
+        response = StreamingHttpResponse(gzip_chunks(csv_chunks(table)), content_type='application/gzip')
+        filename += '.gz'
     else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+        response = StreamingHttpResponse(csv_chunks(table), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def leaderboard(request):
+    """
+    Top-N results per category as JSON. Staff get live counts; everyone else only
+    gets the delayed, count-free public board if VOTING_PUBLIC_LEADERBOARD is enabled.
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', 5)), 1), 50)
+    except ValueError:
+        limit = 5
+
+    if request.user.is_staff:
+        return JsonResponse(leaderboard_data(limit))
+
+    if not getattr(settings, 'VOTING_PUBLIC_LEADERBOARD', False):
+        return JsonResponse({'error': 'Zugriff verweigert. Nur für Administratoren.'}, status=403)
+
+    delay = getattr(settings, 'VOTING_PUBLIC_LEADERBOARD_DELAY', 300)
+    return JsonResponse(public_leaderboard_data(limit, delay))
+
+
+@login_required
+def profiling_summary(request):
+    """p50/p95 per view of the requests sampled by ProfilingMiddleware in this process."""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Zugriff verweigert. Nur für Administratoren.'}, status=403)
+
+    return JsonResponse({
+        'sample_rate': getattr(settings, 'VOTING_PROFILING_SAMPLE_RATE', 0),
+        'buffer_size': profiling_recorder.samples.maxlen,
+        'views': profiling_recorder.summary(),
+    })
+
+
+def profiling_metrics(request):
+    """The same numbers for Prometheus, for staff or a scraper sending VOTING_PROFILING_METRICS_TOKEN."""
+    token = getattr(settings, 'VOTING_PROFILING_METRICS_TOKEN', None)
+    authorized = request.user.is_staff or (
+        # Compared as bytes: compare_digest() rejects str with non-ASCII characters with a TypeError.
+        token and secrets.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+    )
+    if not authorized:
+        return HttpResponse('Zugriff verweigert.', status=403, content_type='text/plain; charset=utf-8')
+    return HttpResponse(prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def throttled_response(request):
+    # Unknown codes from this IP have used up its attempts (see code_lookup.py).
+    messages.error(request, THROTTLED_MESSAGE)
+    return render(request, 'voting/vote.html', status=429)
+
+
+def get_client_ip(request):
+    """
+    The address of the client. X-Forwarded-For can be sent by anyone, so it is
+    only read behind VOTING_TRUSTED_PROXIES reverse proxies, taking the address
+    the outermost of them added.
+    """
+    trusted_proxies = getattr(settings, 'VOTING_TRUSTED_PROXIES', 0)
+    forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+    if trusted_proxies and forwarded:
+        return forwarded[-min(trusted_proxies, len(forwarded))]
+    return request.META.get('REMOTE_ADDR')
 
 
 # NEUE VIEW
@@ -175,49 +363,46 @@ def send_codes_to_list(request):
             messages.error(request, 'Bitte geben Sie mindestens eine E-Mail-Adresse ein.')
             return redirect('voting:send_codes_to_list')
 
-        sent_count = 0
-        failed_emails = []
+        try:
+            # One unique code with max_uses=1 per address, created in bulk
+            voting_codes = VotingCode.generate_codes_bulk(len(email_list), request.user, max_uses=1, emails=email_list)
+        except Exception:
+            messages.error(request, 'Die Voting-Codes konnten nicht erzeugt werden.')
+            return redirect('voting:send_codes_to_list')
 
-        for email in email_list:
-            try:
-                # Generate a unique code with max_uses=1
-                voting_code = VotingCode.generate_code(
-                    user=request.user,
-                    max_uses=1,
-                    email=email
-                )
-
-
-                vote_url = f"{settings.VOTE_BASE_URL}{voting_code.code}"
-
-
-                template_variables = {
-                    'vote_url': vote_url,
-                    'voting_code': voting_code.code,
-                }
-
-                subject = 'Deine Einladung zur Klassenabstimmung'
-                if send_mailgun_template_email(
-                    to_email=email,
-                    subject=subject,
-                    template_name=settings.MAILGUN_TEMPLATE_NAME,
-                    template_variables=template_variables
-                ):
-                    sent_count += 1
-                else:
-                    failed_emails.append(email)
+        invitations = [
+            (voting_code, {
+                'vote_url': f"{settings.VOTE_BASE_URL}{voting_code.code}",
+                'voting_code': voting_code.code,
+            })
+            for voting_code in voting_codes
+        ]
+
+        # The mail worker (manage.py run_mail_worker) sends them, the page polls the outbox for progress.
+        job_id = enqueue_invitations(
+            invitations,
+            subject='Deine Einladung zur Klassenabstimmung',
+            template_name=settings.MAILGUN_TEMPLATE_NAME
+        )
+
+        messages.success(request, f'{len(invitations)} Einladungen wurden in die Warteschlange gestellt.')
+
+        return redirect(f"{reverse('voting:send_codes_to_list')}?job={job_id}")
+
+    job = job_progress(request.GET.get('job', ''))
+    return render(request, 'voting/admin_send_codes.html', {'job': job})
 
-            except Exception as e:
-                failed_emails.append(email)
 
-        if sent_count > 0:
-            messages.success(request, f'{sent_count} Einladungen wurden erfolgreich versendet.')
-        if failed_emails:
-            messages.error(request, f'Konnte keine E-Mails an folgende Adressen senden: {", ".join(failed_emails)}')
+@login_required
+def send_codes_progress(request, job_id):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Zugriff verweigert. Nur für Administratoren.'}, status=403)
 
-        return redirect('voting:send_codes_to_list')
+    progress = job_progress(job_id)
+    if progress is None:
+        return JsonResponse({'error': 'Unbekannter Versandauftrag.'}, status=404)
+    return JsonResponse(progress)
 
-    return render(request, 'voting/admin_send_codes.html')
 
 
 
@@ -225,15 +410,71 @@ def live_results(request):
     """
     Zeigt die öffentliche Live-Ergebnisseite an, die sich automatisch aktualisiert.
     """
-    return render(request, 'voting/live_results.html')
+    return render(request, 'voting/live_results.html', {'live_stream': live_stream_available(request)})
+
+
+def live_stream_available(request):
+    """
+    Whether the page may use the Server-Sent Events stream. Under WSGI Django
+    buffers an async stream completely before sending it, i.e. never, so the
+    stream needs VOTING_LIVE_STREAM and an ASGI server.
+    """
+    return getattr(settings, 'VOTING_LIVE_STREAM', False) and isinstance(request, ASGIRequest)
 
 
+def _live_total_etag(request):
+    return f'"{live_shared_total.get()[0]}"'
+
+
+def _live_total_last_modified(request):
+    return datetime.fromtimestamp(live_shared_total.get()[1], tz=timezone.utc)
+
+
+@condition(etag_func=_live_total_etag, last_modified_func=_live_total_last_modified)
 def live_results_data(request):
 
-    completed_voters = VotingSession.objects.filter(is_completed=True).count()
+    completed_voters, last_modified = live_shared_total.get()
 
     data = {
         'total_votes': completed_voters
     }
 
-    return JsonResponse(data)
\ No newline at end of file
+    response = JsonResponse(data)
+    # Let every poll revalidate, which mostly ends in a 304 without a body.
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+async def live_results_stream(request):
+    """
+    Server-Sent Events stream of the completed-ballot total. Pushes a new value
+    whenever a ballot is completed; needs an ASGI server (see voting_system/asgi.py).
+    Without one it answers 204, which tells EventSource not to reconnect.
+    """
+    if not live_stream_available(request):
+        return HttpResponse(status=204)
+
+    async def events():
+        subscription = live_counter.broadcaster.subscribe()
+        _loop, queue = subscription
+        try:
+            yield _live_event(await live_counter.aget())
+            while True:
+                try:
+                    total = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    await live_counter.aresync()
+                    yield ': keepalive\n\n'
+                    continue
+                yield _live_event(total)
+        finally:
+            live_counter.broadcaster.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _live_event(total):
+    return f'data: {json.dumps({"total_votes": total})}\n\n'
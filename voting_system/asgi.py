@@ -3,6 +3,10 @@ ASGI config for voting_system project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serving the project through ASGI (e.g. ``uvicorn voting_system.asgi:application``)
+enables the pushed live counter at /api/live-results-stream/; under WSGI the
+live page falls back to polling.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -30,9 +30,31 @@ MAILGUN_DOMAIN = 'example.com' # set your domain here, e.g. 'example.com' or 'ex
 MAILGUN_API_URL = f'https://api.eu.mailgun.net/v3/{MAILGUN_DOMAIN}/messages' # the Api endpoint (no need to edit this unless you use a different region)
 MAILGUN_SENDER_EMAIL = f'Example <no-reply@{MAILGUN_DOMAIN}>' # The Name and email address that will appear as the sender in the emails
 MAILGUN_TEMPLATE_NAME = 'Example' # Name of your Mailgun template
+MAILGUN_TIMEOUT = 10 # Seconds to wait for the Mailgun API per request
+MAILGUN_MAX_WORKERS = 8 # Requests sent in parallel by each mail worker
+MAILGUN_RATE_LIMIT = 10 # Maximum API requests per second
+MAILGUN_MAX_RETRIES = 3 # Retries on timeouts, 429 and 5xx responses (with exponential backoff)
+MAILGUN_BATCH_SIZE = 1000 # Recipients per API request (Mailgun allows up to 1000), 1 sends every email on its own
+MAILGUN_OUTBOX_MAX_ATTEMPTS = 5 # Rounds a worker tries an email before marking it as failed
+MAILGUN_OUTBOX_CLAIM_TIMEOUT = 600 # Seconds after which emails claimed by a crashed worker are sent again (a round ends within half of it)
 
 VOTE_BASE_URL = 'https://url-where-this-page-is-hosted.com'
 
+# 'sequential': one request per category, the draft is kept by VOTING_DRAFT_STORAGE.
+# 'single_page': the whole ballot is filled in the browser and submitted at once.
+VOTING_BALLOT_MODE = 'sequential'
+
+# Where the sequential wizard keeps unfinished ballots (see voting/drafts.py):
+# 'db' saves a VotingSession on every click, 'cache' uses the Django cache and
+# 'cookie' a signed cookie. With the last two only the finished ballot is written.
+VOTING_DRAFT_STORAGE = 'db'
+VOTING_DRAFT_TIMEOUT = 60 * 60 * 24 # Seconds an unfinished 'cache' or 'cookie' draft is kept
+
+# Public top-N board at /api/leaderboard/ (staff always get the live version).
+# The public board hides vote counts and lags VOTING_PUBLIC_LEADERBOARD_DELAY seconds behind.
+VOTING_PUBLIC_LEADERBOARD = False
+VOTING_PUBLIC_LEADERBOARD_DELAY = 300
+
 CSRF_TRUSTED_ORIGINS = [
     "https://url-where-this-page-is-hosted.com",
 ]
@@ -43,12 +65,17 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
-    'django.contrib.staticfiles',
+    # Before staticfiles, so its collectstatic (which also fetches the vendor files) is used.
     'voting',
+    'django.contrib.staticfiles',
 ]
 
 MIDDLEWARE = [
+    # Does nothing unless VOTING_PROFILING_SAMPLE_RATE is set.
+    'voting.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Answers /static/ requests before sessions and the rest are touched.
+    'voting.staticfiles.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -61,7 +88,8 @@ ROOT_URLCONF = 'voting_system.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # The Django backend, plus render timing for the profiling middleware.
+        'BACKEND': 'voting.profiling.ProfilingDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -87,6 +115,59 @@ DATABASES = {
     }
 }
 
+# PRAGMAs applied to every SQLite connection (see voting/sqlite.py):
+# 'production' enables WAL, busy_timeout, synchronous=NORMAL and in-memory caches,
+# None keeps SQLite's defaults. A dict of PRAGMA names and values works as well.
+VOTING_SQLITE_PROFILE = 'production'
+
+# Rows the ballot counter is striped over (see voting/counters.py). More rows let
+# more ballots commit at the same time without waiting for each other.
+VOTING_COUNTER_SHARDS = 8
+
+# Serve the vote wizard, ballot submit and live total from their async versions
+# (voting/async_views.py). Only worth it under an ASGI server such as uvicorn.
+VOTING_ASYNC_VIEWS = False
+# Push the live counter over Server-Sent Events instead of polling. Only takes
+# effect under an ASGI server; under WSGI the page always polls.
+VOTING_LIVE_STREAM = False
+
+# Request profiling (see voting/profiling.py): share of requests to measure, 0 turns
+# the middleware off. Results per view at /api/profiling/ (JSON, staff) and
+# /api/profiling/metrics/ (Prometheus, staff or "Authorization: Bearer <token>").
+VOTING_PROFILING_SAMPLE_RATE = 0
+VOTING_PROFILING_BUFFER_SIZE = 1000 # Latest sampled requests kept per process
+VOTING_PROFILING_SLOW_REQUEST = 1.0 # Sampled requests slower than this many seconds are logged, None disables
+VOTING_PROFILING_METRICS_TOKEN = None # Token for the Prometheus scraper
+
+# Widths in pixels of the resized copies of category images (see voting/images.py).
+# Run `python manage.py build_image_derivatives --force` after changing them.
+VOTING_IMAGE_WIDTHS = [320, 640, 1280]
+
+# Unknown voting codes from an IP without attempts left are rejected from an in-memory
+# Bloom filter of all active codes, without a database query (see voting/code_lookup.py).
+VOTING_CODE_FILTER = True
+# Each unknown code costs the client IP one of VOTING_CODE_THROTTLE_BURST attempts, which
+# refill at VOTING_CODE_THROTTLE_RATE per minute. An IP without attempts left gets HTTP 429
+# for unknown codes; valid codes always work. Set either to None to disable the throttle.
+VOTING_CODE_THROTTLE_BURST = 20
+VOTING_CODE_THROTTLE_RATE = 10
+# Number of reverse proxies in front of Django that append to X-Forwarded-For (e.g. 1 for
+# Nginx). With 0 the header is ignored and the client IP is the connecting address.
+VOTING_TRUSTED_PROXIES = 0
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# The voting app keeps version keys here (e.g. for the category/person catalog).
+# When running more than one worker process, switch to a shared backend such as
+# Redis or Memcached so all workers see the same versions.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -125,6 +206,21 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # collectstatic writes hashed names plus .gz/.br copies (see voting/staticfiles.py).
+    'staticfiles': {
+        'BACKEND': 'voting.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# StaticFilesMiddleware serves STATIC_ROOT itself, precompressed copies first.
+# Set VOTING_SERVE_STATIC = False when a web server in front serves /static/.
+VOTING_SERVE_STATIC = True
+VOTING_STATIC_MAX_AGE = 60 * 60 * 24 * 365 # Seconds browsers may cache files with a hashed name
+
 # Media files (User uploaded content)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -133,3 +229,31 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Logging
+# https://docs.djangoproject.com/en/5.2/topics/logging/
+# Mail worker errors and slow requests found by the profiling middleware go to the
+# console. Set the 'voting' level to 'INFO' to also log every email sent.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '{asctime} {levelname} {name}: {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'voting': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}